@@ -9,9 +9,14 @@ const apiClient = axios.create({
   baseURL: API_URL,
   headers: {
     'Content-Type': 'application/json'
-  }
+  },
+  // 304 表示数据未变化，由响应拦截器返回本地缓存的数据
+  validateStatus: (status) => (status >= 200 && status < 300) || status === 304
 })
 
+// GET 响应的 ETag 缓存：再次请求时带 If-None-Match，服务器数据未变化时只返回 304
+const etagCache = new Map<string, { etag: string; data: any }>()
+
 // 请求拦截器 - 添加认证token
 apiClient.interceptors.request.use(
   (config) => {
@@ -19,6 +24,12 @@ apiClient.interceptors.request.use(
     if (authStore.token) {
       config.headers.Authorization = `Bearer ${authStore.token}`
     }
+    if (!config.method || config.method.toLowerCase() === 'get') {
+      const cached = etagCache.get(apiClient.getUri(config))
+      if (cached) {
+        config.headers['If-None-Match'] = cached.etag
+      }
+    }
     return config
   },
   (error) => {
@@ -29,6 +40,18 @@ apiClient.interceptors.request.use(
 // 响应拦截器 - 处理token过期
 apiClient.interceptors.response.use(
   (response) => {
+    const method = response.config.method?.toLowerCase() ?? 'get'
+    if (method === 'get') {
+      const key = apiClient.getUri(response.config)
+      const cached = etagCache.get(key)
+      if (response.status === 304 && cached) {
+        return { ...response, status: 200, data: cached.data }
+      }
+      const etag = response.headers['etag']
+      if (etag) {
+        etagCache.set(key, { etag, data: response.data })
+      }
+    }
     return response
   },
   async (error) => {
@@ -54,29 +77,122 @@ apiClient.interceptors.response.use(
   }
 )
 
+// 销售分析的时间窗口（YYYY-MM-DD），include_archive=1 时合并已归档的历史数据，
+// approx=1 时由抽样表估计并返回误差（不能与 include_archive 同时使用）
+export interface SalesWindowParams {
+  start_date?: string
+  end_date?: string
+  include_archive?: number
+  approx?: number
+}
+
 // 数据分析API
 export const analysisApi = {
   // 各地区销售数据
-  getRegionSales() {
-    return apiClient.get('/analysis/region-sales/')
+  getRegionSales(params: SalesWindowParams = {}) {
+    return apiClient.get('/analysis/region-sales/', { params })
   },
   
   // 服装销售类型占比
-  getClothingTypeSales() {
-    return apiClient.get('/analysis/clothing-type-sales/')
+  getClothingTypeSales(params: SalesWindowParams = {}) {
+    return apiClient.get('/analysis/clothing-type-sales/', { params })
   },
   
   // 服装价格区间销量
-  getPriceRangeSales() {
-    return apiClient.get('/analysis/price-range-sales/')
+  getPriceRangeSales(params: SalesWindowParams = {}) {
+    return apiClient.get('/analysis/price-range-sales/', { params })
   },
   
   // 服装评价分布
-  getRatingDistribution() {
-    return apiClient.get('/analysis/rating-distribution/')
+  getRatingDistribution(params: { start_date?: string; end_date?: string } = {}) {
+    return apiClient.get('/analysis/rating-distribution/', { params })
+  },
+  
+  // 经常一起购买的商品
+  getBoughtTogether(clothingId: number) {
+    return apiClient.get(`/analysis/bought-together/${clothingId}/`)
+  },
+  
+  // 客户RFM分层
+  getRFM(segment?: string) {
+    return apiClient.get('/analysis/rfm/', { params: { segment } })
+  },
+  
+  // 同期群留存
+  getCohorts() {
+    return apiClient.get('/analysis/cohorts/')
+  },
+  
+  // 评价关键词统计与检索
+  getRatingKeywords(params: { clothing_id?: number; q?: string; limit?: number } = {}) {
+    return apiClient.get('/analysis/rating-keywords/', { params })
+  },
+  
+  // 销售异常
+  getAnomalies(params: { days?: number; region?: number; clothing_type?: number; direction?: string } = {}) {
+    return apiClient.get('/analysis/anomalies/', { params })
   }
 }
 
+// 实时销售增量：{ 维度: { 名称: [销售额, 订单数] } }
+export interface SalesDelta {
+  region?: Record<string, [number, number]>
+  clothing_type?: Record<string, [number, number]>
+  price_range?: Record<string, [number, number]>
+}
+
+// 实时推送API（Server-Sent Events）
+export const liveApi = {
+  // 订阅实时销售增量，组件卸载时调用返回对象的 close()
+  subscribeSales(onDelta: (delta: SalesDelta) => void) {
+    const authStore = useAuthStore()
+    let source: EventSource | null = null
+    let closed = false
+    
+    const open = () => {
+      // EventSource 无法设置请求头，access token 通过查询参数传递
+      source = new EventSource(`${API_URL}/analysis/live/?token=${encodeURIComponent(authStore.token || '')}`)
+      source.addEventListener('sales', (event) => onDelta(JSON.parse((event as MessageEvent).data)))
+      source.onerror = async () => {
+        // 认证失败时连接被关闭，刷新token后重新订阅；其他断线由 EventSource 自动重连
+        if (!closed && source?.readyState === EventSource.CLOSED && await authStore.refreshAccessToken()) {
+          open()
+        }
+      }
+    }
+    open()
+    
+    return {
+      close() {
+        closed = true
+        source?.close()
+      }
+    }
+  }
+}
+
+// 把增量原地累加到图表数据行上，新出现的名称追加为新行；返回是否有变化
+export function applySalesDelta(rows: any[], delta: Record<string, [number, number]> | undefined, nameKey: string) {
+  if (!delta) return false
+  for (const [name, [amount, count]] of Object.entries(delta)) {
+    let row = rows.find(item => item[nameKey] === name)
+    if (!row) {
+      row = { [nameKey]: name, total_sales: 0, order_count: 0 }
+      rows.push(row)
+    }
+    row.total_sales = Math.round((Number(row.total_sales) + amount) * 100) / 100
+    row.order_count += count
+  }
+  // 带占比的数据（服装类型）同步重算占比
+  if (rows.length && 'percentage' in rows[0]) {
+    const total = rows.reduce((sum, item) => sum + Number(item.total_sales), 0)
+    rows.forEach(item => {
+      item.percentage = total ? Math.round(Number(item.total_sales) / total * 10000) / 100 : 0
+    })
+  }
+  return true
+}
+
 // 预测API
 export const forecastApi = {
   // 销量预测
@@ -87,6 +203,11 @@ export const forecastApi = {
   // 价格预测
   getPriceForecast() {
     return apiClient.get('/forecast/price/')
+  },
+  
+  // 商品缺货预测
+  getStockoutForecast(limit = 50) {
+    return apiClient.get('/forecast/stockouts/', { params: { limit } })
   }
 }
 
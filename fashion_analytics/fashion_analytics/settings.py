@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 from pathlib import Path
 import os
 from datetime import timedelta
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -49,6 +50,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "sales_analysis.middleware.CompressionMiddleware",  # 按 Accept-Encoding 压缩响应（br / gzip）
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",  # CORS中间件
     "django.middleware.common.CommonMiddleware",
@@ -93,6 +95,9 @@ DATABASES = {
     }
 }
 
+# 订单与订单条目按地区分片：写入路由到各地区的数据库，分析接口并发查询所有分片后合并
+DATABASE_ROUTERS = ['sales_analysis.sharding.RegionShardRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -129,6 +134,65 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# 商品图片缩略图：{名称: 最长边像素}、输出格式（webp / jpeg）与编码质量，
+# 上传后由 THUMBNAIL_WORKERS 个后台线程生成，为 0 时在保存提交后同步生成
+THUMBNAIL_SIZES = {'small': 240, 'medium': 640}
+THUMBNAIL_FORMATS = ('webp', 'jpeg')
+THUMBNAIL_QUALITY = 82
+THUMBNAIL_WORKERS = 2
+
+# 离线分析数据目录（关联规则矩阵等由管理命令生成的文件）
+ANALYTICS_DATA_DIR = os.path.join(BASE_DIR, 'analytics_data')
+
+# 缓存：分析接口的响应缓存使用单独的 analytics 缓存，由 warm_analytics 命令在多个进程中预热，
+# 需使用进程间共享的后端；缓存键包含表版本号，数据变化后旧缓存项不再被读取，到期后清除
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'analytics': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(ANALYTICS_DATA_DIR, 'cache'),
+        'TIMEOUT': 24 * 3600,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# 相同分析请求合并计算时，后到请求等待先到请求的最长秒数，超时后自行计算
+SINGLE_FLIGHT_TIMEOUT = 30
+
+# 重型分析接口的准入控制：每个预算周期（秒）内每个用户与全局可用的成本单位、
+# 每个工作进程同时执行的重型计算数，以及等待计算槽位的最长秒数
+ANALYSIS_COST_BUDGETS = {'user': 120, 'global': 600}
+ANALYSIS_COST_PERIOD = 60
+ANALYSIS_MAX_CONCURRENT = 2
+ANALYSIS_SLOT_WAIT_SECONDS = 5
+
+# 各分析接口的聚合后端（按 URL 名称）：'orm'（默认）或 'duckdb'（需安装 duckdb，在按水位增量导出的 Parquet 上聚合），
+# 可选接口为 region-sales、clothing-type-sales、price-range-sales、rating-distribution、sales-forecast
+ANALYTICS_BACKENDS = {}
+
+# 按地区分片：{地区代码: DATABASES 中的别名}，未列出的地区与分片前的历史订单保存在默认库，为空时不分片。
+# 每个分片需执行 migrate --database=<别名> 并用 sync_shards 复制用户、地区、商品等参照表
+SALES_SHARDS = {}
+# 分析接口并发查询分片的线程数
+SALES_SHARD_WORKERS = 8
+
+# 近似分析（approx=1）的订单与条目抽样比例，修改后需执行 rebuild_sales_samples
+ANALYTICS_SAMPLE_RATE = 0.01
+
+# 保留在在线表中的最近月数，更早的订单可由 archive_sales 归档为 Parquet
+SALES_HOT_MONTHS = 12
+
+# 订单派生数据（库存扣减、销售速度、异常检测等）的处理方式：
+# 'inline' 在写订单的事务中同步处理；'outbox' 只写入发件箱，由 process_outbox 命令异步批量处理
+ORDER_EVENTS_MODE = os.environ.get('ORDER_EVENTS_MODE', 'inline')
+
+# 实时销售推送（SSE）：每个连接每秒最多推送的批数、保活间隔与单个连接的最长时间（秒）
+LIVE_FEED_MAX_BATCHES_PER_SECOND = 2
+LIVE_FEED_HEARTBEAT_SECONDS = 15
+LIVE_FEED_MAX_SECONDS = 300
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -144,10 +208,21 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'sales_analysis.pagination.PageSizePagination',
     'PAGE_SIZE': 10
 }
 
+# 安装 msgpack 时支持 Accept: application/msgpack
+try:
+    import msgpack  # noqa: F401
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('sales_analysis.renderers.MessagePackRenderer')
+except ImportError:
+    pass
+
 # JWT设置
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
@@ -160,3 +235,6 @@ SIMPLE_JWT = {
 # CORS设置
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
+# 前端需要读取 ETag 并在条件请求中发送 If-None-Match
+CORS_ALLOW_HEADERS = list(default_headers) + ['if-none-match', 'if-modified-since']
+CORS_EXPOSE_HEADERS = ['ETag', 'Last-Modified']
@@ -0,0 +1,127 @@
+"""
+重型分析接口的准入控制。
+
+全历史的聚合、预测模型拟合等请求按查询参数估算成本（视图的 cost 为基础成本，
+时间窗口越长成本越高，approx=1 按最低成本计），每次实际计算前从用户与全局的预算中扣减。
+预算用量保存在数据库（CostBudgetUsage）中，各进程共享，增减都是原子的 UPDATE；
+每个工作进程同时执行的重型计算数也有上限。超出时返回 429 并在 Retry-After 中给出等待秒数，
+保证基础数据接口不被少数重型请求拖垮。命中响应缓存或 304 的请求不经过这里，不消耗预算。
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.exceptions import Throttled
+
+from .filters import date_window, is_true
+from .models import CostBudgetUsage
+
+# 不限时间窗口时的成本倍数，相当于 12 个月
+ALL_TIME_FACTOR = 12
+
+_slots = None
+_slots_lock = threading.Lock()
+
+
+def _worker_slots():
+    global _slots
+    with _slots_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(settings.ANALYSIS_MAX_CONCURRENT)
+        return _slots
+
+
+def estimate_cost(view, request):
+    """
+    按视图的基础成本与查询参数估算一次计算的成本。
+    cost_by_window 的视图按时间窗口计：全部历史按12个月计，时间窗口每30天计1，include_archive=1 加倍
+    """
+    params = request.query_params
+    if is_true(params.get('approx')):
+        return 1
+    cost = getattr(view, 'cost', 1)
+    if getattr(view, 'cost_by_window', False):
+        try:
+            start, end = date_window(params)
+        except ValueError:
+            # 参数错误的请求由视图返回 400
+            return 1
+        if start is None:
+            factor = ALL_TIME_FACTOR
+        else:
+            end = end or timezone.now()
+            factor = min(max(math.ceil((end - start).days / 30), 1), ALL_TIME_FACTOR)
+        cost *= factor
+        if is_true(params.get('include_archive')):
+            cost *= 2
+    return cost
+
+
+def _charge(scope, budget, cost):
+    """
+    在当前预算周期内扣减成本，返回 (预算周期, 需要等待的秒数)：
+    超出预算时退回并给出等待秒数，否则等待秒数为 None，之后按返回的周期退回
+    """
+    period = settings.ANALYSIS_COST_PERIOD
+    now = time.time()
+    window = int(now // period)
+    usage = CostBudgetUsage.objects.filter(scope=scope, window=window)
+    with transaction.atomic():
+        # UPDATE 锁住该行直到事务结束，读回的用量只包含本次及之前的扣减
+        if not usage.update(used=F('used') + cost):
+            # 新的预算周期：清除该范围过期的周期，并发建行时忽略冲突
+            CostBudgetUsage.objects.filter(scope=scope, window__lt=window).delete()
+            CostBudgetUsage.objects.bulk_create(
+                [CostBudgetUsage(scope=scope, window=window)], ignore_conflicts=True
+            )
+            usage.update(used=F('used') + cost)
+        used = usage.values_list('used', flat=True).get()
+        # 超出预算时退回；单次成本超过整个预算的计算在空闲的周期内仍可执行，避免永远被拒绝
+        if used > budget and used > cost:
+            usage.update(used=F('used') - cost)
+            return window, math.ceil((window + 1) * period - now)
+    return window, None
+
+
+def _refund(scope, window, cost):
+    """退回扣减在预算周期 window 中的成本；退回时可能已进入下一个周期，不能按当前时间重新计算"""
+    CostBudgetUsage.objects.filter(scope=scope, window=window).update(used=F('used') - cost)
+
+
+@contextmanager
+def admission(view, request):
+    """
+    重型计算的准入：扣减用户与全局预算并占用本进程的一个计算槽位，
+    预算不足或等待槽位超时时抛出 Throttled（429 + Retry-After）。
+    """
+    if getattr(request, 'analytics_warmup', False):
+        # warm_analytics 的预热请求由进程池大小控制并发
+        yield
+        return
+    
+    cost = estimate_cost(view, request)
+    budgets = settings.ANALYSIS_COST_BUDGETS
+    charged = []
+    for scope, budget in ((f'user:{request.user.pk}', budgets['user']), ('global', budgets['global'])):
+        window, wait = _charge(scope, budget, cost)
+        if wait is not None:
+            for charged_scope, charged_window in charged:
+                _refund(charged_scope, charged_window, cost)
+            raise Throttled(wait=wait, detail=f'分析请求过多（本次成本 {cost}），请稍后再试')
+        charged.append((scope, window))
+    
+    slots = _worker_slots()
+    if not slots.acquire(timeout=settings.ANALYSIS_SLOT_WAIT_SECONDS):
+        for scope, window in charged:
+            _refund(scope, window, cost)
+        wait = math.ceil(settings.ANALYSIS_SLOT_WAIT_SECONDS)
+        raise Throttled(wait=wait, detail='服务器正忙，请稍后再试')
+    try:
+        yield
+    finally:
+        slots.release()
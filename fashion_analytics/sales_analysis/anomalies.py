@@ -0,0 +1,191 @@
+"""
+销售异常检测：为每个 地区×服装类型 的日销售额序列维护 Welford 流式均值与方差。
+
+订单条目写入时只把金额累加到当天的桶里；当某个序列出现新一天的订单（或每日
+detect_sales_anomalies 命令运行）时结束前一天，先用历史统计计算 Z 分数判断是否
+异常，再把这一天并入统计。中间没有销售的日子按 0 计，用并行合并公式一次并入，
+因此每个订单的代价都是 O(1)，无需回看历史。
+"""
+import datetime
+import math
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import OrderItem, SalesSeriesStats, SalesAnomaly
+from .money import Cents, from_cents
+from .signals import order_items_created
+from .sharding import sales_databases
+
+# |Z| 超过该值视为异常
+Z_THRESHOLD = 3.0
+# 至少积累这么多天的历史才开始检测
+MIN_HISTORY_DAYS = 7
+
+
+def _std(stats):
+    return math.sqrt(stats.m2 / (stats.n - 1)) if stats.n > 1 else 0.0
+
+
+def _check(stats, day, value, anomalies):
+    """用当前统计量判断 value 是否异常，异常时追加到 anomalies"""
+    if stats.n < MIN_HISTORY_DAYS:
+        return
+    std = _std(stats)
+    if std == 0:
+        return
+    z_score = (value - stats.mean) / std
+    if abs(z_score) >= Z_THRESHOLD:
+        anomalies.append(SalesAnomaly(
+            region_id=stats.region_id, clothing_type_id=stats.clothing_type_id, day=day,
+            value=Decimal(str(round(value, 2))), expected=round(stats.mean, 2), std=round(std, 2),
+            z_score=round(z_score, 2), direction='drop' if z_score < 0 else 'spike'
+        ))
+
+
+def _push(stats, value):
+    """Welford 单点更新"""
+    stats.n += 1
+    delta = value - stats.mean
+    stats.mean += delta / stats.n
+    stats.m2 += delta * (value - stats.mean)
+
+
+def _push_zeros(stats, count):
+    """一次并入 count 个销售额为 0 的日子（Chan 并行合并公式）"""
+    n = stats.n + count
+    delta = -stats.mean
+    stats.m2 += delta * delta * stats.n * count / n
+    stats.mean += delta * count / n
+    stats.n = n
+
+
+def advance(stats, day, anomalies):
+    """结束 day 之前尚未结束的日子并检测异常，使序列停在 day"""
+    if day <= stats.current_day:
+        return
+    value = float(stats.current_total)
+    _check(stats, stats.current_day, value, anomalies)
+    _push(stats, value)
+    
+    gap = (day - stats.current_day).days - 1
+    if gap > 0:
+        # 连续无销售只在第一天报警一次
+        _check(stats, stats.current_day + datetime.timedelta(days=1), 0.0, anomalies)
+        _push_zeros(stats, gap)
+    stats.current_day = day
+    stats.current_total = Decimal('0')
+
+
+def add_sales(stats, day, amount, anomalies):
+    """把一笔销售额计入序列；已结束的日子不再回溯修改"""
+    if day < stats.current_day:
+        return
+    advance(stats, day, anomalies)
+    stats.current_total += amount
+    # 当天累计已明显高于历史水平时提前报警，同一天的重复报警由唯一约束去重
+    value = float(stats.current_total)
+    if value > stats.mean:
+        _check(stats, day, value, anomalies)
+
+
+def record_series_sales(amounts):
+    """
+    批量记录销售额。
+    amounts: {(region_id, clothing_type_id, 日期): 金额}，每个序列只读写一行
+    """
+    per_series = defaultdict(dict)
+    for (region_id, type_id, day), amount in amounts.items():
+        per_series[(region_id, type_id)][day] = per_series[(region_id, type_id)].get(day, 0) + amount
+    if not per_series:
+        return []
+    
+    anomalies = []
+    with transaction.atomic():
+        region_ids = {region_id for region_id, _ in per_series}
+        type_ids = {type_id for _, type_id in per_series}
+        # 先补齐缺失的序列（并发时由唯一约束去重），再统一加行锁读改写
+        SalesSeriesStats.objects.bulk_create([
+            SalesSeriesStats(region_id=region_id, clothing_type_id=type_id, current_day=min(days))
+            for (region_id, type_id), days in per_series.items()
+        ], ignore_conflicts=True)
+        rows = SalesSeriesStats.objects.select_for_update().filter(
+            region_id__in=region_ids, clothing_type_id__in=type_ids
+        )
+        
+        now = timezone.now()
+        changed = []
+        for stats in rows:
+            days = per_series.get((stats.region_id, stats.clothing_type_id))
+            if not days:
+                continue
+            for day, amount in sorted(days.items()):
+                add_sales(stats, day, amount, anomalies)
+            stats.updated_at = now
+            changed.append(stats)
+        SalesSeriesStats.objects.bulk_update(
+            changed, ['current_day', 'current_total', 'n', 'mean', 'm2', 'updated_at']
+        )
+        SalesAnomaly.objects.bulk_create(anomalies, ignore_conflicts=True)
+    return anomalies
+
+
+@receiver(order_items_created)
+def update_sales_series(sender, items, **kwargs):
+    """订单条目创建后更新对应 地区×服装类型 序列（条目上已冗余地区、服装类型与条目金额）"""
+    amounts = defaultdict(Decimal)
+    for item in items:
+        day = timezone.localdate(item.order_date)
+        amounts[(item.region_id, item.clothing_type_id, day)] += item.line_total
+    record_series_sales(amounts)
+
+
+def close_stale_series(today=None):
+    """结束所有序列在今天之前的日子，使长时间没有订单的序列也能报出骤降"""
+    today = today or timezone.localdate()
+    anomalies = []
+    with transaction.atomic():
+        rows = list(SalesSeriesStats.objects.select_for_update().filter(current_day__lt=today))
+        # bulk_update 不经过 auto_now，更新时间需手动设置
+        now = timezone.now()
+        for stats in rows:
+            advance(stats, today, anomalies)
+            stats.updated_at = now
+        SalesSeriesStats.objects.bulk_update(rows, ['current_day', 'current_total', 'n', 'mean', 'm2', 'updated_at'])
+        SalesAnomaly.objects.bulk_create(anomalies, ignore_conflicts=True)
+    return anomalies
+
+
+def rebuild_series(today=None):
+    """按日期顺序回放全部历史订单条目，重建序列统计与异常记录"""
+    amounts = defaultdict(int)
+    # 条目上冗余了地区、服装类型与条目金额，只扫描 orderitem_series_cover 覆盖索引；金额按整数分累加
+    for alias in sales_databases():
+        items = OrderItem.objects.using(alias).annotate(line_cents=Cents('line_total')).values_list(
+            'region_id', 'clothing_type_id', 'order_date', 'line_cents'
+        )
+        for region_id, type_id, order_date, line_cents in items.iterator(chunk_size=5000):
+            amounts[(region_id, type_id, timezone.localdate(order_date))] += line_cents
+    
+    per_series = defaultdict(list)
+    for (region_id, type_id, day), cents in amounts.items():
+        per_series[(region_id, type_id)].append((day, from_cents(cents)))
+    
+    anomalies = []
+    rows = []
+    for (region_id, type_id), days in per_series.items():
+        days.sort()
+        stats = SalesSeriesStats(region_id=region_id, clothing_type_id=type_id, current_day=days[0][0])
+        for day, amount in days:
+            add_sales(stats, day, amount, anomalies)
+        rows.append(stats)
+    
+    with transaction.atomic():
+        SalesAnomaly.objects.all().delete()
+        SalesSeriesStats.objects.all().delete()
+        SalesSeriesStats.objects.bulk_create(rows, batch_size=1000)
+        SalesAnomaly.objects.bulk_create(anomalies, batch_size=1000, ignore_conflicts=True)
+    return len(rows)
@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class SalesAnalysisConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "sales_analysis"
+
+    def ready(self):
+        # 注册订单条目写入后的派生数据处理（库存扣减、销售速度、销售异常检测、实时推送、近似分析样本、维度缓存失效）
+        # 以及商品图片上传后的缩略图生成
+        from . import inventory, anomalies, live, sampling, dimensions, thumbnails  # noqa: F401
+        # 参照表写入后复制到各分片
+        from .sharding import connect_replication
+        connect_replication()
+        # 迁移在 SQLite 上重建商品表后补建全文索引的触发器
+        from .catalog import repair_fulltext
+        post_migrate.connect(repair_fulltext, sender=self, dispatch_uid='repair_clothing_fulltext')
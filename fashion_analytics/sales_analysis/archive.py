@@ -0,0 +1,437 @@
+"""
+订单冷数据的分区与归档。
+
+- MySQL：SalesOrder / OrderItem 按 order_date 做按月 RANGE 分区（manage_partitions --convert，
+  一次性转换），之后定期执行 manage_partitions 预建未来月份的分区；
+- 其他数据库（如 SQLite）：manage_partitions 把热数据窗口之外的订单移入归档表；
+- archive_sales 把冷月份导出为压缩 Parquet 文件后从数据库删除（MySQL 直接 DROP PARTITION），
+  分析接口带 include_archive=1 时按需读取这些文件。
+
+月份边界统一按 UTC 计算，与 MySQL 中以 UTC 存储的 order_date 及分区边界一致。
+
+订单号唯一性：分区表的唯一索引必须包含分区列，转换后订单号索引变为 (order_number, order_date)；
+归档表中的订单也不在在线表的唯一索引内。两种情况下都由 guard_order_numbers 在订单表上安装触发器，
+插入时把订单号登记到 OrderNumber 表（主键即订单号），与订单在同一事务中写入，重复的订单号插入失败。
+订单删除、归档或 DROP PARTITION 后编号仍保留，不再复用。触发器只支持 MySQL 与 SQLite，
+唯一性在每个数据库内保证；import_sales 写入前按所有销售数据库的登记表跳过已用的订单号。
+按地区分片时分区、归档表与删除在每个销售数据库上分别执行（见 sharding.py），同一月份的 Parquet 文件包含所有库的数据。
+"""
+import datetime
+import glob
+import os
+from collections import defaultdict
+
+import pandas as pd
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .filters import window_filter
+from .sampling import discard_samples
+from .dimensions import dimension_names
+from .sharding import sales_databases, sales_atomic
+from .versions import bump_versions
+
+from .models import (
+    Region, ClothingType, PriceRange, Clothing, SalesOrder, OrderItem,
+    ArchivedSalesOrder, ArchivedOrderItem, OrderNumber
+)
+
+ORDER_COLUMNS = ['id', 'order_number', 'user_id', 'region_id', 'total_amount', 'order_date']
+ITEM_COLUMNS = ['id', 'order_id', 'clothing_id', 'quantity', 'price', 'order_date']
+PARTITIONED_MODELS = (SalesOrder, OrderItem)
+DIMENSION_MODELS = {'region': Region, 'clothing_type': ClothingType, 'price_range': PriceRange}
+
+ORDER_TABLE = SalesOrder._meta.db_table
+NUMBER_TABLE = OrderNumber._meta.db_table
+# 订单号登记触发器，MySQL 与 SQLite 通用；修改订单时先释放旧编号再登记新编号
+ORDER_NUMBER_TRIGGERS = {
+    f'{ORDER_TABLE}_number_bi': f"""CREATE TRIGGER IF NOT EXISTS {ORDER_TABLE}_number_bi
+    BEFORE INSERT ON {ORDER_TABLE} FOR EACH ROW BEGIN
+        INSERT INTO {NUMBER_TABLE} (order_number) VALUES (NEW.order_number);
+    END""",
+    f'{ORDER_TABLE}_number_bu': f"""CREATE TRIGGER IF NOT EXISTS {ORDER_TABLE}_number_bu
+    BEFORE UPDATE ON {ORDER_TABLE} FOR EACH ROW BEGIN
+        DELETE FROM {NUMBER_TABLE} WHERE order_number = OLD.order_number;
+        INSERT INTO {NUMBER_TABLE} (order_number) VALUES (NEW.order_number);
+    END""",
+}
+
+
+def month_start(day):
+    return datetime.datetime(day.year, day.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def next_month(month):
+    return month_start(month + datetime.timedelta(days=32))
+
+
+def iter_months(first, last):
+    """first 与 last 之间（含两端）每个月的月初"""
+    month = month_start(first)
+    while month <= last:
+        yield month
+        month = next_month(month)
+
+
+def hot_window_start(hot_months=None, now=None):
+    """在线表保留的最早月份的月初：包括当月在内的最近 hot_months（默认 SALES_HOT_MONTHS）个月"""
+    hot_months = settings.SALES_HOT_MONTHS if hot_months is None else hot_months
+    month = month_start(now or datetime.datetime.now(datetime.timezone.utc))
+    for _ in range(hot_months - 1):
+        month = month_start(month - datetime.timedelta(days=1))
+    return month
+
+
+def _partition_name(month):
+    return f'p{month:%Y%m}'
+
+
+def _quote(name, using=DEFAULT_DB_ALIAS):
+    return connections[using].ops.quote_name(name)
+
+
+def _adapt(value, using):
+    return connections[using].ops.adapt_datetimefield_value(value)
+
+
+# ---------- 订单号唯一性 ----------
+
+def _triggers(using):
+    with connections[using].cursor() as cursor:
+        if connections[using].vendor == 'mysql':
+            cursor.execute(
+                'SELECT TRIGGER_NAME FROM information_schema.TRIGGERS '
+                'WHERE TRIGGER_SCHEMA = DATABASE() AND EVENT_OBJECT_TABLE = %s',
+                [ORDER_TABLE]
+            )
+        else:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s", [ORDER_TABLE])
+        return {row[0] for row in cursor.fetchall()}
+
+
+def guard_order_numbers(using=DEFAULT_DB_ALIAS):
+    """
+    在数据库 using 的订单表上安装订单号登记触发器，并登记已有订单与归档订单的编号，返回是否做了安装。
+    SQLite 上增删改字段的迁移会重建订单表、丢掉触发器，分区维护与轮转前都会调用本函数补建
+    """
+    vendor = connections[using].vendor
+    if vendor not in ('mysql', 'sqlite') or _triggers(using) >= ORDER_NUMBER_TRIGGERS.keys():
+        return False
+    ignore = 'INSERT IGNORE' if vendor == 'mysql' else 'INSERT OR IGNORE'
+    with connections[using].cursor() as cursor:
+        # 先建触发器再登记：期间新插入的订单已由触发器登记，重复的登记忽略
+        for sql in ORDER_NUMBER_TRIGGERS.values():
+            cursor.execute(sql)
+        for model in (SalesOrder, ArchivedSalesOrder):
+            cursor.execute(
+                f'{ignore} INTO {_quote(NUMBER_TABLE, using)} (order_number) '
+                f'SELECT order_number FROM {_quote(model._meta.db_table, using)}'
+            )
+    return True
+
+
+def used_order_numbers(numbers):
+    """numbers 中已登记在任一销售数据库中的订单号"""
+    numbers = set(numbers)
+    return {
+        number for alias in sales_databases()
+        for number in OrderNumber.objects.using(alias).filter(order_number__in=numbers).values_list(
+            'order_number', flat=True
+        )
+    }
+
+
+# ---------- MySQL 分区 ----------
+
+def partitions(table, using=DEFAULT_DB_ALIAS):
+    """返回数据库 using 中表现有的分区名列表，未分区时为空"""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT PARTITION_NAME FROM information_schema.PARTITIONS '
+            'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL '
+            'ORDER BY PARTITION_ORDINAL_POSITION',
+            [table]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _partition_definitions(months):
+    definitions = [
+        f"PARTITION {_partition_name(month)} VALUES LESS THAN (TO_DAYS('{next_month(month):%Y-%m-%d}'))"
+        for month in months
+    ]
+    definitions.append('PARTITION pmax VALUES LESS THAN MAXVALUE')
+    return ', '.join(definitions)
+
+
+def convert_to_partitioned(months_ahead=3, using=DEFAULT_DB_ALIAS):
+    """
+    把数据库 using 中的订单与订单条目表转换为按月分区表（仅 MySQL，一次性操作）。
+    MySQL 分区表不支持外键，且主键/唯一索引必须包含分区列，因此会：
+    删除相关外键，把主键改为 (id, order_date)，把订单号唯一索引改为 (order_number, order_date)，
+    订单号的唯一性改由 guard_order_numbers 安装的触发器保证。
+    """
+    guard_order_numbers(using)
+    tables = [model._meta.db_table for model in PARTITIONED_MODELS]
+    now = datetime.datetime.now(datetime.timezone.utc)
+    first = SalesOrder.objects.using(using).order_by('order_date').values_list('order_date', flat=True).first() or now
+    months = list(iter_months(first, now + datetime.timedelta(days=31 * months_ahead)))
+    
+    with connections[using].cursor() as cursor:
+        placeholders = ', '.join(['%s'] * len(tables))
+        cursor.execute(
+            'SELECT TABLE_NAME, CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS '
+            f'WHERE CONSTRAINT_SCHEMA = DATABASE() AND (TABLE_NAME IN ({placeholders}) '
+            f'OR REFERENCED_TABLE_NAME IN ({placeholders}))',
+            tables + tables
+        )
+        for table, constraint in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {_quote(table, using)} DROP FOREIGN KEY {_quote(constraint, using)}')
+        
+        order_table, item_table = tables
+        cursor.execute(
+            'SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS '
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND NON_UNIQUE = 0 AND INDEX_NAME <> 'PRIMARY'",
+            [order_table]
+        )
+        for (index,) in cursor.fetchall():
+            cursor.execute(
+                f'ALTER TABLE {_quote(order_table, using)} DROP INDEX {_quote(index, using)}, '
+                f'ADD UNIQUE INDEX {_quote(index, using)} (order_number, order_date)'
+            )
+        cursor.execute(f'ALTER TABLE {_quote(item_table, using)} MODIFY order_date datetime(6) NOT NULL')
+        
+        for table in tables:
+            cursor.execute(
+                f'ALTER TABLE {_quote(table, using)} DROP PRIMARY KEY, ADD PRIMARY KEY (id, order_date)'
+            )
+            cursor.execute(
+                f'ALTER TABLE {_quote(table, using)} PARTITION BY RANGE (TO_DAYS(order_date)) '
+                f'({_partition_definitions(months)})'
+            )
+    return len(months)
+
+
+def ensure_future_partitions(months_ahead=3, using=DEFAULT_DB_ALIAS):
+    """在数据库 using 中从 pmax 拆分出直到未来 months_ahead 个月的分区，返回新建的分区数"""
+    created = 0
+    if partitions(SalesOrder._meta.db_table, using):
+        guard_order_numbers(using)
+    horizon = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=31 * months_ahead)
+    for model in PARTITIONED_MODELS:
+        table = model._meta.db_table
+        existing = [name for name in partitions(table, using) if name != 'pmax']
+        if not existing:
+            continue
+        last = datetime.datetime.strptime(existing[-1], 'p%Y%m').replace(tzinfo=datetime.timezone.utc)
+        months = list(iter_months(next_month(last), horizon))
+        if months:
+            with connections[using].cursor() as cursor:
+                cursor.execute(
+                    f'ALTER TABLE {_quote(table, using)} REORGANIZE PARTITION pmax INTO ({_partition_definitions(months)})'
+                )
+            created += len(months)
+    return created
+
+
+# ---------- 归档表（不支持分区的数据库） ----------
+
+def _copy_rows(source, target, columns, start, end, using):
+    """用 INSERT ... SELECT 把数据库 using 中 [start, end) 内的行复制到同一库的归档表"""
+    column_list = ', '.join(_quote(column, using) for column in columns)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {_quote(target._meta.db_table, using)} ({column_list}) '
+            f'SELECT {column_list} FROM {_quote(source._meta.db_table, using)} '
+            f'WHERE order_date >= %s AND order_date < %s',
+            [_adapt(start, using), _adapt(end, using)]
+        )
+    bump_versions(target, using=using)
+
+
+def _delete_orders(start, end, using):
+    """按日期区间直接删除数据库 using 中的订单（其条目须已删除），避免 ORM 级联删除逐行加载"""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {_quote(SalesOrder._meta.db_table, using)} WHERE order_date >= %s AND order_date < %s',
+            [_adapt(start, using), _adapt(end, using)]
+        )
+    bump_versions(SalesOrder, using=using, modified=True)
+
+
+def rotate_to_archive_tables(before, using=DEFAULT_DB_ALIAS):
+    """把数据库 using 中 before 之前的订单和条目按月移入同一库的归档表，返回移动的月数"""
+    first = SalesOrder.objects.using(using).filter(order_date__lt=before).order_by('order_date').values_list(
+        'order_date', flat=True
+    ).first()
+    if first is None:
+        return 0
+    
+    # 移入归档表的订单不在订单表的唯一索引内
+    guard_order_numbers(using)
+    moved = 0
+    for month in iter_months(first, before - datetime.timedelta(microseconds=1)):
+        end = min(next_month(month), before)
+        with transaction.atomic(using=using):
+            _copy_rows(SalesOrder, ArchivedSalesOrder, ORDER_COLUMNS, month, end, using)
+            _copy_rows(OrderItem, ArchivedOrderItem, ITEM_COLUMNS, month, end, using)
+            OrderItem.objects.using(using).filter(order_date__gte=month, order_date__lt=end).delete()
+            _delete_orders(month, end, using)
+            # 样本表在默认库，包含所有库的订单
+            discard_samples(month, end)
+        moved += 1
+    return moved
+
+
+# ---------- Parquet 归档 ----------
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _archive_path(kind, month):
+    return os.path.join(settings.ANALYTICS_DATA_DIR, 'archive', kind, f'{month:%Y-%m}.parquet')
+
+
+def _write_parquet(kind, month, frame):
+    path = _archive_path(kind, month)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        frame = pd.concat([pd.read_parquet(path), frame]).drop_duplicates('id', keep='last')
+    tmp_path = path + '.tmp'
+    frame.to_parquet(tmp_path, compression='zstd', index=False)
+    os.replace(tmp_path, path)
+
+
+def _month_rows(models, columns, start, end):
+    """各销售数据库中在线表与归档表 [start, end) 内的行"""
+    rows = []
+    for alias in sales_databases():
+        for model in models:
+            rows.extend(model.objects.using(alias).filter(
+                order_date__gte=start, order_date__lt=end
+            ).values_list(*columns))
+    return pd.DataFrame(rows, columns=columns)
+
+
+def archive_month(month):
+    """把各销售数据库某个月的订单与条目导出为 Parquet，并从在线表、归档表或分区中删除，返回 (订单数, 条目数)"""
+    start, end = month, next_month(month)
+    orders = _month_rows((SalesOrder, ArchivedSalesOrder), ORDER_COLUMNS, start, end)
+    items = _month_rows((OrderItem, ArchivedOrderItem), ITEM_COLUMNS, start, end)
+    if orders.empty and items.empty:
+        return 0, 0
+    
+    # 先落盘再删除，删除失败时重复执行会按 id 去重
+    _write_parquet('orders', month, orders)
+    _write_parquet('items', month, items)
+    
+    name = _partition_name(month)
+    dropped = []
+    with sales_atomic():
+        for alias in sales_databases():
+            for archived in (ArchivedOrderItem, ArchivedSalesOrder):
+                archived.objects.using(alias).filter(order_date__gte=start, order_date__lt=end).delete()
+            for model in (OrderItem, SalesOrder):
+                if connections[alias].vendor == 'mysql' and name in partitions(model._meta.db_table, alias):
+                    dropped.append((alias, model))
+                elif model is OrderItem:
+                    OrderItem.objects.using(alias).filter(order_date__gte=start, order_date__lt=end).delete()
+                else:
+                    _delete_orders(start, end, alias)
+        discard_samples(start, end)
+    
+    # DROP PARTITION 是 DDL，MySQL 执行前会隐式提交当前事务，因此放在事务之外逐个执行；
+    # 中途失败时重新归档该月即可，文件已落盘
+    for alias, model in dropped:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {_quote(model._meta.db_table, alias)} DROP PARTITION {name}')
+        bump_versions(model, using=alias, modified=True)
+    return len(orders), len(items)
+
+
+def archived_frame(kind, start=None, end=None, columns=None):
+    """读取归档表及与时间区间重叠的归档月份，返回过滤到区间内的 DataFrame"""
+    paths = sorted(glob.glob(os.path.join(settings.ANALYTICS_DATA_DIR, 'archive', kind, '*.parquet')))
+    frames = []
+    
+    # 不支持分区的数据库上，热数据窗口之外的订单先轮转到各库的归档表
+    model = ArchivedSalesOrder if kind == 'orders' else ArchivedOrderItem
+    table_columns = columns or (ORDER_COLUMNS if kind == 'orders' else ITEM_COLUMNS)
+    rows = [
+        row for alias in sales_databases()
+        for row in model.objects.using(alias).filter(**window_filter('order_date', start, end)).values_list(
+            *table_columns
+        )
+    ]
+    if rows:
+        frame = pd.DataFrame(list(rows), columns=table_columns)
+        frame['order_date'] = pd.to_datetime(frame['order_date'], utc=True)
+        frames.append(frame)
+    
+    for path in paths:
+        month = datetime.datetime.strptime(os.path.basename(path)[:7], '%Y-%m').replace(
+            tzinfo=datetime.timezone.utc
+        )
+        if (end and month >= end) or (start and next_month(month) <= start):
+            continue
+        frames.append(pd.read_parquet(path, columns=columns))
+    if not frames:
+        return pd.DataFrame(columns=columns or [])
+    
+    frame = pd.concat(frames, ignore_index=True)
+    if start is not None:
+        frame = frame[frame['order_date'] >= pd.Timestamp(start)]
+    if end is not None:
+        frame = frame[frame['order_date'] < pd.Timestamp(end)]
+    return frame
+
+
+def archived_sales_by(dimension, start=None, end=None):
+    """
+    按维度汇总归档数据，返回 {名称: [销售额, 订单/条目数]}。
+    dimension: 'region'（按订单统计）、'clothing_type' 或 'price_range'（按订单条目统计）
+    """
+    totals = defaultdict(lambda: [0.0, 0])
+    if dimension == 'region':
+        frame = archived_frame('orders', start, end, ['region_id', 'total_amount', 'order_date'])
+        if frame.empty:
+            return {}
+        frame['amount'] = frame['total_amount'].astype(float)
+        keys = frame['region_id']
+    else:
+        frame = archived_frame('items', start, end, ['clothing_id', 'quantity', 'price', 'order_date'])
+        if frame.empty:
+            return {}
+        frame['amount'] = frame['price'].astype(float) * frame['quantity']
+        mapping = dict(Clothing.objects.values_list('id', f'{dimension}_id'))
+        keys = frame['clothing_id'].map(mapping)
+    
+    names = dimension_names(DIMENSION_MODELS[dimension])
+    grouped = frame.groupby(keys)['amount'].agg(['sum', 'count'])
+    for key, row in grouped.iterrows():
+        name = names.get(key)
+        if name is not None:
+            totals[name][0] += float(row['sum'])
+            totals[name][1] += int(row['count'])
+    return dict(totals)
+
+
+def merge_archived_rows(rows, name_key, archived):
+    """把归档汇总合并进在线聚合结果（按名称累加 total_sales 与 order_count）"""
+    merged = {row[name_key]: dict(row) for row in rows}
+    for name, (total, count) in archived.items():
+        row = merged.setdefault(name, {name_key: name, 'total_sales': 0, 'order_count': 0})
+        row['total_sales'] = float(row['total_sales'] or 0) + total
+        row['order_count'] += count
+    return list(merged.values())
+
+
+def archive_version():
+    """归档文件的 (文件名, 修改时间) 列表，归档内容变化时随之变化"""
+    paths = sorted(glob.glob(os.path.join(settings.ANALYTICS_DATA_DIR, 'archive', '*', '*.parquet')))
+    return [(os.path.relpath(path, settings.ANALYTICS_DATA_DIR), os.path.getmtime(path)) for path in paths]
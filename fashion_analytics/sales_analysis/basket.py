@@ -0,0 +1,256 @@
+"""
+购物篮分析：用稀疏的 订单×商品 CSR 矩阵挖掘经常一起购买的商品。
+
+共现矩阵 C = XᵀX（对角线为各商品出现的订单数）连同订单总数和已处理的
+OrderItem 水位一起保存在 ANALYTICS_DATA_DIR 下；每次运行只读取尚未计入的
+新条目，对受影响订单用 X_newᵀX_new - X_oldᵀX_old 增量更新，并只重算受影响
+商品的前K个关联商品。
+
+自增ID按分配顺序而不是提交顺序可见，较晚提交的事务可能留下低于水位的条目：状态中另外记录
+水位之下 ID_LAG 以内已计入的条目ID，每次运行补上这一范围内新出现的条目。
+每次运行把状态写入新文件，在重写关联商品的同一事务中切换 AnalyticsSnapshot 中的文件指针。
+"""
+import os
+import uuid
+from itertools import chain
+
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+from django.db import transaction
+
+from .models import OrderItem, ItemAssociation, AnalyticsSnapshot
+from .sharding import sales_databases
+from .columns import ID_LAG
+
+# 每个商品保留的关联商品数
+TOP_K = 10
+# 共同购买订单数低于该值的商品对不计入关联
+MIN_CO_COUNT = 2
+# 每批处理的新订单条目数
+BATCH_SIZE = 50000
+# AnalyticsSnapshot 中记录当前状态文件的快照名
+STATE_SNAPSHOT = 'basket_state'
+
+_state_cache = {}
+
+
+def _state_dir():
+    return os.path.join(settings.ANALYTICS_DATA_DIR, 'basket')
+
+
+def _current_file():
+    payload = AnalyticsSnapshot.objects.filter(name=STATE_SNAPSHOT).values_list('payload', flat=True).first()
+    return payload.get('file') if payload else None
+
+
+def state_version():
+    """当前共现矩阵状态文件名，与关联商品行在同一事务中切换，每次 mine_baskets 后变化"""
+    return _current_file() or ''
+
+
+def load_state():
+    """读取共现矩阵状态，返回 (C, 订单总数, 条目水位, 水位之下 ID_LAG 以内已计入的条目ID)；按文件名在进程内缓存"""
+    name = _current_file()
+    if name is None:
+        return sparse.csr_matrix((0, 0), dtype=np.int64), 0, 0, frozenset()
+    
+    path = os.path.join(_state_dir(), name)
+    cached = _state_cache.get(path)
+    if cached:
+        return cached
+    
+    with np.load(path) as data:
+        matrix = sparse.csr_matrix(
+            (data['data'], data['indices'], data['indptr']), shape=tuple(data['shape'])
+        )
+        state = (matrix, int(data['n_orders']), int(data['watermark']), frozenset(data['recent'].tolist()))
+    # 状态文件每次写入新文件名，只需缓存最新的一个
+    _state_cache.clear()
+    _state_cache[path] = state
+    return state
+
+
+def _write_state(matrix, n_orders, watermark, recent):
+    """把状态写入新的文件，返回文件名；由 _publish 与关联商品行一起切换"""
+    os.makedirs(_state_dir(), exist_ok=True)
+    name = f'cooccurrence-{uuid.uuid4().hex}.npz'
+    np.savez(
+        os.path.join(_state_dir(), name), data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+        shape=np.array(matrix.shape), n_orders=n_orders, watermark=watermark,
+        recent=np.array(sorted(recent), dtype=np.int64)
+    )
+    return name
+
+
+def _remove_stale_files(keep):
+    for name in os.listdir(_state_dir()):
+        if name.startswith('cooccurrence') and name not in keep:
+            os.remove(os.path.join(_state_dir(), name))
+
+
+def _cooccurrence(rows, orders, size):
+    """rows: [(order_id, clothing_id)]，orders: 有序订单ID数组；返回 0/1 订单×商品矩阵的 XᵀX"""
+    if not rows:
+        return sparse.csr_matrix((size, size), dtype=np.int64)
+    order_ids, clothing_ids = np.array(rows, dtype=np.int64).T
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int64), (np.searchsorted(orders, order_ids), clothing_ids)),
+        shape=(len(orders), size)
+    )
+    matrix.sum_duplicates()
+    matrix.data[:] = 1  # 同一订单多行相同商品只算一次
+    return (matrix.T @ matrix).tocsr()
+
+
+def _grow(matrix, size):
+    if matrix.shape[0] < size:
+        matrix = matrix.tocsr(copy=True)
+        matrix.resize((size, size))
+    return matrix
+
+
+def top_associations(matrix, clothing_id):
+    """
+    计算单个商品的前K个关联商品，按共同购买数（即置信度）降序、商品ID升序排列。
+    排序只依赖本行数据，因此未受新订单影响的商品无需重算。
+    """
+    if clothing_id >= matrix.shape[0]:
+        return []
+    row = matrix.getrow(clothing_id)
+    related, co_counts = row.indices, row.data
+    keep = (related != clothing_id) & (co_counts >= MIN_CO_COUNT)
+    related, co_counts = related[keep], co_counts[keep]
+    if not len(related):
+        return []
+    
+    confidence = co_counts / matrix[clothing_id, clothing_id]
+    ranking = np.lexsort((related, -co_counts))[:TOP_K]
+    return [
+        (int(related[i]), int(co_counts[i]), float(confidence[i]))
+        for i in ranking
+    ]
+
+
+def _next_items(watermark, recent):
+    """按ID升序取前 BATCH_SIZE 条尚未计入的条目：水位之后的新条目，以及水位之下 ID_LAG 以内较晚提交的条目"""
+    limit = BATCH_SIZE + len(recent)
+    # 按地区分片时每个库各取一批，合并后按ID取前 BATCH_SIZE 条，订单的条目都在同一个库
+    rows = chain.from_iterable(
+        OrderItem.objects.using(alias).filter(
+            id__gt=watermark - ID_LAG
+        ).order_by('id').values_list('id', 'order_id', 'clothing_id')[:limit]
+        for alias in sales_databases()
+    )
+    return sorted(row for row in rows if row[0] not in recent)[:BATCH_SIZE]
+
+
+def mine_associations(full=False, stdout=None):
+    """增量挖掘商品关联，返回本次处理的新订单条目数"""
+    previous = _current_file()
+    if full:
+        matrix, n_orders, watermark, recent = sparse.csr_matrix((0, 0), dtype=np.int64), 0, 0, frozenset()
+    else:
+        matrix, n_orders, watermark, recent = load_state()
+    
+    processed = 0
+    touched = set()
+    while True:
+        new_items = _next_items(watermark, recent)
+        if not new_items:
+            break
+        batch_max = new_items[-1][0]
+        order_list = sorted({order_id for _, order_id, _ in new_items})
+        
+        # 受影响订单已计入矩阵的条目（水位之下 ID_LAG 以外的条目与 recent 中的条目），与加上本批条目后分别构造矩阵
+        full_rows = []
+        for alias in sales_databases():
+            for start in range(0, len(order_list), 1000):
+                full_rows.extend(OrderItem.objects.using(alias).filter(
+                    order_id__in=order_list[start:start + 1000], id__lte=watermark
+                ).values_list('id', 'order_id', 'clothing_id'))
+        old_rows = [
+            (order_id, clothing_id) for item_id, order_id, clothing_id in full_rows
+            if item_id <= watermark - ID_LAG or item_id in recent
+        ]
+        new_rows = old_rows + [(order_id, clothing_id) for _, order_id, clothing_id in new_items]
+        
+        size = max(matrix.shape[0], max(clothing_id for _, clothing_id in new_rows) + 1)
+        orders = np.array(order_list, dtype=np.int64)
+        delta = _cooccurrence(new_rows, orders, size) - _cooccurrence(old_rows, orders, size)
+        delta.eliminate_zeros()
+        
+        matrix = (_grow(matrix, size) + delta).tocsr()
+        n_orders += len(order_list) - len({order_id for order_id, _ in old_rows})
+        touched.update(np.unique(delta.nonzero()[0]).tolist())
+        processed += len(new_items)
+        watermark = max(watermark, batch_max)
+        recent = frozenset(
+            item_id for item_id in recent.union(item_id for item_id, _, _ in new_items)
+            if item_id > watermark - ID_LAG
+        )
+        if stdout:
+            stdout.write(f'已处理订单条目至 #{watermark}')
+    
+    if processed or full:
+        _publish(matrix, n_orders, watermark, recent, touched, full, previous)
+    return processed
+
+
+def _association_rows(matrix, clothing_ids):
+    """受影响商品的前K个关联商品"""
+    rows = []
+    for clothing_id in sorted(clothing_ids):
+        for rank, (related_id, co_count, confidence) in enumerate(top_associations(matrix, clothing_id), 1):
+            rows.append(ItemAssociation(
+                clothing_id=clothing_id, related_clothing_id=related_id, rank=rank,
+                co_count=co_count, confidence=round(confidence, 6)
+            ))
+    return rows
+
+
+def _publish(matrix, n_orders, watermark, recent, touched, full, previous):
+    """
+    先写入新的状态文件，再在同一事务中重写受影响商品的关联商品并把状态指针切换到新文件，
+    接口读到的关联商品与订单总数、商品出现次数始终来自同一次挖掘；事务失败时删除新文件
+    """
+    name = _write_state(matrix, n_orders, watermark, recent)
+    rows = _association_rows(matrix, touched)
+    try:
+        with transaction.atomic():
+            if full or touched:
+                stale = ItemAssociation.objects.all()
+                if not full:
+                    stale = stale.filter(clothing_id__in=touched)
+                stale.delete()
+                ItemAssociation.objects.bulk_create(rows, batch_size=1000)
+            AnalyticsSnapshot.objects.update_or_create(
+                name=STATE_SNAPSHOT, defaults={'payload': {'file': name}, 'watermark': watermark}
+            )
+            # 保留上一个文件，正在读取它的请求不受影响
+            transaction.on_commit(lambda: _remove_stale_files({name, previous}))
+    except Exception:
+        os.remove(os.path.join(_state_dir(), name))
+        raise
+
+
+def bought_together(clothing_id):
+    """返回商品的关联商品，支持度与提升度按当前订单总数实时计算"""
+    matrix, n_orders, _, _ = load_state()
+    diag = matrix.diagonal()
+    result = []
+    associations = ItemAssociation.objects.filter(
+        clothing_id=clothing_id
+    ).select_related('related_clothing').order_by('rank')
+    for association in associations:
+        related_id = association.related_clothing_id
+        related_count = diag[related_id] if related_id < len(diag) else 0
+        result.append({
+            'clothing_id': related_id,
+            'clothing_name': association.related_clothing.name,
+            'co_count': association.co_count,
+            'support': round(association.co_count / n_orders, 6) if n_orders else 0,
+            'confidence': association.confidence,
+            'lift': round(association.confidence * n_orders / related_count, 4) if related_count else 0,
+        })
+    return result
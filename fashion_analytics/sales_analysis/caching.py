@@ -0,0 +1,110 @@
+"""
+分析接口的 HTTP 条件请求支持。
+
+ETag 由相关表的数据水位（各表的版本号，见 versions.py）与请求路径计算，
+Last-Modified 取这些表最近一次写入的时间。客户端带 If-None-Match / If-Modified-Since
+且数据未变化时直接返回 304，不执行聚合查询。
+
+没有带条件请求头的请求按 数据水位 + 路径 + 查询参数 把渲染前的响应数据缓存在 CACHES['analytics'] 中，
+数据变化后水位改变，旧的缓存项自然失效；warm_analytics 命令预先填充常用看板请求的缓存。
+缓存未命中时相同缓存键的计算经 single_flight 合并，并发的相同请求只计算一次。
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, urlencode
+from rest_framework.response import Response
+
+from .filters import is_true
+from .singleflight import single_flight
+from .admission import admission
+from .models import VersionedModel
+from .versions import table_versions
+
+RESPONSE_CACHE = 'analytics'
+
+
+def data_watermark(models, extra=()):
+    """
+    计算一组表的数据水位，返回 (ETag 原始值, Last-Modified 时间)。
+    水位为各表的版本号，一次查询取回；extra 为额外参与计算的值，如当天日期、离线分析文件的修改时间。
+    """
+    versions = table_versions(models)
+    parts = [(label, version) for label, (version, _) in sorted(versions.items())]
+    parts.append(tuple(extra))
+    stamps = [stamp for _, stamp in versions.values() if stamp is not None]
+    return repr(parts), max(stamps, default=None)
+
+
+def response_cache():
+    """响应缓存：CACHES 中的 analytics 缓存，未配置时使用默认缓存"""
+    return caches[RESPONSE_CACHE if RESPONSE_CACHE in settings.CACHES else 'default']
+
+
+def response_cache_key(watermark, request):
+    """响应缓存键；缓存的是渲染前的数据，与 Accept 无关，参数按名称排序"""
+    params = urlencode(sorted(request.GET.lists()), doseq=True)
+    digest = hashlib.sha1('|'.join([watermark, request.path, params]).encode('utf-8')).hexdigest()
+    return f'analysis-response:{digest}'
+
+
+def conditional(*models, extra=None, approx_models=None):
+    """
+    为 APIView 的 get 方法增加条件请求与响应缓存支持。
+    models 为接口结果依赖的表，extra(request) 返回额外参与 ETag 计算的值。
+    approx_models 为带 approx=1 时结果依赖的表（抽样表等），此时不再统计大表的水位。
+    权限检查在 get 之前完成，未授权的请求不会得到 304 或缓存的数据。
+    """
+    for model in models + tuple(approx_models or ()):
+        # 不维护版本号的表在修改后水位不变，会返回过期的结果
+        if not issubclass(model, VersionedModel):
+            raise ImproperlyConfigured(f'{model._meta.label} 未继承 VersionedModel，不能作为条件请求的依赖')
+    
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            depends = models
+            if approx_models is not None and is_true(request.query_params.get('approx')):
+                depends = approx_models
+            watermark, last_modified = data_watermark(depends, extra(request) if extra else ())
+            # 同一数据在不同路径、参数和内容协商（JSON / 可浏览 API）下的响应不同
+            digest = hashlib.sha1('|'.join([
+                watermark, request.get_full_path(), request.META.get('HTTP_ACCEPT', '')
+            ]).encode('utf-8')).hexdigest()
+            etag = f'"{digest}"'
+            timestamp = int(last_modified.timestamp()) if last_modified else None
+            
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                cache, cache_key = response_cache(), response_cache_key(watermark, request)
+                
+                def load():
+                    data = cache.get(cache_key)
+                    return None if data is None else Response(data)
+                
+                def compute():
+                    # 只有真正执行计算的请求经过准入控制
+                    with admission(self, request):
+                        result = method(self, request, *args, **kwargs)
+                    if result.status_code == 200:
+                        cache.set(cache_key, result.data)
+                    return result
+                
+                response = load()
+                if response is None:
+                    response = single_flight(cache_key, load, compute)
+                if response.status_code != 200:
+                    return response
+            
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+            # 允许浏览器缓存，但每次使用前都需向服务器验证
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
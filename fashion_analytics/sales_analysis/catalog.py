@@ -0,0 +1,183 @@
+"""
+商品目录检索：ClothingViewSet 列表接口的筛选、全文搜索与分面计数。
+
+clothing_type / price_range（逗号分隔的 ID）、min_price / max_price、in_stock / min_stock 由
+clothing_facet_cover、clothing_price_cover 覆盖索引支持；q 按空白切分为词，在商品名称与描述上做全文检索：
+SQLite 使用 FTS5（trigram 分词），MySQL 使用 ngram 分词的 FULLTEXT 索引，短于 MIN_TERM_LENGTH 的词
+与其他数据库退化为 LIKE。全文索引由迁移 0012 创建，由数据库自动维护，批量写入商品后也不需要重建。
+SQLite 的 FTS5 表靠商品表上的触发器同步，而 SQLite 上增删改字段的迁移会重建商品表、丢掉触发器：
+每次 migrate 之后 ensure_fulltext 检查触发器，缺失时重新创建并重建索引。
+
+facets=1 时在分页结果中附带各服装类型、价格区间的商品数。计数时不使用该维度自身的筛选条件（选中一个类型后
+仍能看到其他类型的商品数），两个维度的分组计数用 UNION ALL 合并为一条查询，名称由维度缓存解析。
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import BooleanField, Count, F, Q, Value
+from django.db.models.expressions import RawSQL
+from rest_framework.exceptions import ParseError
+
+from .dimensions import dimension_rows
+from .filters import is_true
+from .models import Clothing, ClothingType, PriceRange
+
+FTS_TABLE = 'sales_analysis_clothing_fts'
+# 与迁移 0012 中的定义一致，IF NOT EXISTS 只补建缺失的部分
+SQLITE_FTS = {
+    FTS_TABLE: f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, description, content='sales_analysis_clothing', content_rowid='id', tokenize='trigram'
+    )""",
+    f'{FTS_TABLE}_ai': f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON sales_analysis_clothing BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END""",
+    f'{FTS_TABLE}_ad': f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON sales_analysis_clothing BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END""",
+    f'{FTS_TABLE}_au': f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, description ON sales_analysis_clothing BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END""",
+}
+# 全文索引能检索的最短词长：FTS5 trigram 为3个字符，MySQL ngram 默认为2个字符
+MIN_TERM_LENGTH = {'sqlite': 3, 'mysql': 2}
+# 分面维度：(参数名与外键字段, 维度表)
+FACETS = (('clothing_type', ClothingType), ('price_range', PriceRange))
+
+
+def ensure_fulltext(using=DEFAULT_DB_ALIAS):
+    """SQLite 上补建缺失的 FTS5 表与同步触发器并重建索引，返回是否做了修复；其他数据库的全文索引随表保留"""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name = %s OR (type = 'trigger' AND tbl_name = %s)",
+            [FTS_TABLE, Clothing._meta.db_table]
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if Clothing._meta.db_table not in connection.introspection.table_names(cursor) or existing >= SQLITE_FTS.keys():
+            return False
+        for sql in SQLITE_FTS.values():
+            cursor.execute(sql)
+        # 触发器缺失期间的写入没有进入索引，按商品表整体重建
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def repair_fulltext(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """post_migrate 接收者：迁移重建商品表后恢复全文索引的触发器"""
+    ensure_fulltext(using)
+
+
+def _ids(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise ParseError(f'{name}参数应为逗号分隔的ID')
+
+
+def _number(params, name, convert):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        number = convert(value)
+    except (ValueError, InvalidOperation):
+        raise ParseError(f'{name}参数应为数字')
+    if isinstance(number, Decimal) and not number.is_finite():
+        raise ParseError(f'{name}参数应为数字')
+    return number
+
+
+def _search(queryset, q):
+    """名称或描述包含 q 中的每个词"""
+    vendor = connections[queryset.db].vendor
+    min_length = MIN_TERM_LENGTH.get(vendor)
+    indexed = []
+    for term in q.split():
+        if min_length and len(term) >= min_length:
+            indexed.append(term)
+        else:
+            queryset = queryset.filter(Q(name__icontains=term) | Q(description__icontains=term))
+    if not indexed:
+        return queryset
+    
+    if vendor == 'sqlite':
+        # 每个词作为一个短语，短语之间为 AND
+        match = ' '.join('"{}"'.format(term.replace('"', '""')) for term in indexed)
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]
+        ))
+    table = connections[queryset.db].ops.quote_name(Clothing._meta.db_table)
+    match = ' '.join('+"{}"'.format(term.replace('"', ' ')) for term in indexed)
+    return queryset.filter(RawSQL(
+        f'MATCH({table}.name, {table}.description) AGAINST (%s IN BOOLEAN MODE)', [match],
+        output_field=BooleanField()
+    ))
+
+
+def filter_catalog(queryset, params, skip=None):
+    """按目录参数筛选商品，skip 为计算分面时不使用其筛选条件的维度"""
+    for name, _ in FACETS:
+        ids = _ids(params, name)
+        if ids is not None and name != skip:
+            queryset = queryset.filter(**{f'{name}_id__in': ids})
+    
+    min_price = _number(params, 'min_price', Decimal)
+    max_price = _number(params, 'max_price', Decimal)
+    min_stock = _number(params, 'min_stock', int)
+    if min_price is not None:
+        queryset = queryset.filter(price__gte=min_price)
+    if max_price is not None:
+        queryset = queryset.filter(price__lte=max_price)
+    if is_true(params.get('in_stock')):
+        queryset = queryset.filter(stock__gt=0)
+    if min_stock is not None:
+        queryset = queryset.filter(stock__gte=min_stock)
+    
+    q = params.get('q', '').strip()
+    if q:
+        queryset = _search(queryset, q)
+    return queryset
+
+
+def facet_counts(queryset, params):
+    """各服装类型、价格区间在筛选结果中的商品数，只返回数量大于0的项，顺序与维度表一致"""
+    parts = [
+        filter_catalog(queryset, params, skip=name).order_by()
+        .annotate(facet=Value(name), key=F(f'{name}_id'))
+        .values('facet', 'key').annotate(count=Count('pk'))
+        for name, _ in FACETS
+    ]
+    counts = {(row['facet'], row['key']): row['count'] for row in parts[0].union(*parts[1:], all=True)}
+    return {
+        name: [
+            {'id': row['id'], 'name': row['name'], 'count': counts[name, row['id']]}
+            for row in dimension_rows(model) if (name, row['id']) in counts
+        ]
+        for name, model in FACETS
+    }
+
+
+class CatalogSearchMixin:
+    """商品视图集混入：列表接口按目录参数筛选，facets=1 时附带分面计数"""
+    
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action != 'list':
+            return queryset
+        return filter_catalog(queryset, self.request.query_params)
+    
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if is_true(request.query_params.get('facets')) and isinstance(response.data, dict):
+            response.data['facets'] = facet_counts(self.queryset.all(), request.query_params)
+        return response
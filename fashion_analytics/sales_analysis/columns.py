@@ -0,0 +1,45 @@
+"""
+分析列的导出，列式快照（snapshot.py）与 DuckDB 的 Parquet 导出（duckdb_backend.py）共用。
+
+列定义为 [(列名, 查询字段或表达式)]，按主键升序读取；时间列转换为 UTC 微秒时间戳。
+自增ID按分配顺序而不是提交顺序可见，较晚提交的事务可能留下低于导出水位的行：导出方另外记录
+水位之下 ID_LAG 以内已导出的主键，增量读取时补上这一范围内新出现的行（见 unseen_rows）。
+"""
+import datetime
+from itertools import chain
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+MICROSECOND = datetime.timedelta(microseconds=1)
+# 水位之下仍会补查的ID范围：ID 较小但较晚提交的行只要在水位之下 ID_LAG 以内，下次读取时仍会计入
+ID_LAG = 10000
+
+
+def to_micros(value):
+    """时间转换为 UTC 微秒时间戳，None 保持为 None"""
+    return None if value is None else (value - EPOCH) // MICROSECOND
+
+
+def column_rows(model, columns, after_id=0, chunk_size=20000):
+    """按主键升序流式读取主键大于 after_id 的行，返回 (列名列表, 行元组迭代器)"""
+    names = [name for name, _ in columns]
+    expressions = {name: source for name, source in columns if not isinstance(source, str)}
+    fields = [name if name in expressions else source for name, source in columns]
+    rows = model.objects.filter(id__gt=after_id).annotate(**expressions).values_list(*fields).order_by('id')
+    return names, rows.iterator(chunk_size=chunk_size)
+
+
+def unseen_rows(model, columns, max_id=0, recent=(), chunk_size=20000):
+    """
+    尚未读取过的行：主键大于 max_id - ID_LAG 且不在 recent（水位之下已读取的主键）中，
+    返回 (列名列表, 行元组迭代器)；列定义需包含 id
+    """
+    names, rows = column_rows(model, columns, max(max_id - ID_LAG, 0), chunk_size)
+    position = names.index('id')
+    recent = frozenset(recent)
+    return names, (row for row in rows if row[position] not in recent)
+
+
+def advance_watermark(max_id, recent, ids):
+    """读取主键 ids 之后的 (水位, 水位之下 ID_LAG 以内已读取的主键列表)"""
+    max_id = max([max_id, *ids])
+    return max_id, sorted(i for i in chain(recent, ids) if i > max_id - ID_LAG)
@@ -0,0 +1,246 @@
+"""
+客户分析：RFM 分层与按月获客同期群留存。
+
+刷新时一次流式读取水位之后的新订单，用 NumPy 按用户聚合后只更新这些用户的
+CustomerStats；随后基于每用户一行的统计表向量化生成 RFM 与同期群快照，
+分析接口直接读取快照。
+自增ID按分配顺序而不是提交顺序可见：订单水位与水位之下 ID_LAG 以内已计入的订单ID一起记录在
+ORDERS_CURSOR 快照行中，每次刷新补上这一范围内较晚提交的订单（见 columns.py）。
+"""
+import datetime
+from itertools import chain
+
+import numpy as np
+from scipy.stats import rankdata
+from django.db import transaction
+from django.utils import timezone
+
+from .models import SalesOrder, CustomerStats, AnalyticsSnapshot
+from .money import Cents, cents_array, from_cents
+from .sharding import sales_databases
+from .columns import ID_LAG, advance_watermark
+
+RFM_SNAPSHOT = 'rfm'
+COHORT_SNAPSHOT = 'cohorts'
+# 已计入 CustomerStats 的订单水位（watermark）与水位之下 ID_LAG 以内已计入的订单ID（payload['recent']）
+ORDERS_CURSOR = 'customer_orders'
+
+# 经典 RFM 八类客户，键为 (R高, F高, M高)
+SEGMENTS = {
+    (True, True, True): '重要价值客户',
+    (True, False, True): '重要发展客户',
+    (False, True, True): '重要保持客户',
+    (False, False, True): '重要挽留客户',
+    (True, True, False): '一般价值客户',
+    (True, False, False): '一般发展客户',
+    (False, True, False): '一般保持客户',
+    (False, False, False): '一般挽留客户',
+}
+
+
+def _month_index(day):
+    return day.year * 12 + day.month - 1
+
+
+def _month_label(index):
+    return f'{index // 12}-{index % 12 + 1:02d}'
+
+
+def _stream_orders(watermark, recent):
+    """
+    一次流式读取尚未计入的订单（水位之后的订单，以及水位之下 ID_LAG 以内不在 recent 中的订单），
+    返回 (订单ID列表, 用户ID, 日期序数, 月份序号, 金额分) 数组
+    """
+    ids, users, days, months, cents = [], [], [], [], []
+    # 金额由数据库直接返回整数分，不逐行构造 Decimal
+    # 按地区分片时逐库读取，开启分片后的订单ID由 IdSequence 统一分配，水位对所有库通用
+    orders = chain.from_iterable(
+        SalesOrder.objects.using(alias).filter(id__gt=watermark - ID_LAG).annotate(
+            total_cents=Cents('total_amount')
+        ).values_list('id', 'user_id', 'order_date', 'total_cents').iterator(chunk_size=5000)
+        for alias in sales_databases()
+    )
+    for order_id, user_id, order_date, total_cents in orders:
+        if order_id in recent:
+            continue
+        day = timezone.localdate(order_date)
+        ids.append(order_id)
+        users.append(user_id)
+        days.append(day.toordinal())
+        months.append(_month_index(day))
+        cents.append(total_cents)
+    return (
+        ids,
+        np.array(users, dtype=np.int64),
+        np.array(days, dtype=np.int64),
+        np.array(months, dtype=np.int64),
+        cents_array(cents),
+    )
+
+
+def _apply_new_orders(watermark, recent):
+    """
+    把新订单按用户聚合后合并进 CustomerStats，只读写有新订单的用户，
+    返回 (新水位, 水位之下 ID_LAG 以内已计入的订单ID列表, 用户数)
+    """
+    ids, users, days, months, cents = _stream_orders(watermark, frozenset(recent))
+    watermark, recent = advance_watermark(watermark, recent, ids)
+    if not ids:
+        return watermark, recent, 0
+    
+    user_ids, inverse = np.unique(users, return_inverse=True)
+    n = len(user_ids)
+    first = np.full(n, np.iinfo(np.int64).max)
+    last = np.full(n, np.iinfo(np.int64).min)
+    np.minimum.at(first, inverse, days)
+    np.maximum.at(last, inverse, days)
+    frequency = np.bincount(inverse, minlength=n)
+    # 整数分精确累加（bincount 的权重会转为 float64）
+    monetary = np.zeros(n, dtype=np.int64)
+    np.add.at(monetary, inverse, cents)
+    active = np.unique(np.stack([inverse, months], axis=1), axis=0)
+    split = np.searchsorted(active[:, 0], np.arange(1, n))
+    active_months = np.split(active[:, 1], split)
+    
+    existing = {}
+    user_list = user_ids.tolist()
+    for start in range(0, n, 1000):
+        for stats in CustomerStats.objects.filter(user_id__in=user_list[start:start + 1000]):
+            existing[stats.user_id] = stats
+    
+    now = timezone.now()
+    to_create, to_update = [], []
+    for i, user_id in enumerate(user_list):
+        first_day = datetime.date.fromordinal(int(first[i]))
+        last_day = datetime.date.fromordinal(int(last[i]))
+        amount = from_cents(monetary[i])
+        stats = existing.get(user_id)
+        if stats is None:
+            to_create.append(CustomerStats(
+                user_id=user_id, first_order_date=first_day, last_order_date=last_day,
+                frequency=int(frequency[i]), monetary=amount,
+                active_months=active_months[i].tolist()
+            ))
+            continue
+        stats.first_order_date = min(stats.first_order_date, first_day)
+        stats.last_order_date = max(stats.last_order_date, last_day)
+        stats.frequency += int(frequency[i])
+        stats.monetary += amount
+        stats.active_months = sorted(set(stats.active_months).union(active_months[i].tolist()))
+        stats.updated_at = now
+        to_update.append(stats)
+    
+    CustomerStats.objects.bulk_create(to_create, batch_size=1000)
+    CustomerStats.objects.bulk_update(
+        to_update,
+        ['first_order_date', 'last_order_date', 'frequency', 'monetary', 'active_months', 'updated_at'],
+        batch_size=1000
+    )
+    return watermark, recent, n
+
+
+def _score(values):
+    """按百分位排名把数值映射为 1-5 分"""
+    return np.clip(np.ceil(rankdata(values) / len(values) * 5), 1, 5).astype(int)
+
+
+def _build_snapshots(watermark, today):
+    """基于每用户一行的统计表向量化生成 RFM 与同期群快照"""
+    rows = list(CustomerStats.objects.annotate(monetary_cents=Cents('monetary')).values_list(
+        'user_id', 'user__username', 'last_order_date', 'first_order_date',
+        'frequency', 'monetary_cents', 'active_months'
+    ).order_by('user_id'))
+    
+    rfm = {'as_of': today.isoformat(), 'segments': [], 'customers': []}
+    cohorts = {'as_of': today.isoformat(), 'cohorts': []}
+    if rows:
+        recency = today.toordinal() - np.array([row[2].toordinal() for row in rows])
+        frequency = np.array([row[4] for row in rows])
+        monetary = cents_array(row[5] for row in rows)
+        r_score, f_score, m_score = _score(-recency), _score(frequency), _score(monetary)
+        # 与均值比较划分高低，得到八类客户
+        r_high = recency < recency.mean()
+        f_high = frequency > frequency.mean()
+        m_high = monetary > monetary.mean()
+        
+        segments = [SEGMENTS[key] for key in zip(r_high.tolist(), f_high.tolist(), m_high.tolist())]
+        rfm['customers'] = [
+            {
+                'user_id': row[0],
+                'username': row[1],
+                'recency': int(recency[i]),
+                'frequency': int(frequency[i]),
+                'monetary': round(int(monetary[i]) / 100, 2),
+                'r_score': int(r_score[i]),
+                'f_score': int(f_score[i]),
+                'm_score': int(m_score[i]),
+                'segment': segments[i],
+            }
+            for i, row in enumerate(rows)
+        ]
+        names, counts = np.unique(segments, return_counts=True)
+        rfm['segments'] = sorted([
+            {
+                'segment': str(name),
+                'customer_count': int(count),
+                'percentage': round(float(count) / len(rows) * 100, 2),
+            }
+            for name, count in zip(names, counts)
+        ], key=lambda item: -item['customer_count'])
+        
+        # 同期群：按首单月份分组，统计此后每个月仍有下单的客户数
+        cohort_of_user = np.array([_month_index(row[3]) for row in rows])
+        lengths = [len(row[6]) for row in rows]
+        active = np.fromiter(chain.from_iterable(row[6] for row in rows), dtype=np.int64, count=sum(lengths))
+        periods = active - np.repeat(cohort_of_user, lengths)
+        cohort_months, cohort_pos = np.unique(cohort_of_user, return_inverse=True)
+        matrix = np.zeros((len(cohort_months), int(periods.max()) + 1), dtype=np.int64)
+        np.add.at(matrix, (np.repeat(cohort_pos, lengths), periods), 1)
+        sizes = np.bincount(cohort_pos)
+        last_month = _month_index(today)
+        for i, month in enumerate(cohort_months.tolist()):
+            span = max(last_month - month + 1, 1)
+            active_counts = matrix[i, :span].tolist()
+            cohorts['cohorts'].append({
+                'cohort': _month_label(month),
+                'size': int(sizes[i]),
+                'active_customers': active_counts,
+                'retention': [round(count / sizes[i] * 100, 2) for count in active_counts],
+            })
+    
+    for name, payload in ((RFM_SNAPSHOT, rfm), (COHORT_SNAPSHOT, cohorts)):
+        AnalyticsSnapshot.objects.update_or_create(
+            name=name, defaults={'payload': payload, 'watermark': watermark}
+        )
+
+
+def refresh_customer_analytics(full=False, today=None):
+    """增量刷新客户统计与快照，返回本次更新的用户数"""
+    today = today or timezone.localdate()
+    with transaction.atomic():
+        # 锁住水位行，避免并发刷新重复累计同一批订单；水位行之前的版本把水位记在 RFM 快照中
+        cursor, _ = AnalyticsSnapshot.objects.get_or_create(name=ORDERS_CURSOR, defaults={
+            'payload': {'recent': []},
+            'watermark': AnalyticsSnapshot.objects.filter(name=RFM_SNAPSHOT).values_list(
+                'watermark', flat=True
+            ).first() or 0,
+        })
+        cursor = AnalyticsSnapshot.objects.select_for_update().get(pk=cursor.pk)
+        watermark, recent = cursor.watermark, cursor.payload['recent']
+        if full:
+            CustomerStats.objects.all().delete()
+            watermark, recent = 0, []
+        
+        watermark, recent, touched = _apply_new_orders(watermark, recent)
+        cursor.watermark, cursor.payload = watermark, {'recent': recent}
+        cursor.save()
+        _build_snapshots(watermark, today)
+    return touched
+
+
+def customer_snapshot(name):
+    """读取客户分析快照，尚未由 refresh_customer_analytics 生成时返回 None（全量计算不在请求中执行）"""
+    snapshot = AnalyticsSnapshot.objects.filter(name=name).first()
+    if snapshot is None or not snapshot.payload:
+        return None
+    return snapshot.payload
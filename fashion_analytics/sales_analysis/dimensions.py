@@ -0,0 +1,106 @@
+"""
+维度表（地区、服装类型、价格区间、评价类别）的进程内缓存。
+
+这几张小表几乎出现在每个聚合与序列化器中：按 region__name 等关联字段分组会让热点查询多一次 JOIN，
+ReadOnlyField(source='region.name') 在没有 select_related 时还会逐行查询。这里把整张表读入进程内存，
+聚合按外键 ID 分组后在内存中解析名称。维度表的任何写入（包括批量 update、bulk_create）提交后表版本号增加
+（见 versions.py），各进程读取时发现版本变化即重新加载。
+"""
+import threading
+
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+
+from .models import Region, ClothingType, PriceRange, RatingCategory
+from .versions import table_versions
+
+# 各维度表在内存中的排列顺序（价格区间按价格从低到高）
+DIMENSION_ORDERING = {
+    Region: ('id',),
+    ClothingType: ('id',),
+    PriceRange: ('min_price', 'id'),
+    RatingCategory: ('id',),
+}
+
+_tables = {}
+_tables_lock = threading.Lock()
+# _table 未传入版本号时自行查询
+_UNREAD = object()
+
+
+def dimension_version(model):
+    """
+    维度表的版本，表中数据写入提交后变化；带上写入时间，版本表被清空后重新计数时也不会与旧版本混淆。
+    尚未记录过写入的表返回 None，此时不缓存
+    """
+    return _version(table_versions([model]), model)
+
+
+def _version(versions, model):
+    version, updated_at = versions[model._meta.label]
+    return None if updated_at is None else (version, updated_at)
+
+
+def _table(model, version=_UNREAD):
+    if version is _UNREAD:
+        version = dimension_version(model)
+    cached = _tables.get(model)
+    if cached and version is not None and cached[0] == version:
+        return cached[1]
+    
+    with _tables_lock:
+        cached = _tables.get(model)
+        if cached and version is not None and cached[0] == version:
+            return cached[1]
+        rows = list(model.objects.order_by(*DIMENSION_ORDERING[model]).values())
+        table = (rows, {row['id']: row['name'] for row in rows})
+        if version is not None:
+            _tables[model] = (version, table)
+        return table
+
+
+def dimension_rows(model):
+    """维度表的全部行（字典，按 DIMENSION_ORDERING 排列），调用方不应修改"""
+    return _table(model)[0]
+
+
+def dimension_names(model):
+    """维度表的 {ID: 名称}"""
+    return _table(model)[1]
+
+
+def dimension_names_many(models):
+    """多张维度表的 {模型: {ID: 名称}}，各表版本号合并为一次查询"""
+    models = list(dict.fromkeys(models))
+    versions = table_versions(models)
+    return {model: _table(model, _version(versions, model))[1] for model in models}
+
+
+class DimensionNameField(serializers.ReadOnlyField):
+    """
+    按外键 ID 从维度缓存解析名称的只读字段，用法：DimensionNameField(Region, source='region_id')。
+    外键为空时与 ReadOnlyField(source='region.name') 一样省略该键。
+    """
+    
+    def __init__(self, model, **kwargs):
+        self.model = model
+        self._names = None
+        super().__init__(**kwargs)
+    
+    def get_attribute(self, instance):
+        value = super().get_attribute(instance)
+        if value is None:
+            raise SkipField()
+        return value
+    
+    def to_representation(self, value):
+        # 同一次序列化内只读取一次维度缓存；同一序列化器上的维度字段一起解析，版本号只查询一次
+        if self._names is None:
+            fields = [
+                field for field in getattr(self.parent, 'fields', {}).values()
+                if isinstance(field, DimensionNameField) and field._names is None
+            ] or [self]
+            names = dimension_names_many(field.model for field in fields)
+            for field in fields:
+                field._names = names[field.model]
+        return self._names.get(value)
@@ -0,0 +1,284 @@
+"""
+DuckDB 分析后端（需安装 duckdb）。
+
+行存数据库上的大范围 GROUP BY 要逐行读取整张订单、条目或评价表。这里把分析用到的列按主键水位
+增量导出为 Parquet 分片，由进程内嵌的 DuckDB 列式向量化执行地区、服装类型、价格区间、评价分布与
+销售趋势的聚合，返回与 ORM 查询相同结构的行，视图后续的名称解析、归档合并与序列化不变。
+ANALYTICS_BACKENDS 按接口选择后端，未安装 duckdb 时一律使用 ORM。
+
+导出只由 sync_analytics_parquet 命令执行（可定时或 --loop 持续运行），处理请求时不写文件：
+清单记录导出前表的版本号与修改版本号（见 versions.py），查询时表的版本号未变则直接使用分片，
+只有新增时在分片之外从数据库补齐尚未导出的行（主键水位之后的新行，以及水位之下较晚提交的行，
+见 columns.py），已有行被修改或删除、尚未导出过时返回 None，
+由视图改用 ORM 查询；下次同步时全量重写。
+金额列为整数分（见 money.py），时间列为 UTC 微秒时间戳。
+"""
+import json
+import os
+import threading
+import uuid
+
+import pandas as pd
+from django.conf import settings
+
+from .models import SalesOrder, OrderItem, Rating
+from .money import Cents, from_cents
+from .singleflight import process_lock
+from .sharding import sharding_enabled
+from .columns import EPOCH, MICROSECOND, advance_watermark, to_micros, unseen_rows
+from .versions import modified_label, table_versions
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# 分片数超过该值时合并为一个文件
+MAX_PARTS = 32
+
+# 表名: (模型, 时间列, [(列名, 查询字段或表达式)])
+PARQUET_TABLES = {
+    'orders': (SalesOrder, 'order_ts', [
+        ('id', 'id'), ('region_id', 'region_id'),
+        ('order_ts', 'order_date'), ('total_cents', Cents('total_amount')),
+    ]),
+    'items': (OrderItem, 'order_ts', [
+        ('id', 'id'), ('clothing_type_id', 'clothing_type_id'), ('price_range_id', 'price_range_id'),
+        ('order_ts', 'order_date'), ('line_cents', Cents('line_total')),
+    ]),
+    'ratings': (Rating, 'created_ts', [
+        ('id', 'id'), ('category_id', 'category_id'), ('created_ts', 'created_at'),
+    ]),
+}
+
+_local = threading.local()
+
+
+def analytics_backend(endpoint):
+    """接口使用的分析后端：'duckdb' 或 'orm'；按地区分片时 Parquet 只能导出默认库，一律使用 ORM"""
+    backend = settings.ANALYTICS_BACKENDS.get(endpoint, 'orm')
+    if sharding_enabled():
+        return 'orm'
+    return 'duckdb' if backend == 'duckdb' and duckdb is not None else 'orm'
+
+
+def _connection():
+    # DuckDB 连接不能在线程间并发使用，每个线程一个内存连接
+    if getattr(_local, 'connection', None) is None:
+        _local.connection = duckdb.connect()
+    return _local.connection
+
+
+def _table_dir(name):
+    return os.path.join(settings.ANALYTICS_DATA_DIR, 'parquet', name)
+
+
+def _read_manifest(name):
+    try:
+        with open(os.path.join(_table_dir(name), 'manifest.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_manifest(name, manifest):
+    path = os.path.join(_table_dir(name), 'manifest.json')
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+
+def _export_rows(model, columns, manifest):
+    """导出清单之后尚未导出的行为 DataFrame，时间列转为微秒时间戳，空值保留"""
+    names, rows = unseen_rows(model, columns, manifest['max_id'], manifest['recent'])
+    frame = pd.DataFrame(list(rows), columns=names)
+    for name in names:
+        if name.endswith('_ts'):
+            frame[name] = (pd.to_datetime(frame[name], utc=True) - EPOCH) // MICROSECOND
+        frame[name] = frame[name].astype('Int64')
+    return frame
+
+
+def _versions(model):
+    """表的 (版本号, 修改版本号)"""
+    versions = table_versions([model, modified_label(model)])
+    return versions[model._meta.label][0], versions[modified_label(model)][0]
+
+
+def _paths(name, manifest):
+    return [os.path.join(_table_dir(name), part) for part in manifest['parts']]
+
+
+def _write_part(name, query, frame=None):
+    """把查询结果写为新的 Parquet 分片，返回文件名"""
+    part = f'part-{uuid.uuid4().hex}.parquet'
+    path = os.path.join(_table_dir(name), part)
+    connection = _connection()
+    if frame is not None:
+        connection.register('export_frame', frame)
+    try:
+        connection.execute(f"COPY ({query}) TO '{path}.tmp' (FORMAT PARQUET)")
+    finally:
+        if frame is not None:
+            connection.unregister('export_frame')
+    os.replace(path + '.tmp', path)
+    return part
+
+
+def sync_table(name, full=False):
+    """把新增行追加为 Parquet 分片，已有行被修改或删除、或 full=True 时全量重写，返回清单"""
+    model, _, columns = PARQUET_TABLES[name]
+    os.makedirs(_table_dir(name), exist_ok=True)
+    with process_lock(f'parquet-sync:{name}', settings.SINGLE_FLIGHT_TIMEOUT) as acquired:
+        manifest = _read_manifest(name)
+        if not acquired and manifest is not None:
+            # 其他进程长时间占用同步锁时先使用已有分片
+            return manifest
+        # 导出前读取版本号：导出期间的写入会在下次同步或查询时被发现，而不是被漏掉
+        version, modified = _versions(model)
+        if not full and manifest and manifest.get('version') == version:
+            return manifest
+        
+        obsolete = []
+        if full or manifest is None or manifest.get('modified') != modified:
+            obsolete = manifest['parts'] if manifest else []
+            manifest = {'max_id': 0, 'recent': [], 'rows': 0, 'parts': []}
+        
+        frame = _export_rows(model, columns, manifest)
+        parts = list(manifest['parts'])
+        if len(frame):
+            parts.append(_write_part(name, 'SELECT * FROM export_frame', frame=frame))
+        if len(parts) > MAX_PARTS:
+            # 合并小分片，按主键排序写成一个文件
+            files = ', '.join(f"'{path}'" for path in _paths(name, {'parts': parts}))
+            merged = _write_part(name, f'SELECT * FROM read_parquet([{files}]) ORDER BY id')
+            obsolete += parts
+            parts = [merged]
+        
+        max_id, recent = advance_watermark(manifest['max_id'], manifest['recent'], frame['id'].astype(int).tolist())
+        manifest = {
+            'max_id': max_id,
+            'recent': recent,
+            'rows': manifest['rows'] + len(frame),
+            'version': version,
+            'modified': modified,
+            'parts': parts,
+        }
+        _write_manifest(name, manifest)
+        # 正在查询旧分片的进程已打开文件，删除不影响其完成
+        for part in obsolete:
+            if part not in parts:
+                try:
+                    os.remove(os.path.join(_table_dir(name), part))
+                except FileNotFoundError:
+                    pass
+        return manifest
+
+
+def sync_all(full=False):
+    return {name: sync_table(name, full=full) for name in PARQUET_TABLES}
+
+
+def _query(name, select, start, end, group_by, order_by=None):
+    """
+    在表的已导出分片与之后的新增行上执行聚合，返回字典行列表；
+    尚未导出过或已有行被修改、删除后返回 None
+    """
+    manifest = _read_manifest(name)
+    if manifest is None:
+        return None
+    model, time_column, columns = PARQUET_TABLES[name]
+    version, modified = _versions(model)
+    if manifest.get('modified') != modified:
+        return None
+    
+    sources = []
+    if manifest['parts']:
+        files = ', '.join(f"'{path}'" for path in _paths(name, manifest))
+        sources.append(f'SELECT * FROM read_parquet([{files}])')
+    tail = None
+    if manifest.get('version') != version:
+        # 只有新增：补齐尚未导出的行
+        tail = _export_rows(model, columns, manifest)
+        if len(tail):
+            sources.append('SELECT * FROM tail_frame')
+    if not sources:
+        return []
+    
+    conditions, params = [], []
+    if start:
+        conditions.append(f'{time_column} >= ?')
+        params.append(to_micros(start))
+    if end:
+        conditions.append(f'{time_column} < ?')
+        params.append(to_micros(end))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    order = f'ORDER BY {order_by}' if order_by else ''
+    source = ' UNION ALL '.join(sources)
+    sql = f'SELECT {select} FROM ({source}) {where} GROUP BY {group_by} {order}'
+    connection = _connection()
+    if tail is not None:
+        connection.register('tail_frame', tail)
+    try:
+        cursor = connection.execute(sql, params)
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+    finally:
+        if tail is not None:
+            connection.unregister('tail_frame')
+
+
+def _sales_rows(rows, key):
+    if rows is None:
+        return None
+    return [
+        {key: row[key], 'total_sales': from_cents(row['total']) if row['total'] is not None else None,
+         'order_count': row['order_count']}
+        for row in rows
+    ]
+
+
+def region_sales(start=None, end=None):
+    """按地区汇总订单金额与订单数，按销售额降序（与 ORM 的 values('region_id').annotate 一致）"""
+    rows = _query(
+        'orders', 'region_id, SUM(total_cents) AS total, COUNT(id) AS order_count',
+        start, end, 'region_id', 'total DESC NULLS LAST, region_id'
+    )
+    return _sales_rows(rows, 'region_id')
+
+
+def clothing_type_sales(start=None, end=None):
+    """按服装类型汇总条目金额与条目数，按销售额降序"""
+    rows = _query(
+        'items', 'clothing_type_id, SUM(line_cents) AS total, COUNT(id) AS order_count',
+        start, end, 'clothing_type_id', 'total DESC NULLS LAST, clothing_type_id'
+    )
+    return _sales_rows(rows, 'clothing_type_id')
+
+
+def price_range_sales(start=None, end=None):
+    """按价格区间汇总条目金额与条目数"""
+    rows = _query(
+        'items', 'price_range_id, SUM(line_cents) AS total, COUNT(id) AS order_count',
+        start, end, 'price_range_id'
+    )
+    return _sales_rows(rows, 'price_range_id')
+
+
+def rating_distribution(start=None, end=None):
+    """按评价类别统计评价数，按数量降序"""
+    return _query(
+        'ratings', 'category_id, COUNT(id) AS rating_count',
+        start, end, 'category_id', 'rating_count DESC, category_id'
+    )
+
+
+def sales_by_date():
+    """按订单时间汇总的销售额 DataFrame（order_date, daily_cents），与 SalesForecastView 的 ORM 查询一致"""
+    rows = _query('orders', 'order_ts, SUM(total_cents) AS daily_cents', None, None, 'order_ts', 'order_ts')
+    if rows is None:
+        return None
+    return pd.DataFrame({
+        'order_date': pd.to_datetime([row['order_ts'] for row in rows], unit='us', utc=True),
+        'daily_cents': pd.array([row['daily_cents'] for row in rows], dtype='int64'),
+    })
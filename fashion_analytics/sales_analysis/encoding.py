@@ -0,0 +1,50 @@
+"""
+图表接口的紧凑响应格式。
+
+默认仍按 Serializer 逐行输出；带 layout=columnar 时改为列式结构
+{"columns": [...], "data": {列名: [值, ...]}}，数值列输出为数字数组而不是字符串，
+跳过逐行逐字段的 Serializer 调用，适合趋势、导出等大结果集。
+"""
+from decimal import Decimal
+
+from rest_framework import serializers
+from rest_framework.response import Response
+
+COLUMNAR = 'columnar'
+
+
+def _number(value):
+    return float(value) if isinstance(value, Decimal) else value
+
+
+def _column(field, values):
+    """按字段类型整列转换"""
+    if isinstance(field, (serializers.DecimalField, serializers.FloatField)):
+        return [None if value is None else float(value) for value in values]
+    if isinstance(field, serializers.IntegerField):
+        return [None if value is None else int(value) for value in values]
+    if isinstance(field, serializers.CharField):
+        return values
+    if isinstance(field, serializers.ListField):
+        return [None if value is None else [_number(v) for v in value] for value in values]
+    return [None if value is None else field.to_representation(value) for value in values]
+
+
+def columnar(rows, serializer_class):
+    """把字典行列表按 Serializer 声明的字段顺序转换为列式结构"""
+    fields = serializer_class().fields
+    return {
+        'columns': list(fields),
+        'data': {
+            name: _column(field, [row.get(name) for row in rows])
+            for name, field in fields.items()
+        }
+    }
+
+
+def chart_response(request, rows, serializer_class):
+    """按 layout 参数返回逐行或列式的图表数据"""
+    if request.query_params.get('layout') == COLUMNAR:
+        return Response(columnar(rows, serializer_class))
+    serializer = serializer_class(rows, many=True)
+    return Response(serializer.data)
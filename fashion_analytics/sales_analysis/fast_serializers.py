@@ -0,0 +1,158 @@
+"""
+只读列表接口的快速序列化。
+
+DRF 的 ModelSerializer 对每一行都要实例化模型、逐字段取属性并调用字段的 to_representation，
+大分页时这部分开销占了列表接口的大部分 CPU。这里根据现有 Serializer 的字段声明预先算出
+.values() 查询列与每个字段的转换函数，直接由字典行构建输出，结构与原 Serializer 完全一致。
+嵌套的 many=True 子序列化器（如订单的 items）按本页主键一次查询取回。
+"""
+from collections import defaultdict
+
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .dimensions import DimensionNameField
+
+
+def _identity(value):
+    return value
+
+
+def _decimal_converter(field):
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce_to_string or field.decimal_places is None or field.normalize_output or field.localize:
+        return field.to_representation
+    # 数据库中的值已是相同小数位，格式化结果与 quantize 一致
+    places = field.decimal_places
+    return lambda value: f'{value:.{places}f}'
+
+
+def _datetime_converter(field):
+    if getattr(field, 'format', None) is not None or getattr(field, 'timezone', None) is not None:
+        return field.to_representation
+    tz = field.default_timezone()
+    
+    def convert(value):
+        if tz is not None and value.tzinfo is not None:
+            value = value.astimezone(tz)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+def _file_converter(field, model_field):
+    if not getattr(field, 'use_url', True):
+        return _identity
+    storage = model_field.storage
+    request = field.context.get('request')
+    if request is None:
+        return lambda name: storage.url(name) if name else None
+    return lambda name: request.build_absolute_uri(storage.url(name)) if name else None
+
+
+class ValuesSerializer:
+    """
+    按现有 Serializer 的字段生成快速只读序列化器（传入类或已绑定的序列化器实例）。
+    lookups 为 .values() 需要查询的列，to_representation(rows) 把字典行转换为输出。
+    """
+    
+    def __init__(self, serializer_class, context=None):
+        if isinstance(serializer_class, type):
+            serializer = serializer_class(context=context or {})
+        else:
+            serializer, serializer_class = serializer_class, type(serializer_class)
+        self.model = serializer_class.Meta.model
+        # (输出名, values 列名, 转换函数, 关联为空时是否省略该键)，嵌套字段的列名为 None
+        self.columns = []
+        # (输出名, 子快速序列化器, 子表指向本表的外键列)
+        self.nested = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.ListSerializer):
+                relation = self.model._meta.get_field(field.source)
+                # 子序列化器已绑定到父序列化器，不受 fields / exclude 参数裁剪
+                child = ValuesSerializer(field.child, context)
+                self.nested.append((name, child, relation.field.attname))
+                self.columns.append((name, None, None, False))
+            else:
+                self.columns.append(self._column(name, field))
+        self.lookups = list(dict.fromkeys(
+            [lookup for _, lookup, _, _ in self.columns if lookup] + ['pk']
+        ))
+    
+    def _column(self, name, field):
+        path = field.source.split('.')
+        model_field = self.model._meta.get_field(path[0])
+        if isinstance(field, DimensionNameField):
+            # 维度名称按外键 ID 在内存中解析，不关联维度表；外键为空时省略该键
+            return name, path[0], field.to_representation, True
+        if len(path) > 1:
+            # ReadOnlyField(source='关联.字段')：关联为空时 DRF 省略该键
+            return name, '__'.join(path), _identity, model_field.null
+        if isinstance(field, serializers.PrimaryKeyRelatedField):
+            return name, model_field.attname, _identity, False
+        if isinstance(field, serializers.DecimalField):
+            return name, path[0], _decimal_converter(field), False
+        if isinstance(field, serializers.DateTimeField):
+            return name, path[0], _datetime_converter(field), False
+        if isinstance(field, serializers.FileField):
+            return name, path[0], _file_converter(field, model_field), False
+        if isinstance(field, (serializers.IntegerField, serializers.CharField, serializers.BooleanField)):
+            if getattr(field, 'coerce_to_string', False):
+                return name, path[0], field.to_representation, False
+            return name, path[0], _identity, False
+        return name, path[0], field.to_representation, False
+    
+    def to_representation(self, rows):
+        rows = list(rows)
+        children = {
+            name: self._children(child, attname, rows)
+            for name, child, attname in self.nested
+        }
+        columns = self.columns
+        result = []
+        for row in rows:
+            item = {}
+            for name, lookup, convert, optional in columns:
+                if lookup is None:
+                    item[name] = children[name].get(row['pk'], [])
+                    continue
+                value = row[lookup]
+                if value is None:
+                    if not optional:
+                        item[name] = None
+                else:
+                    item[name] = convert(value)
+            result.append(item)
+        return result
+    
+    def _children(self, child, attname, rows):
+        """一次查询取回本页所有行的子记录，按外键分组"""
+        keys = [row['pk'] for row in rows]
+        grouped = defaultdict(list)
+        if not keys:
+            return grouped
+        child_rows = list(child.model._default_manager.filter(
+            **{f'{attname}__in': keys}
+        ).order_by('pk').values(*dict.fromkeys(child.lookups + [attname])))
+        for row, item in zip(child_rows, child.to_representation(child_rows)):
+            grouped[row[attname]].append(item)
+        return grouped
+
+
+class FastListMixin:
+    """视图集的列表接口改用 ValuesSerializer，输出结构与 serializer_class 相同"""
+    
+    def list(self, request, *args, **kwargs):
+        fast = ValuesSerializer(self.get_serializer_class(), self.get_serializer_context())
+        # 嵌套字段由 ValuesSerializer 按本页主键查询，不使用 get_queryset 中的 prefetch_related
+        rows = self.filter_queryset(self.get_queryset()).prefetch_related(None).values(*fast.lookups)
+        
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(fast.to_representation(page))
+        return Response(fast.to_representation(rows))
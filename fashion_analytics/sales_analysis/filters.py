@@ -0,0 +1,43 @@
+"""分析接口的公共查询参数解析"""
+import datetime
+
+from django.utils import timezone
+
+
+def is_true(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def _parse_date(value, name):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name}参数格式应为YYYY-MM-DD')
+
+
+def _start_of(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def date_window(params):
+    """
+    解析 start_date / end_date（YYYY-MM-DD，均包含当天），
+    返回带时区的 [start, end) 区间，未指定的一端为 None
+    """
+    start = params.get('start_date')
+    end = params.get('end_date')
+    start = _start_of(_parse_date(start, 'start_date')) if start else None
+    end = _start_of(_parse_date(end, 'end_date') + datetime.timedelta(days=1)) if end else None
+    if start and end and start >= end:
+        raise ValueError('start_date不能晚于end_date')
+    return start, end
+
+
+def window_filter(field, start, end):
+    """把时间区间转换为 ORM 过滤条件"""
+    lookups = {}
+    if start:
+        lookups[f'{field}__gte'] = start
+    if end:
+        lookups[f'{field}__lt'] = end
+    return lookups
@@ -0,0 +1,182 @@
+"""
+库存分析：订单条目写入时原子扣减库存，维护每个商品的滚动销售速度，
+并基于全部商品的库存与销售速度一次性向量化预测缺货时间。
+"""
+import datetime
+from collections import defaultdict
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import ClothingType, Clothing, OrderItem, SalesVelocity
+from .dimensions import dimension_names
+from .signals import order_items_created
+from .sharding import sales_databases
+
+# 滚动窗口天数，每个商品固定占用 VELOCITY_WINDOW_DAYS 个 int32 桶
+VELOCITY_WINDOW_DAYS = 28
+BUCKET_DTYPE = np.int32
+# 超过该天数的缺货预测不再给出具体日期
+MAX_FORECAST_DAYS = 3650
+
+
+def _empty_buckets():
+    return np.zeros(VELOCITY_WINDOW_DAYS, dtype=BUCKET_DTYPE)
+
+
+def decrement_stock(items):
+    """按商品汇总数量后用 F 表达式在数据库内原子扣减库存，扣减量相同的商品合并为一条 UPDATE"""
+    quantities = defaultdict(int)
+    for item in items:
+        quantities[item.clothing_id] += item.quantity
+    
+    by_quantity = defaultdict(list)
+    for clothing_id, quantity in quantities.items():
+        by_quantity[quantity].append(clothing_id)
+    
+    for quantity, clothing_ids in by_quantity.items():
+        Clothing.objects.filter(pk__in=clothing_ids).update(stock=F('stock') - quantity)
+
+
+def _advance(buckets, last_day, day):
+    """把环形缓冲区推进到 day，清空被跨过的过期桶"""
+    gap = (day - last_day).days
+    if gap >= VELOCITY_WINDOW_DAYS:
+        buckets[:] = 0
+    elif gap > 0:
+        stale = (last_day.toordinal() + np.arange(1, gap + 1)) % VELOCITY_WINDOW_DAYS
+        buckets[stale] = 0
+
+
+def record_sales(quantities):
+    """
+    把销量累加进滚动窗口。
+    quantities: {(clothing_id, 日期): 数量}，每个商品只读写一行
+    """
+    per_clothing = defaultdict(dict)
+    for (clothing_id, day), quantity in quantities.items():
+        per_clothing[clothing_id][day] = per_clothing[clothing_id].get(day, 0) + quantity
+    if not per_clothing:
+        return
+    
+    with transaction.atomic():
+        # 先补齐缺失的行（并发时由唯一约束去重），再统一加行锁读改写
+        existing = set(SalesVelocity.objects.filter(
+            clothing_id__in=per_clothing
+        ).values_list('clothing_id', flat=True))
+        SalesVelocity.objects.bulk_create([
+            SalesVelocity(clothing_id=clothing_id, last_day=min(days), buckets=_empty_buckets().tobytes())
+            for clothing_id, days in per_clothing.items() if clothing_id not in existing
+        ], ignore_conflicts=True)
+        
+        rows = SalesVelocity.objects.select_for_update().filter(clothing_id__in=per_clothing)
+        now = timezone.now()
+        changed = []
+        for velocity in rows:
+            buckets = np.frombuffer(bytes(velocity.buckets), dtype=BUCKET_DTYPE).copy()
+            last_day = velocity.last_day
+            for day, quantity in sorted(per_clothing[velocity.clothing_id].items()):
+                if day > last_day:
+                    _advance(buckets, last_day, day)
+                    last_day = day
+                elif (last_day - day).days >= VELOCITY_WINDOW_DAYS:
+                    continue  # 已滑出窗口
+                buckets[day.toordinal() % VELOCITY_WINDOW_DAYS] += quantity
+            velocity.last_day = last_day
+            velocity.buckets = buckets.tobytes()
+            velocity.updated_at = now
+            changed.append(velocity)
+        SalesVelocity.objects.bulk_update(changed, ['last_day', 'buckets', 'updated_at'])
+
+
+@receiver(order_items_created)
+def update_inventory(sender, items, **kwargs):
+    """订单条目创建后扣减库存并更新销售速度"""
+    decrement_stock(items)
+    
+    quantities = defaultdict(int)
+    for item in items:
+        quantities[(item.clothing_id, timezone.localdate(item.order_date))] += item.quantity
+    record_sales(quantities)
+
+
+def rebuild_velocity(today=None):
+    """根据窗口内的历史订单条目重建全部销售速度（用于初始化或批量导入之后）"""
+    today = today or timezone.localdate()
+    start = today - datetime.timedelta(days=VELOCITY_WINDOW_DAYS - 1)
+    start_dt = timezone.make_aware(datetime.datetime.combine(start, datetime.time.min))
+    
+    per_clothing = defaultdict(_empty_buckets)
+    last_days = {}
+    for alias in sales_databases():
+        items = OrderItem.objects.using(alias).filter(
+            order_date__gte=start_dt
+        ).values_list('clothing_id', 'order_date', 'quantity')
+        for clothing_id, order_date, quantity in items.iterator(chunk_size=5000):
+            day = timezone.localdate(order_date)
+            if day > today:
+                continue
+            per_clothing[clothing_id][day.toordinal() % VELOCITY_WINDOW_DAYS] += quantity
+            last_days[clothing_id] = max(day, last_days.get(clothing_id, day))
+    
+    with transaction.atomic():
+        SalesVelocity.objects.all().delete()
+        SalesVelocity.objects.bulk_create([
+            SalesVelocity(clothing_id=clothing_id, last_day=today, buckets=buckets.tobytes())
+            for clothing_id, buckets in per_clothing.items()
+        ], batch_size=1000)
+    return len(per_clothing)
+
+
+def stockout_forecast(today=None):
+    """
+    对全部商品一次向量化计算窗口内日均销量与预计缺货天数，
+    按缺货天数升序排列（无销量的商品排在最后）
+    """
+    today = today or timezone.localdate()
+    rows = list(Clothing.objects.values_list(
+        'id', 'name', 'clothing_type_id', 'stock', 'velocity__last_day', 'velocity__buckets'
+    ))
+    if not rows:
+        return []
+    
+    window = VELOCITY_WINDOW_DAYS
+    empty = _empty_buckets().tobytes()
+    buckets = np.frombuffer(
+        b''.join(bytes(row[5]) if row[5] is not None else empty for row in rows),
+        dtype=BUCKET_DTYPE
+    ).reshape(len(rows), window)
+    last = np.array([
+        row[4].toordinal() if row[4] is not None else today.toordinal() for row in rows
+    ], dtype=np.int64)
+    stock = np.array([row[3] for row in rows], dtype=np.float64)
+    
+    # 第 j 个桶对应的日期为 last - ((last - j) mod window)，只统计落在 (today - window, today] 内的桶
+    bucket_day = last[:, None] - ((last[:, None] - np.arange(window)) % window)
+    in_window = (bucket_day > today.toordinal() - window) & (bucket_day <= today.toordinal())
+    sold = np.where(in_window, buckets, 0).sum(axis=1)
+    velocity = sold / window
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_left = np.where(velocity > 0, np.maximum(stock, 0) / velocity, np.inf)
+    ranking = np.lexsort((-velocity, days_left))
+    
+    type_names = dimension_names(ClothingType)
+    result = []
+    for i in ranking:
+        clothing_id, name, type_id, stock_value = rows[i][:4]
+        finite = bool(np.isfinite(days_left[i]))
+        dated = finite and days_left[i] <= MAX_FORECAST_DAYS
+        result.append({
+            'clothing_id': clothing_id,
+            'clothing_name': name,
+            'clothing_type_name': type_names.get(type_id),
+            'stock': stock_value,
+            'daily_velocity': round(float(velocity[i]), 4),
+            'days_until_stockout': round(float(days_left[i]), 1) if finite else None,
+            'stockout_date': today + datetime.timedelta(days=int(days_left[i])) if dated else None,
+        })
+    return result
@@ -0,0 +1,256 @@
+"""
+实时销售推送（Server-Sent Events）。
+
+订单与订单条目提交后，把各地区、服装类型、价格区间的销售额与订单数增量发布到进程内的
+SalesFeed；每个 SSE 连接持有一个订阅，期间到达的增量在订阅内合并，
+每秒最多推送 LIVE_FEED_MAX_BATCHES_PER_SECOND 批，前端据此原地更新图表而不必重新请求。
+
+增量格式：{"region": {名称: [销售额, 订单数]}, "clothing_type": {...}, "price_range": {...}}，
+与分析接口的 total_sales / order_count 口径一致（地区按订单，类型与价格区间按订单条目）。
+ORDER_EVENTS_MODE 为 'outbox' 时订单可能由其他进程写入，改为轮询发件箱中新增的事件；
+按地区分片时事件写入订单所在的数据库，逐库轮询，每个库各自记录游标。自增ID按分配顺序而不是提交顺序
+可见，游标除事件水位外还记录水位之下跳过的ID，之后的轮询继续查询这些ID，补上较晚提交的事件。
+SSE 需要以 ASGI 方式运行（如 uvicorn fashion_analytics.asgi:application）。
+"""
+import asyncio
+import json
+import threading
+from itertools import chain
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.dispatch import receiver
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+
+from .models import Region, ClothingType, PriceRange, Clothing, OrderEvent
+from .dimensions import dimension_names
+from .outbox import event_objects
+from .sharding import sales_databases
+from .columns import ID_LAG
+from .signals import order_created, order_items_created
+
+DIMENSIONS = ('region', 'clothing_type', 'price_range')
+
+
+def merge_delta(target, delta):
+    """把增量 delta 累加进 target（原地修改并返回 target）"""
+    for dimension, rows in delta.items():
+        bucket = target.setdefault(dimension, {})
+        for name, (amount, count) in rows.items():
+            current = bucket.get(name, [0.0, 0])
+            bucket[name] = [round(current[0] + amount, 2), current[1] + count]
+    return target
+
+
+class Subscription:
+    """单个连接的订阅：发布方在任意线程累加增量，连接所在的事件循环按批取出"""
+    
+    def __init__(self, loop):
+        self._loop = loop
+        self._event = asyncio.Event()
+        self._lock = threading.Lock()
+        self._pending = None
+    
+    def push(self, delta):
+        with self._lock:
+            self._pending = merge_delta(self._pending or {}, delta)
+        try:
+            self._loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            # 事件循环已关闭，连接即将被清理
+            pass
+    
+    async def next_batch(self, timeout):
+        """等待下一批合并后的增量，超时返回 None"""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._event.clear()
+        with self._lock:
+            pending, self._pending = self._pending, None
+        return pending
+
+
+class SalesFeed:
+    """进程内的订阅中心"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+    
+    def has_subscribers(self):
+        return bool(self._subscriptions)
+    
+    def subscribe(self):
+        subscription = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+    
+    def publish(self, delta):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.push(delta)
+
+
+feed = SalesFeed()
+
+
+def orders_delta(rows):
+    """由 (地区ID, 订单金额) 列表计算地区增量"""
+    names = dimension_names(Region)
+    delta = {'region': {}}
+    for region_id, amount in rows:
+        if region_id in names:
+            merge_delta(delta, {'region': {names[region_id]: [amount, 1]}})
+    return delta
+
+
+def items_delta(rows):
+    """由 (商品ID, 条目金额) 列表计算服装类型与价格区间增量"""
+    type_names = dimension_names(ClothingType)
+    range_names = dimension_names(PriceRange)
+    names = {
+        clothing_id: (type_names.get(type_id), range_names.get(range_id))
+        for clothing_id, type_id, range_id in Clothing.objects.filter(
+            pk__in={clothing_id for clothing_id, _ in rows}
+        ).values_list('id', 'clothing_type_id', 'price_range_id')
+    }
+    delta = {'clothing_type': {}, 'price_range': {}}
+    for clothing_id, amount in rows:
+        type_name, range_name = names.get(clothing_id, (None, None))
+        for dimension, name in (('clothing_type', type_name), ('price_range', range_name)):
+            if name is not None:
+                merge_delta(delta, {dimension: {name: [amount, 1]}})
+    return delta
+
+
+def _order_rows(orders):
+    return [(order.region_id, float(order.total_amount)) for order in orders]
+
+
+def _item_rows(items):
+    return [(item.clothing_id, float(item.price) * item.quantity) for item in items]
+
+
+def _publish_on_commit(build_delta, rows):
+    """事务提交后再计算并发布增量，回滚的写入不会推送"""
+    transaction.on_commit(lambda: feed.publish(build_delta(rows)))
+
+
+# inline 模式：订单写入的进程内直接发布
+@receiver(order_created, dispatch_uid='live_orders')
+def publish_orders(sender, orders, **kwargs):
+    if feed.has_subscribers():
+        _publish_on_commit(orders_delta, _order_rows(orders))
+
+
+@receiver(order_items_created, dispatch_uid='live_order_items')
+def publish_items(sender, items, **kwargs):
+    if feed.has_subscribers():
+        _publish_on_commit(items_delta, _item_rows(items))
+
+
+# outbox 模式：订单可能由任意进程写入，推送进程轮询发件箱中新增的事件
+_outbox_tail = None
+
+
+def _latest_event_ids():
+    """各销售数据库从最新事件开始的游标，{数据库别名: (事件水位, 水位之下尚未出现的事件ID)}"""
+    return {
+        alias: (OrderEvent.objects.using(alias).aggregate(last=Max('id'))['last'] or 0, [])
+        for alias in sales_databases()
+    }
+
+
+def _publish_new_events(cursors):
+    """
+    发布各销售数据库中游标之后的事件增量，返回新的游标。
+    水位之下跳过的ID可能属于尚未提交的事务，每次轮询继续查询，低于水位 ID_LAG 后不再等待（回滚会留下永久的空缺）
+    """
+    orders, items = [], []
+    cursors = dict(cursors)
+    for alias in sales_databases():
+        watermark, gaps = cursors.get(alias, (0, []))
+        events = list(OrderEvent.objects.using(alias).filter(
+            Q(id__gt=watermark) | Q(id__in=gaps)
+        ).order_by('id')[:1000])
+        for event in events:
+            (orders if event.kind == OrderEvent.ORDER_CREATED else items).extend(event_objects(event))
+        seen = {event.id for event in events}
+        last = max(seen | {watermark})
+        skipped = range(max(watermark, last - ID_LAG) + 1, last + 1)
+        cursors[alias] = (last, [i for i in chain(gaps, skipped) if i not in seen and i > last - ID_LAG])
+    if orders:
+        feed.publish(orders_delta(_order_rows(orders)))
+    if items:
+        feed.publish(items_delta(_item_rows(items)))
+    return cursors
+
+
+async def _tail_outbox():
+    interval = 1 / settings.LIVE_FEED_MAX_BATCHES_PER_SECOND
+    cursors = await sync_to_async(_latest_event_ids)()
+    while feed.has_subscribers():
+        cursors = await sync_to_async(_publish_new_events)(cursors)
+        await asyncio.sleep(interval)
+
+
+def _ensure_outbox_tail():
+    """有订阅者时保持一个轮询任务，所有订阅者都断开后任务自行结束"""
+    global _outbox_tail
+    if _outbox_tail is None or _outbox_tail.done():
+        _outbox_tail = asyncio.get_running_loop().create_task(_tail_outbox())
+
+
+@sync_to_async
+def authenticate_token(raw_token):
+    """校验 access token 并返回用户，失败返回 None（EventSource 无法设置 Authorization 请求头）"""
+    if not raw_token:
+        return None
+    authentication = JWTAuthentication()
+    try:
+        user = authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    return user if user.is_active else None
+
+
+def _message(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+async def sales_event_stream():
+    """
+    SSE 消息流：增量以 sales 事件推送，空闲时发送注释行保活。
+    连接在 LIVE_FEED_MAX_SECONDS 后主动结束，由 EventSource 自动重连，
+    避免客户端断开后连接在服务端长期滞留。
+    """
+    interval = 1 / settings.LIVE_FEED_MAX_BATCHES_PER_SECOND
+    heartbeat = settings.LIVE_FEED_HEARTBEAT_SECONDS
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.LIVE_FEED_MAX_SECONDS
+    subscription = feed.subscribe()
+    if settings.ORDER_EVENTS_MODE == 'outbox':
+        _ensure_outbox_tail()
+    try:
+        yield 'retry: 3000\n\n'
+        while loop.time() < deadline:
+            batch = await subscription.next_batch(min(heartbeat, max(deadline - loop.time(), 0)))
+            if not batch:
+                yield ': keep-alive\n\n'
+                continue
+            yield _message('sales', batch)
+            # 限制推送频率，这段时间内到达的增量合并到下一批
+            await asyncio.sleep(interval)
+    finally:
+        feed.unsubscribe(subscription)
@@ -0,0 +1,43 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sales_analysis.archive import parquet_available, archive_month, iter_months, hot_window_start
+from sales_analysis.models import SalesOrder, ArchivedSalesOrder
+from sales_analysis.sharding import sales_databases
+
+
+class Command(BaseCommand):
+    help = '把冷数据月份的订单与订单条目导出为压缩 Parquet 文件并从数据库中移除'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help='归档该月份（YYYY-MM）之前的数据，默认保留包括当月在内的最近 SALES_HOT_MONTHS 个月')
+
+    def handle(self, *args, **options):
+        if not parquet_available():
+            raise CommandError('归档为 Parquet 需要安装 pyarrow')
+        
+        if options['before']:
+            try:
+                before = datetime.datetime.strptime(options['before'], '%Y-%m').replace(tzinfo=datetime.timezone.utc)
+            except ValueError:
+                raise CommandError('--before 格式应为 YYYY-MM')
+        else:
+            before = hot_window_start()
+        
+        firsts = [
+            model.objects.using(alias).filter(order_date__lt=before).order_by('order_date').values_list(
+                'order_date', flat=True
+            ).first()
+            for alias in sales_databases() for model in (SalesOrder, ArchivedSalesOrder)
+        ]
+        firsts = [first for first in firsts if first is not None]
+        if not firsts:
+            self.stdout.write(f'{before:%Y-%m} 之前没有需要归档的数据')
+            return
+        
+        for month in iter_months(min(firsts), before - datetime.timedelta(microseconds=1)):
+            orders, items = archive_month(month)
+            if orders or items:
+                self.stdout.write(f'{month:%Y-%m}: 归档 {orders} 个订单、{items} 条订单条目')
+        self.stdout.write(self.style.SUCCESS('归档完成'))
@@ -0,0 +1,68 @@
+import gzip
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from sales_analysis.encoding import columnar
+from sales_analysis.renderers import MessagePackRenderer, msgpack
+from sales_analysis.middleware import brotli, BROTLI_QUALITY
+from sales_analysis.serializers import ClothingTypeSalesSerializer
+
+
+class Command(BaseCommand):
+    help = '对比逐行/列式结构与 JSON/MessagePack 编码的序列化耗时和响应体积（含 gzip、brotli 压缩后）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='模拟的结果行数')
+        parser.add_argument('--repeat', type=int, default=3, help='每种方式重复次数，取最短耗时')
+
+    def _rows(self, count):
+        rng = random.Random(0)
+        return [{
+            'clothing_type_name': f'类型{i % 50}',
+            'total_sales': Decimal(rng.randint(0, 10 ** 8)) / 100,
+            'order_count': rng.randint(0, 10000),
+            'percentage': round(rng.random() * 100, 2),
+        } for i in range(count)]
+
+    def _measure(self, encode, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = encode()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, body
+
+    def handle(self, *args, **options):
+        rows = self._rows(options['rows'])
+        json_renderer = JSONRenderer()
+        cases = [
+            ('逐行 + JSON', lambda: json_renderer.render(ClothingTypeSalesSerializer(rows, many=True).data)),
+            ('列式 + JSON', lambda: json_renderer.render(columnar(rows, ClothingTypeSalesSerializer))),
+        ]
+        if msgpack is not None:
+            msgpack_renderer = MessagePackRenderer()
+            cases += [
+                ('逐行 + MessagePack', lambda: msgpack_renderer.render(ClothingTypeSalesSerializer(rows, many=True).data)),
+                ('列式 + MessagePack', lambda: msgpack_renderer.render(columnar(rows, ClothingTypeSalesSerializer))),
+            ]
+        else:
+            self.stdout.write(self.style.WARNING('未安装 msgpack，跳过 MessagePack 编码'))
+        if brotli is None:
+            self.stdout.write(self.style.WARNING('未安装 brotli，跳过 brotli 压缩'))
+        
+        self.stdout.write(f'{options["rows"]} 行，耗时取 {options["repeat"]} 次中的最小值')
+        self.stdout.write(f'{"方式":<20}{"序列化(ms)":>12}{"原始(KB)":>12}{"gzip(KB)":>12}{"br(KB)":>12}')
+        for name, encode in cases:
+            elapsed, body = self._measure(encode, options['repeat'])
+            gzipped = len(gzip.compress(body, compresslevel=6))
+            brotlied = len(brotli.compress(body, quality=BROTLI_QUALITY)) if brotli is not None else None
+            self.stdout.write(
+                f'{name:<20}{elapsed * 1000:>12.1f}{len(body) / 1024:>12.1f}{gzipped / 1024:>12.1f}'
+                f'{(f"{brotlied / 1024:.1f}" if brotlied is not None else "-"):>12}'
+            )
+        self.stdout.write(self.style.SUCCESS('基准测试完成'))
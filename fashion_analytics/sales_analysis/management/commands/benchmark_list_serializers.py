@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from sales_analysis.fast_serializers import ValuesSerializer
+from sales_analysis.models import Clothing, SalesOrder
+from sales_analysis.serializers import ClothingSerializer, SalesOrderSerializer
+
+
+class Command(BaseCommand):
+    help = '对比 ModelSerializer 与快速序列化器在大分页下的列表接口吞吐量（使用当前数据库中的数据）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=1000, help='每页行数')
+        parser.add_argument('--repeat', type=int, default=5, help='每种方式重复次数，取最短耗时')
+
+    def _measure(self, build, repeat):
+        best, queries = None, 0
+        for _ in range(repeat):
+            reset_queries()
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                JSONRenderer().render(build())
+                elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+            queries = len(captured)
+        return best, queries
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        context = {'request': Request(APIRequestFactory().get('/api/'))}
+        endpoints = [
+            ('clothing', Clothing, ClothingSerializer, ['clothing_type', 'price_range'], []),
+            ('sales-orders', SalesOrder, SalesOrderSerializer, ['user', 'region'], ['items__clothing']),
+        ]
+        
+        self.stdout.write(f'{"接口":<14}{"方式":<28}{"行数":>8}{"耗时(ms)":>12}{"行/秒":>12}{"查询数":>8}')
+        for name, model, serializer_class, related, prefetch in endpoints:
+            pks = list(model.objects.order_by('pk').values_list('pk', flat=True)[:page_size])
+            if not pks:
+                raise CommandError(f'{model._meta.verbose_name}没有数据，请先生成或导入数据')
+            queryset = model.objects.filter(pk__in=pks).order_by('pk')
+            fast = ValuesSerializer(serializer_class, context)
+            cases = [
+                ('ModelSerializer（现有视图）', lambda: serializer_class(queryset.all(), many=True, context=context).data),
+                ('ModelSerializer + 预取关联', lambda: serializer_class(
+                    queryset.select_related(*related).prefetch_related(*prefetch), many=True, context=context
+                ).data),
+                ('ValuesSerializer', lambda: fast.to_representation(queryset.values(*fast.lookups))),
+            ]
+            for label, build in cases:
+                elapsed, queries = self._measure(build, options['repeat'])
+                self.stdout.write(
+                    f'{name:<14}{label:<28}{len(pks):>8}{elapsed * 1000:>12.1f}{len(pks) / elapsed:>12.0f}{queries:>8}'
+                )
+        self.stdout.write(self.style.SUCCESS('基准测试完成'))
@@ -0,0 +1,77 @@
+import time
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from sales_analysis.models import OrderItem
+from sales_analysis.money import Cents, cents_array, from_cents
+
+
+class Command(BaseCommand):
+    help = '对比 Decimal 与整数分两种金额表示在订单条目按地区汇总时的取数耗时、聚合耗时与内存占用'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='参与测试的订单条目数，默认全部')
+        parser.add_argument('--repeat', type=int, default=3, help='每种方式重复次数，取最短耗时')
+
+    def _measure(self, run, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = run()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def _items(self, limit):
+        items = OrderItem.objects.order_by('id')
+        if limit:
+            items = items.filter(id__lte=items.values_list('id', flat=True)[limit - 1:limit].get())
+        return items
+
+    def _decimal_frame(self, items):
+        rows = items.values_list('region_id', 'line_total')
+        return pd.DataFrame(list(rows), columns=['region_id', 'line_total'])
+
+    def _cents_frame(self, items):
+        rows = list(items.annotate(line_cents=Cents('line_total')).values_list('region_id', 'line_cents'))
+        return pd.DataFrame({
+            'region_id': cents_array(row[0] for row in rows),
+            'line_cents': cents_array(row[1] for row in rows),
+        })
+
+    def handle(self, *args, **options):
+        items = self._items(options['limit']).exclude(region_id__isnull=True)
+        if not items.exists():
+            raise CommandError('没有订单条目，请先导入或生成数据')
+        repeat = options['repeat']
+        
+        decimal_fetch, decimal_frame = self._measure(lambda: self._decimal_frame(items), repeat)
+        cents_fetch, cents_frame = self._measure(lambda: self._cents_frame(items), repeat)
+        decimal_sum, decimal_totals = self._measure(
+            lambda: decimal_frame.groupby('region_id')['line_total'].sum(), repeat
+        )
+        cents_sum, cents_totals = self._measure(
+            lambda: cents_frame.groupby('region_id')['line_cents'].sum(), repeat
+        )
+        
+        # 两种表示的汇总结果必须完全一致
+        mismatched = [
+            region_id for region_id, total in decimal_totals.items()
+            if from_cents(cents_totals.get(region_id, 0)) != total
+        ]
+        
+        self.stdout.write(f'{len(decimal_frame)} 个订单条目，按地区汇总条目金额，耗时取 {repeat} 次中的最小值')
+        self.stdout.write(f'{"方式":<12}{"取数(ms)":>12}{"聚合(ms)":>12}{"内存(KB)":>12}{"列类型":>12}')
+        for name, fetch, aggregate, frame, column in (
+            ('Decimal', decimal_fetch, decimal_sum, decimal_frame, 'line_total'),
+            ('整数分', cents_fetch, cents_sum, cents_frame, 'line_cents'),
+        ):
+            memory = frame.memory_usage(deep=True).sum() / 1024
+            self.stdout.write(
+                f'{name:<12}{fetch * 1000:>12.1f}{aggregate * 1000:>12.1f}{memory:>12.1f}'
+                f'{str(frame[column].dtype):>12}'
+            )
+        if mismatched:
+            raise CommandError(f'{len(mismatched)} 个地区的汇总结果不一致：{mismatched[:10]}')
+        self.stdout.write(self.style.SUCCESS('基准测试完成，两种表示的汇总结果一致'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from sales_analysis.anomalies import close_stale_series, rebuild_series
+
+
+class Command(BaseCommand):
+    help = '结束各地区×服装类型序列的前一天并检测销售异常（建议每日凌晨执行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='按历史订单重建全部序列统计')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            count = rebuild_series()
+            self.stdout.write(f'已根据历史订单重建 {count} 个销售序列')
+        
+        anomalies = close_stale_series()
+        for anomaly in anomalies:
+            self.stdout.write(self.style.WARNING(
+                f'{anomaly.day} 地区#{anomaly.region_id} 类型#{anomaly.clothing_type_id} '
+                f'销售额 {anomaly.value}，均值 {anomaly.expected}，Z={anomaly.z_score}'
+            ))
+        self.stdout.write(self.style.SUCCESS(f'异常检测完成，本次检测到 {len(anomalies)} 条异常'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from sales_analysis.text_index import index_ratings, jieba
+
+
+class Command(BaseCommand):
+    help = '增量构建评价内容的关键词倒排索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='删除现有索引后全量重建')
+
+    def handle(self, *args, **options):
+        if jieba is None:
+            self.stdout.write(self.style.WARNING('未安装 jieba，使用中文二元切分'))
+        self.stdout.write('开始索引评价内容...')
+        indexed = index_ratings(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'评价索引完成，本次索引 {indexed} 条评价'))
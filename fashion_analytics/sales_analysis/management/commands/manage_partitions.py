@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from sales_analysis.archive import (
+    partitions, convert_to_partitioned, ensure_future_partitions,
+    rotate_to_archive_tables, hot_window_start
+)
+from sales_analysis.models import SalesOrder
+from sales_analysis.sharding import sales_databases
+
+
+class Command(BaseCommand):
+    help = '在每个销售数据库上维护订单按月分区（MySQL）或把热数据窗口之外的订单移入归档表（其他数据库），建议每月执行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true', help='MySQL：把订单与订单条目表一次性转换为按月分区表')
+        parser.add_argument('--months-ahead', type=int, default=3, help='MySQL：预建未来多少个月的分区')
+        parser.add_argument('--hot-months', type=int, default=settings.SALES_HOT_MONTHS, help='其他数据库：在线表保留的最近月数')
+
+    def handle(self, *args, **options):
+        for alias in sales_databases():
+            if connections[alias].vendor == 'mysql':
+                self._maintain_partitions(alias, options)
+                continue
+            
+            # 不支持分区的数据库：把热数据窗口之外的订单移入归档表
+            before = hot_window_start(options['hot_months'])
+            moved = rotate_to_archive_tables(before, using=alias)
+            self.stdout.write(self.style.SUCCESS(f'{alias}: 已把 {before:%Y-%m} 之前 {moved} 个月的订单移入归档表'))
+
+    def _maintain_partitions(self, alias, options):
+        table = SalesOrder._meta.db_table
+        if options['convert'] and not partitions(table, alias):
+            count = convert_to_partitioned(options['months_ahead'], using=alias)
+            self.stdout.write(self.style.SUCCESS(f'{alias}: 已转换为按月分区表，共 {count} 个月份分区'))
+        elif not partitions(table, alias):
+            self.stdout.write(self.style.WARNING(f'{alias}: 订单表尚未分区，可使用 --convert 进行转换'))
+            return
+        created = ensure_future_partitions(options['months_ahead'], using=alias)
+        self.stdout.write(self.style.SUCCESS(f'{alias}: 分区维护完成，新建 {created} 个分区'))
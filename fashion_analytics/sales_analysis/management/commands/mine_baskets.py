@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from sales_analysis.basket import mine_associations
+
+
+class Command(BaseCommand):
+    help = '增量挖掘经常一起购买的商品（购物篮关联分析）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='忽略已保存的共现矩阵，全量重建')
+
+    def handle(self, *args, **options):
+        self.stdout.write('开始挖掘商品关联...')
+        processed = mine_associations(full=options['full'], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f'商品关联挖掘完成，本次处理 {processed} 条订单条目'))
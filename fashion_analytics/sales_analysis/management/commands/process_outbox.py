@@ -0,0 +1,53 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from sales_analysis.outbox import process_batch, outbox_lag, purge_processed
+from sales_analysis.sharding import sales_databases
+
+
+class Command(BaseCommand):
+    help = '批量处理订单事件发件箱，更新库存、销售速度、销售异常等派生数据（ORDER_EVENTS_MODE=outbox 时使用）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每批处理的事件数')
+        parser.add_argument('--loop', action='store_true', help='持续运行，发件箱为空时按 --interval 轮询')
+        parser.add_argument('--interval', type=float, default=1.0, help='轮询间隔（秒）')
+        parser.add_argument('--keep-hours', type=int, default=24, help='已处理事件的保留时长（小时）')
+
+    def _report(self, processed):
+        lag = outbox_lag()
+        self.stdout.write(
+            f'已处理 {processed} 个事件，待处理 {lag["pending_events"]} 个，积压 {lag["lag_seconds"]} 秒'
+        )
+
+    def handle(self, *args, **options):
+        if settings.ORDER_EVENTS_MODE != 'outbox':
+            self.stdout.write(self.style.WARNING('当前 ORDER_EVENTS_MODE 不是 outbox，仅处理发件箱中已有的事件'))
+        
+        last_purge = None
+        while True:
+            processed = 0
+            # 按地区分片时事件保存在订单所在的数据库，逐库处理
+            for alias in sales_databases():
+                while True:
+                    count = process_batch(options['batch_size'], using=alias)
+                    processed += count
+                    if count < options['batch_size']:
+                        break
+            if processed:
+                self._report(processed)
+            
+            now = timezone.now()
+            if last_purge is None or now - last_purge > timedelta(hours=1):
+                purge_processed(now - timedelta(hours=options['keep_hours']))
+                last_purge = now
+            
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        
+        self.stdout.write(self.style.SUCCESS('发件箱处理完成'))
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from sales_analysis.sampling import rebuild_samples
+
+
+class Command(BaseCommand):
+    help = '重建近似分析（approx=1）使用的订单与条目抽样表以及客户 HyperLogLog 草图'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rate', type=float, default=settings.ANALYTICS_SAMPLE_RATE,
+            help='抽样比例（0-1），默认取 ANALYTICS_SAMPLE_RATE'
+        )
+
+    def handle(self, *args, **options):
+        rate = options['rate']
+        if not 0 < rate <= 1:
+            raise CommandError('--rate 必须在 (0, 1] 之间')
+        self.stdout.write(f'开始按 {rate:.2%} 的比例重建抽样表...')
+        orders, items = rebuild_samples(rate)
+        self.stdout.write(self.style.SUCCESS(f'抽样表重建完成：订单样本 {orders} 个，条目样本 {items} 个'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from sales_analysis.inventory import rebuild_velocity, VELOCITY_WINDOW_DAYS
+
+
+class Command(BaseCommand):
+    help = '根据最近的历史订单重建商品滚动销售速度'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write(f'开始重建最近{VELOCITY_WINDOW_DAYS}天的销售速度...')
+        count = rebuild_velocity()
+        self.stdout.write(self.style.SUCCESS(f'销售速度重建完成，共 {count} 个商品'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from sales_analysis.customers import refresh_customer_analytics
+
+
+class Command(BaseCommand):
+    help = '增量刷新客户RFM分层与同期群留存快照'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='清空客户统计后全量重建')
+
+    def handle(self, *args, **options):
+        self.stdout.write('开始刷新客户分析...')
+        touched = refresh_customer_analytics(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'客户分析刷新完成，本次更新 {touched} 位客户'))
@@ -0,0 +1,35 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sales_analysis.thumbnails import regenerate_thumbnails
+
+
+class Command(BaseCommand):
+    help = '为已有商品图片并行生成缩略图（THUMBNAIL_SIZES × THUMBNAIL_FORMATS），默认只处理尚未生成的商品'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='并行线程数，默认为 CPU 核数')
+        parser.add_argument('--all', action='store_true', help='处理全部有图片的商品，补齐新增的尺寸或格式')
+        parser.add_argument('--force', action='store_true', help='重新生成已存在的缩略图（修改编码质量后使用）')
+        parser.add_argument('--batch-size', type=int, default=500, help='每批处理的商品数')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers 必须大于0')
+        started = time.perf_counter()
+        done = failures = 0
+        for count, failed in regenerate_thumbnails(
+            workers=options['workers'], everything=options['all'],
+            force=options['force'], batch_size=options['batch_size'],
+        ):
+            done += count
+            failures += len(failed)
+            for pk, name, error in failed:
+                self.stdout.write(self.style.WARNING(f'商品 {pk} 的图片 {name} 生成失败: {error}'))
+            self.stdout.write(f'已处理 {done} 个商品')
+        self.stdout.write(self.style.SUCCESS(
+            f'缩略图生成完成：{done - failures} 个商品成功，{failures} 个失败，'
+            f'耗时 {time.perf_counter() - started:.1f} 秒'
+        ))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sales_analysis.duckdb_backend import duckdb, sync_all
+
+
+class Command(BaseCommand):
+    help = (
+        '按主键水位把订单、订单条目与评价的分析列增量导出为 Parquet，供 DuckDB 分析后端查询（需安装 duckdb）；'
+        '分析接口不会自行导出，需定时执行或使用 --loop'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='全量重写（已有行被修改或删除时会自动全量重写）')
+        parser.add_argument('--loop', action='store_true', help='持续运行，每隔 --interval 秒同步一次')
+        parser.add_argument('--interval', type=float, default=60, help='持续同步的间隔（秒）')
+
+    def handle(self, *args, **options):
+        if duckdb is None:
+            raise CommandError('未安装 duckdb')
+        full = options['full']
+        while True:
+            self.sync(full)
+            if not options['loop']:
+                break
+            full = False
+            time.sleep(options['interval'])
+
+    def sync(self, full):
+        started = time.perf_counter()
+        for name, manifest in sync_all(full=full).items():
+            self.stdout.write(f'{name}: {manifest["rows"]} 行，{len(manifest["parts"])} 个分片，水位 {manifest["max_id"]}')
+        self.stdout.write(self.style.SUCCESS(f'Parquet 导出完成，耗时 {time.perf_counter() - started:.1f} 秒'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from sales_analysis.sharding import shard_databases, sync_reference
+
+
+class Command(BaseCommand):
+    help = '把用户、地区、服装类型、价格区间与商品等参照表从默认库全量复制到各订单分片（SALES_SHARDS）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='append', help='只同步指定的分片别名，可重复指定')
+
+    def handle(self, *args, **options):
+        aliases = shard_databases()
+        if not aliases:
+            raise CommandError('未配置 SALES_SHARDS')
+        unknown = set(options['database'] or ()) - set(aliases)
+        if unknown:
+            raise CommandError(f'不是订单分片: {", ".join(sorted(unknown))}')
+        for alias in options['database'] or aliases:
+            counts = sync_reference(alias)
+            self.stdout.write(f'{alias}: ' + '，'.join(f'{label} {count} 行' for label, count in counts.items()))
+        self.stdout.write(self.style.SUCCESS('参照表同步完成'))
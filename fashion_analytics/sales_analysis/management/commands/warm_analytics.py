@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.http import urlencode
+
+from sales_analysis.warming import STANDARD_WINDOWS, dashboard_requests, warm_models, warm_dashboards
+
+
+class Command(BaseCommand):
+    help = '并行预热看板常用的分析与预测接口，填充响应缓存（部署后、数据导入后或定时执行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='工作进程数，默认为 CPU 核数')
+        parser.add_argument(
+            '--windows', default=','.join(str(days) for days in STANDARD_WINDOWS),
+            help='预热的时间窗口（最近天数，逗号分隔）'
+        )
+        parser.add_argument('--loop', action='store_true', help='持续运行，每隔 --interval 秒预热一次')
+        parser.add_argument('--interval', type=float, default=900, help='定时预热的间隔（秒）')
+
+    def handle(self, *args, **options):
+        try:
+            windows = [int(days) for days in options['windows'].split(',') if days.strip()]
+        except ValueError:
+            raise CommandError('--windows 必须是逗号分隔的天数')
+        
+        while True:
+            self.warm(windows, options['workers'])
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def warm(self, windows, workers):
+        started = time.perf_counter()
+        self.stdout.write(f'客户分析快照 {warm_models() * 1000:.1f} ms')
+        
+        requests = dashboard_requests(windows)
+        failed = 0
+        for path, params, status_code, seconds in warm_dashboards(requests, workers):
+            key = f'{path}?{urlencode(params)}' if params else path
+            line = f'{key:<60} {status_code} {seconds * 1000:>9.1f} ms'
+            if status_code == 200:
+                self.stdout.write(line)
+            else:
+                failed += 1
+                self.stdout.write(self.style.WARNING(line))
+        
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'预热完成：{len(requests)} 个请求，{failed} 个未成功，总耗时 {elapsed:.1f} 秒'
+        ))
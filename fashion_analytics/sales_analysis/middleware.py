@@ -0,0 +1,46 @@
+"""响应压缩：按 Accept-Encoding 选择 brotli（需安装 brotli）或 gzip"""
+import re
+
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+re_accepts_br = re.compile(r'\bbr\b')
+
+# 兼顾压缩率与 CPU，动态响应不使用最高级别
+BROTLI_QUALITY = 5
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """客户端接受 br 且安装了 brotli 时使用 brotli，否则退回 Django 的 gzip 压缩"""
+    
+    def process_response(self, request, response):
+        # 事件流需要逐条送达，压缩会导致缓冲
+        if response.get('Content-Type', '').startswith('text/event-stream'):
+            return response
+        
+        accepts_br = re_accepts_br.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is None or not accepts_br or response.streaming:
+            return super().process_response(request, response)
+        
+        # 与 GZipMiddleware 相同：过短或已编码的响应不压缩
+        if len(response.content) < 200 or response.has_header('Content-Encoding'):
+            return response
+        
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        if len(compressed) >= len(response.content):
+            return response
+        
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        # 压缩后字节不同，强 ETag 降为弱 ETag（与 GZipMiddleware 一致）
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
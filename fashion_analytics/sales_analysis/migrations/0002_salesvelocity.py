@@ -0,0 +1,47 @@
+# Generated by Django 4.2.30 on 2026-10-19 17:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales_analysis", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SalesVelocity",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("last_day", models.DateField(verbose_name="最近销售日期")),
+                ("buckets", models.BinaryField(verbose_name="每日销量窗口")),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新时间"),
+                ),
+                (
+                    "clothing",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="velocity",
+                        to="sales_analysis.clothing",
+                        verbose_name="服装商品",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "销售速度",
+                "verbose_name_plural": "销售速度",
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 4.2.30 on 2026-10-19 17:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales_analysis", "0002_salesvelocity"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ItemAssociation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("rank", models.PositiveSmallIntegerField(verbose_name="排名")),
+                (
+                    "co_count",
+                    models.PositiveIntegerField(verbose_name="共同购买订单数"),
+                ),
+                ("confidence", models.FloatField(verbose_name="置信度")),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新时间"),
+                ),
+                (
+                    "clothing",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="associations",
+                        to="sales_analysis.clothing",
+                        verbose_name="服装商品",
+                    ),
+                ),
+                (
+                    "related_clothing",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="sales_analysis.clothing",
+                        verbose_name="关联商品",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "商品关联",
+                "verbose_name_plural": "商品关联",
+                "ordering": ["clothing", "rank"],
+                "indexes": [
+                    models.Index(
+                        fields=["clothing", "rank"],
+                        name="sales_analy_clothin_e79e80_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 4.2.30 on 2026-10-19 17:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("sales_analysis", "0003_itemassociation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AnalyticsSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        max_length=50, unique=True, verbose_name="快照名称"
+                    ),
+                ),
+                ("payload", models.JSONField(verbose_name="快照内容")),
+                (
+                    "watermark",
+                    models.BigIntegerField(default=0, verbose_name="数据水位"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now=True, verbose_name="生成时间"),
+                ),
+            ],
+            options={
+                "verbose_name": "分析快照",
+                "verbose_name_plural": "分析快照",
+            },
+        ),
+        migrations.CreateModel(
+            name="CustomerStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("first_order_date", models.DateField(verbose_name="首次下单日期")),
+                ("last_order_date", models.DateField(verbose_name="最近下单日期")),
+                (
+                    "frequency",
+                    models.PositiveIntegerField(default=0, verbose_name="下单次数"),
+                ),
+                (
+                    "monetary",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="消费总额",
+                    ),
+                ),
+                (
+                    "active_months",
+                    models.JSONField(default=list, verbose_name="活跃月份"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新时间"),
+                ),
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="customer_stats",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="用户",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "客户消费统计",
+                "verbose_name_plural": "客户消费统计",
+            },
+        ),
+    ]
@@ -0,0 +1,127 @@
+# Generated by Django 4.2.30 on 2026-10-19 17:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales_analysis", "0004_analyticssnapshot_customerstats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SalesSeriesStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("current_day", models.DateField(verbose_name="当前累计日期")),
+                (
+                    "current_total",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="当日销售额",
+                    ),
+                ),
+                (
+                    "n",
+                    models.PositiveIntegerField(default=0, verbose_name="已统计天数"),
+                ),
+                ("mean", models.FloatField(default=0, verbose_name="日销售额均值")),
+                ("m2", models.FloatField(default=0, verbose_name="离差平方和")),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新时间"),
+                ),
+                (
+                    "clothing_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="sales_analysis.clothingtype",
+                        verbose_name="服装类型",
+                    ),
+                ),
+                (
+                    "region",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="sales_analysis.region",
+                        verbose_name="地区",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "销售序列统计",
+                "verbose_name_plural": "销售序列统计",
+                "unique_together": {("region", "clothing_type")},
+            },
+        ),
+        migrations.CreateModel(
+            name="SalesAnomaly",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(verbose_name="日期")),
+                (
+                    "value",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=14, verbose_name="当日销售额"
+                    ),
+                ),
+                ("expected", models.FloatField(verbose_name="历史均值")),
+                ("std", models.FloatField(verbose_name="历史标准差")),
+                ("z_score", models.FloatField(verbose_name="Z分数")),
+                (
+                    "direction",
+                    models.CharField(
+                        choices=[("drop", "骤降"), ("spike", "激增")],
+                        max_length=10,
+                        verbose_name="方向",
+                    ),
+                ),
+                (
+                    "detected_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="发现时间"),
+                ),
+                (
+                    "clothing_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="sales_analysis.clothingtype",
+                        verbose_name="服装类型",
+                    ),
+                ),
+                (
+                    "region",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="sales_analysis.region",
+                        verbose_name="地区",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "销售异常",
+                "verbose_name_plural": "销售异常",
+                "ordering": ["-day", "-detected_at"],
+                "unique_together": {("region", "clothing_type", "day")},
+            },
+        ),
+    ]
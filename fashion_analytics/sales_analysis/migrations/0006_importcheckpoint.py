@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-19 17:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales_analysis", "0005_salesseriesstats_salesanomaly"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "source",
+                    models.CharField(
+                        max_length=255, unique=True, verbose_name="数据来源"
+                    ),
+                ),
+                (
+                    "rows_done",
+                    models.BigIntegerField(default=0, verbose_name="已导入行数"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新时间"),
+                ),
+            ],
+            options={
+                "verbose_name": "导入断点",
+                "verbose_name_plural": "导入断点",
+            },
+        ),
+    ]
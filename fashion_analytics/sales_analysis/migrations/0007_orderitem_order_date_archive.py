@@ -0,0 +1,116 @@
+# Generated by Django 4.2.30 on 2026-10-19 17:16
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 10000
+
+
+def backfill_order_dates(apps, schema_editor):
+    """按主键区间分批把订单日期回填到订单条目"""
+    SalesOrder = apps.get_model("sales_analysis", "SalesOrder")
+    OrderItem = apps.get_model("sales_analysis", "OrderItem")
+    db_alias = schema_editor.connection.alias
+    order_date = (
+        SalesOrder.objects.using(db_alias)
+        .filter(pk=OuterRef("order_id"))
+        .values("order_date")[:1]
+    )
+
+    last_id = (
+        OrderItem.objects.using(db_alias)
+        .order_by("-id")
+        .values_list("id", flat=True)
+        .first()
+        or 0
+    )
+    for start in range(0, last_id, BATCH_SIZE):
+        OrderItem.objects.using(db_alias).filter(
+            id__gt=start, id__lte=start + BATCH_SIZE, order_date__isnull=True
+        ).update(order_date=Subquery(order_date))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales_analysis", "0006_importcheckpoint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedOrderItem",
+            fields=[
+                (
+                    "id",
+                    models.BigIntegerField(
+                        primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                (
+                    "order_id",
+                    models.BigIntegerField(db_index=True, verbose_name="订单ID"),
+                ),
+                ("clothing_id", models.BigIntegerField(verbose_name="服装商品ID")),
+                ("quantity", models.PositiveIntegerField(verbose_name="数量")),
+                (
+                    "price",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=10, verbose_name="价格"
+                    ),
+                ),
+                (
+                    "order_date",
+                    models.DateTimeField(
+                        db_index=True, null=True, verbose_name="订单日期"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "归档订单条目",
+                "verbose_name_plural": "归档订单条目",
+            },
+        ),
+        migrations.CreateModel(
+            name="ArchivedSalesOrder",
+            fields=[
+                (
+                    "id",
+                    models.BigIntegerField(
+                        primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                (
+                    "order_number",
+                    models.CharField(max_length=50, verbose_name="订单编号"),
+                ),
+                ("user_id", models.BigIntegerField(verbose_name="用户ID")),
+                ("region_id", models.BigIntegerField(verbose_name="地区ID")),
+                (
+                    "total_amount",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=10, verbose_name="订单总额"
+                    ),
+                ),
+                (
+                    "order_date",
+                    models.DateTimeField(db_index=True, verbose_name="订单日期"),
+                ),
+            ],
+            options={
+                "verbose_name": "归档销售订单",
+                "verbose_name_plural": "归档销售订单",
+            },
+        ),
+        migrations.AddField(
+            model_name="orderitem",
+            name="order_date",
+            field=models.DateTimeField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                null=True,
+                verbose_name="订单日期",
+            ),
+        ),
+        migrations.RunPython(backfill_order_dates, migrations.RunPython.noop),
+    ]
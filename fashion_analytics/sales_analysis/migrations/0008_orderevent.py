@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-19 17:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales_analysis", "0007_orderitem_order_date_archive"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("order_created", "订单创建"),
+                            ("items_created", "订单条目创建"),
+                        ],
+                        max_length=20,
+                        verbose_name="事件类型",
+                    ),
+                ),
+                ("payload", models.JSONField(verbose_name="事件数据")),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="写入时间"),
+                ),
+                (
+                    "processed_at",
+                    models.DateTimeField(
+                        blank=True, db_index=True, null=True, verbose_name="处理时间"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "订单事件",
+                "verbose_name_plural": "订单事件",
+            },
+        ),
+    ]
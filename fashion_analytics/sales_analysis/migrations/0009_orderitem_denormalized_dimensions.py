@@ -0,0 +1,130 @@
+# Generated by Django 4.2.30 on 2026-10-19 17:37
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+import django.db.models.deletion
+
+BATCH_SIZE = 10000
+
+
+def backfill_dimensions(apps, schema_editor):
+    """按主键区间分批把地区、服装类型、价格区间与条目金额回填到订单条目"""
+    SalesOrder = apps.get_model("sales_analysis", "SalesOrder")
+    Clothing = apps.get_model("sales_analysis", "Clothing")
+    OrderItem = apps.get_model("sales_analysis", "OrderItem")
+    db_alias = schema_editor.connection.alias
+    orders = SalesOrder.objects.using(db_alias).filter(pk=OuterRef("order_id"))
+    clothing = Clothing.objects.using(db_alias).filter(pk=OuterRef("clothing_id"))
+
+    last_id = (
+        OrderItem.objects.using(db_alias)
+        .order_by("-id")
+        .values_list("id", flat=True)
+        .first()
+        or 0
+    )
+    for start in range(0, last_id, BATCH_SIZE):
+        OrderItem.objects.using(db_alias).filter(
+            id__gt=start, id__lte=start + BATCH_SIZE, line_total__isnull=True
+        ).update(
+            region_id=Subquery(orders.values("region_id")[:1]),
+            clothing_type_id=Subquery(clothing.values("clothing_type_id")[:1]),
+            price_range_id=Subquery(clothing.values("price_range_id")[:1]),
+            line_total=F("price") * F("quantity"),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales_analysis", "0008_orderevent"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="orderitem",
+            name="clothing_type",
+            field=models.ForeignKey(
+                blank=True,
+                db_constraint=False,
+                db_index=False,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="sales_analysis.clothingtype",
+                verbose_name="服装类型",
+            ),
+        ),
+        migrations.AddField(
+            model_name="orderitem",
+            name="line_total",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=2,
+                editable=False,
+                max_digits=12,
+                null=True,
+                verbose_name="条目金额",
+            ),
+        ),
+        migrations.AddField(
+            model_name="orderitem",
+            name="price_range",
+            field=models.ForeignKey(
+                blank=True,
+                db_constraint=False,
+                db_index=False,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="sales_analysis.pricerange",
+                verbose_name="价格区间",
+            ),
+        ),
+        migrations.AddField(
+            model_name="orderitem",
+            name="region",
+            field=models.ForeignKey(
+                blank=True,
+                db_constraint=False,
+                db_index=False,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="sales_analysis.region",
+                verbose_name="地区",
+            ),
+        ),
+        # 先回填再建索引，避免回填时逐行维护三个覆盖索引
+        migrations.RunPython(backfill_dimensions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="orderitem",
+            index=models.Index(
+                fields=[
+                    "clothing_type",
+                    "order_date",
+                    "line_total",
+                    "quantity",
+                    "price",
+                ],
+                name="orderitem_type_cover",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="orderitem",
+            index=models.Index(
+                fields=["price_range", "order_date", "line_total"],
+                name="orderitem_range_cover",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="orderitem",
+            index=models.Index(
+                fields=["region", "clothing_type", "order_date", "line_total"],
+                name="orderitem_series_cover",
+            ),
+        ),
+    ]
@@ -0,0 +1,124 @@
+# Generated by Django 4.2.30 on 2026-10-19 17:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales_analysis", "0009_orderitem_denormalized_dimensions"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SalesOrderSample",
+            fields=[
+                (
+                    "id",
+                    models.BigIntegerField(
+                        primary_key=True, serialize=False, verbose_name="订单ID"
+                    ),
+                ),
+                ("region_id", models.BigIntegerField(verbose_name="地区ID")),
+                (
+                    "total_amount",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=10, verbose_name="订单总额"
+                    ),
+                ),
+                ("order_date", models.DateTimeField(verbose_name="订单日期")),
+            ],
+            options={
+                "verbose_name": "订单抽样",
+                "verbose_name_plural": "订单抽样",
+                "indexes": [
+                    models.Index(
+                        fields=["region_id", "order_date", "total_amount"],
+                        name="ordersample_region_cover",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="OrderItemSample",
+            fields=[
+                (
+                    "id",
+                    models.BigIntegerField(
+                        primary_key=True, serialize=False, verbose_name="条目ID"
+                    ),
+                ),
+                (
+                    "order_id",
+                    models.BigIntegerField(db_index=True, verbose_name="订单ID"),
+                ),
+                (
+                    "clothing_id",
+                    models.BigIntegerField(db_index=True, verbose_name="服装商品ID"),
+                ),
+                ("region_id", models.BigIntegerField(null=True, verbose_name="地区ID")),
+                (
+                    "clothing_type_id",
+                    models.BigIntegerField(null=True, verbose_name="服装类型ID"),
+                ),
+                (
+                    "price_range_id",
+                    models.BigIntegerField(null=True, verbose_name="价格区间ID"),
+                ),
+                (
+                    "line_total",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=12, verbose_name="条目金额"
+                    ),
+                ),
+                ("order_date", models.DateTimeField(verbose_name="订单日期")),
+            ],
+            options={
+                "verbose_name": "订单条目抽样",
+                "verbose_name_plural": "订单条目抽样",
+                "indexes": [
+                    models.Index(
+                        fields=["clothing_type_id", "order_date", "line_total"],
+                        name="itemsample_type_cover",
+                    ),
+                    models.Index(
+                        fields=["price_range_id", "order_date", "line_total"],
+                        name="itemsample_range_cover",
+                    ),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="CustomerSketch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "dimension",
+                    models.CharField(
+                        choices=[("region", "地区"), ("clothing_type", "服装类型")],
+                        max_length=20,
+                        verbose_name="维度",
+                    ),
+                ),
+                ("key", models.BigIntegerField(verbose_name="维度ID")),
+                ("registers", models.BinaryField(verbose_name="寄存器")),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新时间"),
+                ),
+            ],
+            options={
+                "verbose_name": "客户草图",
+                "verbose_name_plural": "客户草图",
+                "unique_together": {("dimension", "key")},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales_analysis", "0010_sales_samples_customer_sketch"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IdSequence",
+            fields=[
+                (
+                    "name",
+                    models.CharField(
+                        max_length=100,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="模型",
+                    ),
+                ),
+                ("next_id", models.BigIntegerField(verbose_name="下一个主键")),
+            ],
+            options={
+                "verbose_name": "主键序列",
+                "verbose_name_plural": "主键序列",
+            },
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:22
+
+from django.db import migrations, models
+
+# SQLite：外部内容 FTS5 表（trigram 分词，支持中文子串），由触发器与商品表同步
+SQLITE_FTS = [
+    """CREATE VIRTUAL TABLE sales_analysis_clothing_fts USING fts5(
+        name, description, content='sales_analysis_clothing', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER sales_analysis_clothing_fts_ai AFTER INSERT ON sales_analysis_clothing BEGIN
+        INSERT INTO sales_analysis_clothing_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END""",
+    """CREATE TRIGGER sales_analysis_clothing_fts_ad AFTER DELETE ON sales_analysis_clothing BEGIN
+        INSERT INTO sales_analysis_clothing_fts(sales_analysis_clothing_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END""",
+    """CREATE TRIGGER sales_analysis_clothing_fts_au AFTER UPDATE OF name, description ON sales_analysis_clothing BEGIN
+        INSERT INTO sales_analysis_clothing_fts(sales_analysis_clothing_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO sales_analysis_clothing_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END""",
+    "INSERT INTO sales_analysis_clothing_fts(sales_analysis_clothing_fts) VALUES ('rebuild')",
+]
+
+SQLITE_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS sales_analysis_clothing_fts_ai",
+    "DROP TRIGGER IF EXISTS sales_analysis_clothing_fts_ad",
+    "DROP TRIGGER IF EXISTS sales_analysis_clothing_fts_au",
+    "DROP TABLE IF EXISTS sales_analysis_clothing_fts",
+]
+
+# MySQL：ngram 分词的 FULLTEXT 索引，由 InnoDB 自动维护
+MYSQL_FULLTEXT = [
+    "ALTER TABLE sales_analysis_clothing ADD FULLTEXT INDEX clothing_fulltext (name, description) WITH PARSER ngram",
+]
+
+MYSQL_FULLTEXT_DROP = [
+    "ALTER TABLE sales_analysis_clothing DROP INDEX clothing_fulltext",
+]
+
+
+def _execute(schema_editor, statements):
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def create_fulltext(apps, schema_editor):
+    """商品名称与描述的全文索引，其他数据库不建索引、检索退化为 LIKE"""
+    _execute(schema_editor, {"sqlite": SQLITE_FTS, "mysql": MYSQL_FULLTEXT})
+
+
+def drop_fulltext(apps, schema_editor):
+    _execute(schema_editor, {"sqlite": SQLITE_FTS_DROP, "mysql": MYSQL_FULLTEXT_DROP})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales_analysis", "0011_idsequence"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="clothing",
+            index=models.Index(
+                fields=["clothing_type", "price_range", "price", "stock"],
+                name="clothing_facet_cover",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="clothing",
+            index=models.Index(
+                fields=["price", "stock", "clothing_type", "price_range"],
+                name="clothing_price_cover",
+            ),
+        ),
+        migrations.RunPython(create_fulltext, drop_fulltext),
+    ]
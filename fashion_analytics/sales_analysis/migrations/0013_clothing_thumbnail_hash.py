@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales_analysis", "0012_clothing_catalog_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="clothing",
+            name="thumbnail_hash",
+            field=models.CharField(
+                blank=True,
+                default="",
+                editable=False,
+                max_length=64,
+                verbose_name="缩略图内容哈希",
+            ),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales_analysis", "0013_clothing_thumbnail_hash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TableVersion",
+            fields=[
+                (
+                    "label",
+                    models.CharField(
+                        max_length=100,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="模型",
+                    ),
+                ),
+                ("version", models.BigIntegerField(default=0, verbose_name="版本号")),
+                ("updated_at", models.DateTimeField(verbose_name="最近写入时间")),
+            ],
+            options={
+                "verbose_name": "数据表版本",
+                "verbose_name_plural": "数据表版本",
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales_analysis", "0014_tableversion"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CostBudgetUsage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("scope", models.CharField(max_length=50, verbose_name="预算范围")),
+                ("window", models.BigIntegerField(verbose_name="预算周期")),
+                ("used", models.BigIntegerField(default=0, verbose_name="已用成本")),
+            ],
+            options={
+                "verbose_name": "准入预算用量",
+                "verbose_name_plural": "准入预算用量",
+                "unique_together": {("scope", "window")},
+            },
+        ),
+    ]
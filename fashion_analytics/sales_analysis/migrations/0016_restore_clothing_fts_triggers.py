@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-19 21:05
+
+from django.db import migrations
+
+
+def restore_fulltext(apps, schema_editor):
+    """0013 在 SQLite 上重建了商品表，0012 创建的 FTS5 同步触发器随旧表删除：补建触发器并重建索引"""
+    from sales_analysis.catalog import ensure_fulltext
+
+    ensure_fulltext(schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales_analysis", "0015_costbudgetusage"),
+    ]
+
+    operations = [
+        migrations.RunPython(restore_fulltext, migrations.RunPython.noop),
+    ]
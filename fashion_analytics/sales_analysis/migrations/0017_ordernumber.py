@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-19 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales_analysis", "0016_restore_clothing_fts_triggers"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderNumber",
+            fields=[
+                (
+                    "order_number",
+                    models.CharField(
+                        max_length=50,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="订单编号",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "已用订单编号",
+                "verbose_name_plural": "已用订单编号",
+            },
+        ),
+    ]
@@ -1,7 +1,70 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction, router, DEFAULT_DB_ALIAS
+from django.db.models import F, Max
 from django.contrib.auth.models import User
 
-class Region(models.Model):
+from .signals import send_order_created, send_order_items_created
+from .sharding import sharding_enabled, sales_databases
+from .versions import bump_versions
+
+class TableVersion(models.Model):
+    """数据表版本号：表中数据每次写入提交后加1，用于分析接口的 ETag 与响应缓存（见 versions.py）"""
+    label = models.CharField(max_length=100, primary_key=True, verbose_name="模型")
+    version = models.BigIntegerField(default=0, verbose_name="版本号")
+    updated_at = models.DateTimeField(verbose_name="最近写入时间")
+    
+    def __str__(self):
+        return f"{self.label}: {self.version}"
+    
+    class Meta:
+        verbose_name = "数据表版本"
+        verbose_name_plural = verbose_name
+
+class VersionedQuerySet(models.QuerySet):
+    """批量写入（update / delete / bulk_create，bulk_update 经由 update）后增加表版本号的查询集"""
+    
+    def _bump(self, *models, modified=False):
+        bump_versions(*models, using=self._db or router.db_for_write(self.model, **self._hints), modified=modified)
+    
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        if rows:
+            self._bump(self.model, modified=True)
+        return rows
+    
+    def delete(self):
+        deleted, counts = super().delete()
+        # 级联删除的表一并增加
+        self._bump(*[label for label, count in counts.items() if count], modified=True)
+        return deleted, counts
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if objs:
+            self._bump(self.model, modified=bool(kwargs.get('update_conflicts')))
+        return objs
+
+class VersionedModel(models.Model):
+    """单条保存与删除后增加表版本号的模型基类，分析接口依赖的表都继承它"""
+    
+    objects = VersionedQuerySet.as_manager()
+    
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        bump_versions(self.__class__, using=self._state.db, modified=not adding)
+    
+    def delete(self, using=None, keep_parents=False):
+        using = using or router.db_for_write(self.__class__, instance=self)
+        deleted, counts = super().delete(using=using, keep_parents=keep_parents)
+        bump_versions(*[label for label, count in counts.items() if count], using=using, modified=True)
+        return deleted, counts
+    
+    class Meta:
+        abstract = True
+
+class Region(VersionedModel):
     """地区模型"""
     name = models.CharField(max_length=50, verbose_name="地区名称")
     code = models.CharField(max_length=20, verbose_name="地区代码")
@@ -13,7 +76,7 @@ class Region(models.Model):
         verbose_name = "地区"
         verbose_name_plural = verbose_name
 
-class ClothingType(models.Model):
+class ClothingType(VersionedModel):
     """服装类型模型"""
     name = models.CharField(max_length=50, verbose_name="类型名称")
     description = models.TextField(blank=True, null=True, verbose_name="类型描述")
@@ -25,7 +88,7 @@ class ClothingType(models.Model):
         verbose_name = "服装类型"
         verbose_name_plural = verbose_name
 
-class PriceRange(models.Model):
+class PriceRange(VersionedModel):
     """价格区间模型"""
     name = models.CharField(max_length=50, verbose_name="区间名称")
     min_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="最低价")
@@ -38,7 +101,7 @@ class PriceRange(models.Model):
         verbose_name = "价格区间"
         verbose_name_plural = verbose_name
 
-class RatingCategory(models.Model):
+class RatingCategory(VersionedModel):
     """评价类别模型"""
     name = models.CharField(max_length=50, verbose_name="评价类别")
     description = models.TextField(blank=True, null=True, verbose_name="评价描述")
@@ -50,7 +113,7 @@ class RatingCategory(models.Model):
         verbose_name = "评价类别"
         verbose_name_plural = verbose_name
 
-class Clothing(models.Model):
+class Clothing(VersionedModel):
     """服装商品模型"""
     name = models.CharField(max_length=100, verbose_name="商品名称")
     clothing_type = models.ForeignKey(ClothingType, on_delete=models.CASCADE, verbose_name="服装类型")
@@ -58,6 +121,7 @@ class Clothing(models.Model):
     price_range = models.ForeignKey(PriceRange, on_delete=models.SET_NULL, null=True, verbose_name="价格区间")
     description = models.TextField(blank=True, null=True, verbose_name="商品描述")
     image = models.ImageField(upload_to='clothing_images/', blank=True, null=True, verbose_name="商品图片")
+    thumbnail_hash = models.CharField(max_length=64, blank=True, default='', editable=False, verbose_name="缩略图内容哈希")
     stock = models.IntegerField(default=0, verbose_name="库存量")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
@@ -65,11 +129,99 @@ class Clothing(models.Model):
     def __str__(self):
         return self.name
     
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        if not self.image or not self.image._committed:
+            # 图片被清除或重新上传，旧缩略图失效，新缩略图在提交后生成（见 thumbnails.py）
+            self.thumbnail_hash = ''
+        super().save(*args, **kwargs)
+        # 服装类型与价格区间冗余在订单条目上，修改时同步（分片时逐库同步）
+        if not adding:
+            for alias in sales_databases():
+                OrderItem.objects.using(alias).filter(clothing_id=self.pk).exclude(
+                    clothing_type_id=self.clothing_type_id, price_range_id=self.price_range_id
+                ).update(clothing_type_id=self.clothing_type_id, price_range_id=self.price_range_id)
+    
     class Meta:
         verbose_name = "服装商品"
         verbose_name_plural = verbose_name
+        indexes = [
+            # 覆盖索引：商品目录按服装类型、价格区间筛选与分面计数
+            models.Index(fields=['clothing_type', 'price_range', 'price', 'stock'], name='clothing_facet_cover'),
+            # 覆盖索引：只按价格上下限、库存筛选时的分面计数
+            models.Index(fields=['price', 'stock', 'clothing_type', 'price_range'], name='clothing_price_cover'),
+        ]
 
-class SalesOrder(models.Model):
+class IdSequence(models.Model):
+    """
+    分片表的全局主键序列：各数据库的自增主键会重复，开启 SALES_SHARDS 后新订单与订单条目的主键
+    由默认库中的序列统一分配，首次分配时从所有数据库中的最大主键之后开始
+    """
+    name = models.CharField(max_length=100, primary_key=True, verbose_name="模型")
+    next_id = models.BigIntegerField(verbose_name="下一个主键")
+    
+    def __str__(self):
+        return f"{self.name}: {self.next_id}"
+    
+    @classmethod
+    def assign(cls, model, objs):
+        """为没有主键的对象分配连续的全局主键"""
+        objs = [obj for obj in objs if obj.pk is None]
+        if not objs:
+            return
+        label = model._meta.label
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            if not cls.objects.filter(name=label).update(next_id=F('next_id') + len(objs)):
+                start = max(
+                    model._base_manager.using(alias).aggregate(max_id=Max('pk'))['max_id'] or 0
+                    for alias in sales_databases()
+                ) + 1
+                cls.objects.get_or_create(name=label, defaults={'next_id': start})
+                cls.objects.filter(name=label).update(next_id=F('next_id') + len(objs))
+            end = cls.objects.get(name=label).next_id
+        for pk, obj in zip(range(end - len(objs), end), objs):
+            obj.pk = pk
+    
+    class Meta:
+        verbose_name = "主键序列"
+        verbose_name_plural = verbose_name
+
+class ShardedQuerySet(VersionedQuerySet):
+    """按地区分片的表的查询集：未指定数据库的批量创建先分配全局主键，再按分片分组写入"""
+    
+    def shard_groups(self, objs):
+        """把待写入的对象按目标数据库分组，返回 [(别名, 对象列表)]"""
+        if self._db is not None or not sharding_enabled():
+            return [(self.db, objs)]
+        IdSequence.assign(self.model, objs)
+        groups = {}
+        for obj in objs:
+            groups.setdefault(router.db_for_write(self.model, instance=obj), []).append(obj)
+        return list(groups.items())
+    
+    def create(self, **kwargs):
+        # QuerySet.create 总是传入 using，未指定数据库时改由路由按地区选择
+        if self._db is not None or not sharding_enabled():
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for alias, group in self.shard_groups(objs):
+            super(ShardedQuerySet, self.using(alias)).bulk_create(group, *args, **kwargs)
+        return objs
+
+def _prepare_shard_save(instance, kwargs):
+    """单条保存前分配全局主键，返回写入的数据库别名"""
+    if instance._state.adding and instance.pk is None and sharding_enabled():
+        IdSequence.assign(instance.__class__, [instance])
+        # 主键已分配，直接插入而不是先尝试更新
+        kwargs.setdefault('force_insert', True)
+    return kwargs.get('using') or router.db_for_write(instance.__class__, instance=instance)
+
+class SalesOrder(VersionedModel):
     """销售订单模型"""
     order_number = models.CharField(max_length=50, unique=True, verbose_name="订单编号")
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="用户")
@@ -77,28 +229,157 @@ class SalesOrder(models.Model):
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="订单总额")
     order_date = models.DateTimeField(auto_now_add=True, verbose_name="订单日期")
     
+    objects = ShardedQuerySet.as_manager()
+    
     def __str__(self):
         return self.order_number
     
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        using = _prepare_shard_save(self, kwargs)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            if adding:
+                send_order_created(self.__class__, [self])
+        # 订单日期与地区冗余在订单条目上，修改时同步
+        update_fields = kwargs.get('update_fields')
+        if not adding:
+            fields = {'order_date': self.order_date, 'region_id': self.region_id}
+            if update_fields is not None:
+                fields = {
+                    name: value for name, value in fields.items()
+                    if name in update_fields or name.replace('_id', '') in update_fields
+                }
+            if fields:
+                self.items.exclude(**fields).update(**fields)
+    
     class Meta:
         verbose_name = "销售订单"
         verbose_name_plural = verbose_name
 
-class OrderItem(models.Model):
+def fill_denormalized(items):
+    """
+    计算订单条目上的冗余字段：订单日期、地区、服装类型、价格区间与条目金额。
+    订单日期与地区在为空或条目换了订单时重新取自订单；未缓存订单或商品对象的条目各用一次查询取回。
+    """
+    for item in items:
+        # 从数据库读出后换了订单：原订单的日期与地区作废
+        if getattr(item, '_denormalized_order_id', item.order_id) != item.order_id:
+            item.order_date, item.region_id = None, None
+    missing_orders = {
+        item.order_id for item in items
+        if (item.order_date is None or item.region_id is None) and not OrderItem.order.is_cached(item)
+    }
+    orders = {}
+    # 分片时订单可能在任一数据库中
+    for alias in (sales_databases() if missing_orders else ()):
+        orders.update(
+            (order_id, (order_date, region_id))
+            for order_id, order_date, region_id in SalesOrder.objects.using(alias).filter(
+                pk__in=missing_orders
+            ).values_list('id', 'order_date', 'region_id')
+        )
+    missing_clothing = {item.clothing_id for item in items if not OrderItem.clothing.is_cached(item)}
+    clothing = {
+        clothing_id: (type_id, range_id)
+        for clothing_id, type_id, range_id in Clothing.objects.filter(
+            pk__in=missing_clothing
+        ).values_list('id', 'clothing_type_id', 'price_range_id')
+    } if missing_clothing else {}
+    
+    for item in items:
+        if item.order_date is None or item.region_id is None:
+            if OrderItem.order.is_cached(item):
+                order_date, region_id = item.order.order_date, item.order.region_id
+            else:
+                order_date, region_id = orders.get(item.order_id, (None, None))
+            item.order_date = item.order_date or order_date
+            item.region_id = item.region_id or region_id
+        item._denormalized_order_id = item.order_id
+        if OrderItem.clothing.is_cached(item):
+            item.clothing_type_id, item.price_range_id = item.clothing.clothing_type_id, item.clothing.price_range_id
+        else:
+            item.clothing_type_id, item.price_range_id = clothing.get(item.clothing_id, (None, None))
+        item.line_total = Decimal(item.price) * item.quantity
+
+class OrderItemQuerySet(ShardedQuerySet):
+    """订单条目查询集：批量创建时同样补齐冗余字段并触发库存扣减等派生数据更新"""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        fill_denormalized(objs)
+        for alias, group in self.shard_groups(objs):
+            with transaction.atomic(using=alias):
+                super(ShardedQuerySet, self.using(alias)).bulk_create(group, *args, **kwargs)
+                send_order_items_created(self.model, group)
+        return objs
+
+class OrderItem(VersionedModel):
     """订单条目模型"""
     order = models.ForeignKey(SalesOrder, related_name='items', on_delete=models.CASCADE, verbose_name="订单")
     clothing = models.ForeignKey(Clothing, on_delete=models.CASCADE, verbose_name="服装商品")
     quantity = models.PositiveIntegerField(default=1, verbose_name="数量")
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="价格")
+    # 冗余订单日期，便于按时间过滤和在 MySQL 上按月分区
+    order_date = models.DateTimeField(null=True, blank=True, db_index=True, editable=False, verbose_name="订单日期")
+    # 冗余地区、服装类型、价格区间与条目金额，按维度汇总时无需关联订单与商品表，
+    # 配合下面的覆盖索引只扫描索引即可完成聚合；不建外键约束，与 MySQL 分区表一致
+    region = models.ForeignKey(
+        Region, on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+        db_constraint=False, db_index=False, related_name='+', verbose_name="地区"
+    )
+    clothing_type = models.ForeignKey(
+        ClothingType, on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+        db_constraint=False, db_index=False, related_name='+', verbose_name="服装类型"
+    )
+    price_range = models.ForeignKey(
+        PriceRange, on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+        db_constraint=False, db_index=False, related_name='+', verbose_name="价格区间"
+    )
+    line_total = models.DecimalField(
+        max_digits=12, decimal_places=2, null=True, blank=True, editable=False, verbose_name="条目金额"
+    )
+    
+    objects = OrderItemQuerySet.as_manager()
     
     def __str__(self):
         return f"{self.order.order_number} - {self.clothing.name}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记录冗余的订单日期与地区所属的订单，保存时发现换了订单则重新计算
+        if 'order_id' in instance.__dict__:
+            instance._denormalized_order_id = instance.order_id
+        return instance
+    
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        fill_denormalized([self])
+        using = _prepare_shard_save(self, kwargs)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            if adding:
+                send_order_items_created(self.__class__, [self])
+    
     class Meta:
         verbose_name = "订单条目"
         verbose_name_plural = verbose_name
+        indexes = [
+            # 覆盖索引：服装类型销售占比与价格预测
+            models.Index(
+                fields=['clothing_type', 'order_date', 'line_total', 'quantity', 'price'],
+                name='orderitem_type_cover'
+            ),
+            # 覆盖索引：价格区间销量
+            models.Index(fields=['price_range', 'order_date', 'line_total'], name='orderitem_range_cover'),
+            # 覆盖索引：地区×服装类型日销售序列重建
+            models.Index(
+                fields=['region', 'clothing_type', 'order_date', 'line_total'], name='orderitem_series_cover'
+            ),
+        ]
 
-class Rating(models.Model):
+class Rating(VersionedModel):
     """商品评价模型"""
     RATING_CHOICES = (
         (1, '1星'),
@@ -121,3 +402,267 @@ class Rating(models.Model):
     class Meta:
         verbose_name = "商品评价"
         verbose_name_plural = verbose_name
+
+class SalesVelocity(VersionedModel):
+    """商品销售速度模型：按天滚动窗口记录销量，窗口以定长环形缓冲区紧凑存储"""
+    clothing = models.OneToOneField(Clothing, related_name='velocity', on_delete=models.CASCADE, verbose_name="服装商品")
+    last_day = models.DateField(verbose_name="最近销售日期")
+    buckets = models.BinaryField(verbose_name="每日销量窗口")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+    
+    def __str__(self):
+        return f"{self.clothing.name} - {self.last_day}"
+    
+    class Meta:
+        verbose_name = "销售速度"
+        verbose_name_plural = verbose_name
+
+class ItemAssociation(VersionedModel):
+    """商品关联模型：经常一起购买的前K个商品"""
+    clothing = models.ForeignKey(Clothing, related_name='associations', on_delete=models.CASCADE, verbose_name="服装商品")
+    related_clothing = models.ForeignKey(Clothing, related_name='+', on_delete=models.CASCADE, verbose_name="关联商品")
+    rank = models.PositiveSmallIntegerField(verbose_name="排名")
+    co_count = models.PositiveIntegerField(verbose_name="共同购买订单数")
+    confidence = models.FloatField(verbose_name="置信度")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+    
+    def __str__(self):
+        return f"{self.clothing.name} -> {self.related_clothing.name}"
+    
+    class Meta:
+        verbose_name = "商品关联"
+        verbose_name_plural = verbose_name
+        ordering = ['clothing', 'rank']
+        indexes = [models.Index(fields=['clothing', 'rank'])]
+
+class CustomerStats(VersionedModel):
+    """客户消费统计模型：按用户累计的首末次下单日期、频次、金额与活跃月份"""
+    user = models.OneToOneField(User, related_name='customer_stats', on_delete=models.CASCADE, verbose_name="用户")
+    first_order_date = models.DateField(verbose_name="首次下单日期")
+    last_order_date = models.DateField(verbose_name="最近下单日期")
+    frequency = models.PositiveIntegerField(default=0, verbose_name="下单次数")
+    monetary = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="消费总额")
+    active_months = models.JSONField(default=list, verbose_name="活跃月份")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+    
+    def __str__(self):
+        return self.user.username
+    
+    class Meta:
+        verbose_name = "客户消费统计"
+        verbose_name_plural = verbose_name
+
+class AnalyticsSnapshot(VersionedModel):
+    """分析快照模型：保存批量计算好的分析结果及其数据水位"""
+    name = models.CharField(max_length=50, unique=True, verbose_name="快照名称")
+    payload = models.JSONField(verbose_name="快照内容")
+    watermark = models.BigIntegerField(default=0, verbose_name="数据水位")
+    created_at = models.DateTimeField(auto_now=True, verbose_name="生成时间")
+    
+    def __str__(self):
+        return self.name
+    
+    class Meta:
+        verbose_name = "分析快照"
+        verbose_name_plural = verbose_name
+
+class SalesSeriesStats(VersionedModel):
+    """地区×服装类型日销售额序列的流式统计（Welford 均值与方差）"""
+    region = models.ForeignKey(Region, on_delete=models.CASCADE, verbose_name="地区")
+    clothing_type = models.ForeignKey(ClothingType, on_delete=models.CASCADE, verbose_name="服装类型")
+    current_day = models.DateField(verbose_name="当前累计日期")
+    current_total = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="当日销售额")
+    n = models.PositiveIntegerField(default=0, verbose_name="已统计天数")
+    mean = models.FloatField(default=0, verbose_name="日销售额均值")
+    m2 = models.FloatField(default=0, verbose_name="离差平方和")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+    
+    def __str__(self):
+        return f"{self.region.name} - {self.clothing_type.name}"
+    
+    class Meta:
+        verbose_name = "销售序列统计"
+        verbose_name_plural = verbose_name
+        unique_together = ('region', 'clothing_type')
+
+class SalesAnomaly(VersionedModel):
+    """销售异常模型：日销售额偏离历史均值过大的地区×服装类型"""
+    DIRECTION_CHOICES = (
+        ('drop', '骤降'),
+        ('spike', '激增'),
+    )
+    
+    region = models.ForeignKey(Region, on_delete=models.CASCADE, verbose_name="地区")
+    clothing_type = models.ForeignKey(ClothingType, on_delete=models.CASCADE, verbose_name="服装类型")
+    day = models.DateField(verbose_name="日期")
+    value = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="当日销售额")
+    expected = models.FloatField(verbose_name="历史均值")
+    std = models.FloatField(verbose_name="历史标准差")
+    z_score = models.FloatField(verbose_name="Z分数")
+    direction = models.CharField(max_length=10, choices=DIRECTION_CHOICES, verbose_name="方向")
+    detected_at = models.DateTimeField(auto_now_add=True, verbose_name="发现时间")
+    
+    def __str__(self):
+        return f"{self.region.name} - {self.clothing_type.name} - {self.day}"
+    
+    class Meta:
+        verbose_name = "销售异常"
+        verbose_name_plural = verbose_name
+        unique_together = ('region', 'clothing_type', 'day')
+        ordering = ['-day', '-detected_at']
+
+class ImportCheckpoint(models.Model):
+    """数据导入断点：与每批数据在同一事务中提交，保证中断后可从断点继续"""
+    source = models.CharField(max_length=255, unique=True, verbose_name="数据来源")
+    rows_done = models.BigIntegerField(default=0, verbose_name="已导入行数")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+    
+    def __str__(self):
+        return f"{self.source} - {self.rows_done}"
+    
+    class Meta:
+        verbose_name = "导入断点"
+        verbose_name_plural = verbose_name
+
+class ArchivedSalesOrder(VersionedModel):
+    """归档销售订单：不支持分区的数据库上用于存放冷数据的归档表"""
+    id = models.BigIntegerField(primary_key=True, verbose_name="ID")
+    order_number = models.CharField(max_length=50, verbose_name="订单编号")
+    user_id = models.BigIntegerField(verbose_name="用户ID")
+    region_id = models.BigIntegerField(verbose_name="地区ID")
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="订单总额")
+    order_date = models.DateTimeField(db_index=True, verbose_name="订单日期")
+    
+    def __str__(self):
+        return self.order_number
+    
+    class Meta:
+        verbose_name = "归档销售订单"
+        verbose_name_plural = verbose_name
+
+class ArchivedOrderItem(VersionedModel):
+    """归档订单条目"""
+    id = models.BigIntegerField(primary_key=True, verbose_name="ID")
+    order_id = models.BigIntegerField(db_index=True, verbose_name="订单ID")
+    clothing_id = models.BigIntegerField(verbose_name="服装商品ID")
+    quantity = models.PositiveIntegerField(verbose_name="数量")
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="价格")
+    order_date = models.DateTimeField(null=True, db_index=True, verbose_name="订单日期")
+    
+    def __str__(self):
+        return f"{self.order_id} - {self.clothing_id}"
+    
+    class Meta:
+        verbose_name = "归档订单条目"
+        verbose_name_plural = verbose_name
+
+class OrderNumber(models.Model):
+    """
+    已使用的订单编号：订单表转为分区表或冷数据移入归档表后，订单表上的唯一索引不再覆盖全部订单，
+    由 archive.guard_order_numbers 在订单表上安装的触发器登记编号，重复的编号在插入时报错（见 archive.py）
+    """
+    order_number = models.CharField(max_length=50, primary_key=True, verbose_name="订单编号")
+    
+    def __str__(self):
+        return self.order_number
+    
+    class Meta:
+        verbose_name = "已用订单编号"
+        verbose_name_plural = verbose_name
+
+class OrderEvent(models.Model):
+    """订单事件发件箱：与订单/订单条目在同一事务中写入，由 process_outbox 批量处理派生数据"""
+    ORDER_CREATED = 'order_created'
+    ITEMS_CREATED = 'items_created'
+    KIND_CHOICES = (
+        (ORDER_CREATED, '订单创建'),
+        (ITEMS_CREATED, '订单条目创建'),
+    )
+    
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name="事件类型")
+    # 派生数据所需的字段快照，批量创建在 MySQL 上拿不到主键，因此不只记录ID
+    payload = models.JSONField(verbose_name="事件数据")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="写入时间")
+    processed_at = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name="处理时间")
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.id}"
+    
+    class Meta:
+        verbose_name = "订单事件"
+        verbose_name_plural = verbose_name
+
+class SalesOrderSample(VersionedModel):
+    """订单抽样：按订单ID哈希做伯努利抽样的订单，供近似分析使用"""
+    id = models.BigIntegerField(primary_key=True, verbose_name="订单ID")
+    region_id = models.BigIntegerField(verbose_name="地区ID")
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="订单总额")
+    order_date = models.DateTimeField(verbose_name="订单日期")
+    
+    def __str__(self):
+        return f"{self.id}"
+    
+    class Meta:
+        verbose_name = "订单抽样"
+        verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(fields=['region_id', 'order_date', 'total_amount'], name='ordersample_region_cover'),
+        ]
+
+class OrderItemSample(VersionedModel):
+    """订单条目抽样：按条目ID哈希做伯努利抽样的条目及其冗余维度"""
+    id = models.BigIntegerField(primary_key=True, verbose_name="条目ID")
+    order_id = models.BigIntegerField(db_index=True, verbose_name="订单ID")
+    clothing_id = models.BigIntegerField(db_index=True, verbose_name="服装商品ID")
+    region_id = models.BigIntegerField(null=True, verbose_name="地区ID")
+    clothing_type_id = models.BigIntegerField(null=True, verbose_name="服装类型ID")
+    price_range_id = models.BigIntegerField(null=True, verbose_name="价格区间ID")
+    line_total = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="条目金额")
+    order_date = models.DateTimeField(verbose_name="订单日期")
+    
+    def __str__(self):
+        return f"{self.order_id} - {self.clothing_id}"
+    
+    class Meta:
+        verbose_name = "订单条目抽样"
+        verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(fields=['clothing_type_id', 'order_date', 'line_total'], name='itemsample_type_cover'),
+            models.Index(fields=['price_range_id', 'order_date', 'line_total'], name='itemsample_range_cover'),
+        ]
+
+class CustomerSketch(VersionedModel):
+    """去重客户数的 HyperLogLog 草图：每个地区、每个服装类型一行"""
+    REGION = 'region'
+    CLOTHING_TYPE = 'clothing_type'
+    DIMENSION_CHOICES = (
+        (REGION, '地区'),
+        (CLOTHING_TYPE, '服装类型'),
+    )
+    
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES, verbose_name="维度")
+    key = models.BigIntegerField(verbose_name="维度ID")
+    registers = models.BinaryField(verbose_name="寄存器")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+    
+    def __str__(self):
+        return f"{self.get_dimension_display()} #{self.key}"
+    
+    class Meta:
+        verbose_name = "客户草图"
+        verbose_name_plural = verbose_name
+        unique_together = ('dimension', 'key')
+
+class CostBudgetUsage(models.Model):
+    """分析准入预算的用量：每个范围（用户或全局）每个预算周期一行，用 F() 原子地增减"""
+    scope = models.CharField(max_length=50, verbose_name="预算范围")
+    window = models.BigIntegerField(verbose_name="预算周期")
+    used = models.BigIntegerField(default=0, verbose_name="已用成本")
+    
+    def __str__(self):
+        return f"{self.scope} #{self.window}: {self.used}"
+    
+    class Meta:
+        verbose_name = "准入预算用量"
+        verbose_name_plural = verbose_name
+        unique_together = ('scope', 'window')
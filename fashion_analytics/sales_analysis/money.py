@@ -0,0 +1,42 @@
+"""
+分析链路上的整数分金额表示。
+
+金额以 DecimalField 保存，逐行取出时每个值都要构造一个 Decimal 对象，放进 pandas / NumPy 后
+只能是 object 数组，运算慢且占内存；先转成 float 又会在累加时引入舍入误差。分析链路改为让数据库
+直接返回整数分（Cents 表达式），在 int64 数组上做精确的聚合与向量化计算，输出时再由 from_cents
+转换回接口使用的两位小数。
+"""
+from decimal import Decimal
+
+import numpy as np
+from django.db import models
+from django.db.models import F
+from django.db.models.functions import Cast, Round
+
+CENTS_PER_UNIT = 100
+
+
+class CentsField(models.BigIntegerField):
+    """整数分字段：Cents 表达式及其聚合的输出类型，数据库返回的 Decimal / float 一律转为 int"""
+    
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else int(value)
+
+
+class Cents(Cast):
+    """把金额列或表达式转换为整数分：CAST(ROUND(金额 * 100) AS BIGINT)"""
+    
+    def __init__(self, expression):
+        if isinstance(expression, str):
+            expression = F(expression)
+        super().__init__(Round(expression * CENTS_PER_UNIT), output_field=CentsField())
+
+
+def from_cents(cents):
+    """整数分转换为两位小数的 Decimal"""
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def cents_array(values):
+    """把整数分序列读入 int64 数组"""
+    return np.fromiter(values, dtype=np.int64)
@@ -0,0 +1,120 @@
+"""
+订单事件发件箱（ORDER_EVENTS_MODE = 'outbox'）。
+
+写订单的请求只在同一事务中追加 OrderEvent，库存扣减、销售速度、异常检测等派生数据
+由 process_outbox 命令批量处理：同一批事件的派生数据更新与标记已处理在同一事务中提交，
+中途失败整批回滚后重试，每个事件只会生效一次。
+
+按地区分片时事件写入订单所在的数据库（与订单同一事务，分片上的回滚不会留下事件），
+process_outbox 逐库处理。分片上的事件与默认库中的派生数据分两次提交：派生数据先提交，
+两次提交之间失败时这批事件会被再次处理。
+"""
+import datetime
+from decimal import Decimal
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, Min, Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import SalesOrder, OrderItem, OrderEvent, fill_denormalized
+from .signals import order_created, order_items_created
+from .sharding import sales_databases
+
+ORDER_FIELDS = ('id', 'region_id', 'total_amount', 'order_date', 'user_id')
+ITEM_FIELDS = (
+    'id', 'order_id', 'clothing_id', 'quantity', 'price', 'order_date',
+    'region_id', 'clothing_type_id', 'price_range_id', 'line_total',
+)
+EVENT_MODELS = {
+    OrderEvent.ORDER_CREATED: (SalesOrder, ORDER_FIELDS),
+    OrderEvent.ITEMS_CREATED: (OrderItem, ITEM_FIELDS),
+}
+
+
+def _dump(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def record_events(kind, objects, using=DEFAULT_DB_ALIAS):
+    """在数据库 using 的当前事务中追加一条事件，记录派生数据所需的字段"""
+    _, fields = EVENT_MODELS[kind]
+    OrderEvent.objects.using(using).create(kind=kind, payload=[
+        [_dump(getattr(obj, field)) for field in fields] for obj in objects
+    ])
+
+
+def event_objects(event):
+    """由事件数据还原（未保存的）模型实例，供信号接收方使用"""
+    model, fields = EVENT_MODELS[event.kind]
+    objects = []
+    for row in event.payload:
+        values = dict(zip(fields, row))
+        for field in ('total_amount', 'price', 'line_total'):
+            if values.get(field) is not None:
+                values[field] = Decimal(values[field])
+        if values.get('order_date'):
+            values['order_date'] = parse_datetime(values['order_date'])
+        objects.append(model(**values))
+    # 旧版本写入的条目事件没有冗余维度字段，按当前数据补齐
+    if model is OrderItem and objects and len(event.payload[0]) < len(fields):
+        fill_denormalized(objects)
+    return objects
+
+
+def process_batch(batch_size=500, using=DEFAULT_DB_ALIAS):
+    """处理数据库 using 中的一批未处理事件，返回处理的事件数"""
+    with transaction.atomic(using=using):
+        # 多个 worker 并行时跳过其他 worker 已锁定的事件（SQLite 上忽略行锁）
+        events = list(OrderEvent.objects.using(using).select_for_update(skip_locked=True).filter(
+            processed_at__isnull=True
+        ).order_by('id')[:batch_size])
+        if not events:
+            return 0
+        
+        # 派生数据写入默认库；事件在默认库时与标记已处理同一事务提交
+        with transaction.atomic():
+            # 同类事件合并后发送一次信号，库存扣减等按批聚合更新
+            orders, items = [], []
+            for event in events:
+                (orders if event.kind == OrderEvent.ORDER_CREATED else items).extend(event_objects(event))
+            if orders:
+                order_created.send(sender=SalesOrder, orders=orders)
+            if items:
+                order_items_created.send(sender=OrderItem, items=items)
+        
+        OrderEvent.objects.using(using).filter(
+            pk__in=[event.pk for event in events]
+        ).update(processed_at=timezone.now())
+    return len(events)
+
+
+def outbox_lag():
+    """发件箱积压情况（合并各分片）：未处理事件数、最早未处理事件的写入时间与积压秒数"""
+    pending_events, oldest, last_processed = 0, None, None
+    for alias in sales_databases():
+        events = OrderEvent.objects.using(alias)
+        pending = events.filter(processed_at__isnull=True).aggregate(count=Count('pk'), oldest=Min('created_at'))
+        last = events.aggregate(last=Max('processed_at'))['last']
+        pending_events += pending['count']
+        oldest = min(filter(None, (oldest, pending['oldest'])), default=None)
+        last_processed = max(filter(None, (last_processed, last)), default=None)
+    return {
+        'pending_events': pending_events,
+        'oldest_pending_at': oldest,
+        'lag_seconds': round((timezone.now() - oldest).total_seconds(), 1) if oldest else 0,
+        'last_processed_at': last_processed,
+    }
+
+
+def purge_processed(before):
+    """删除各库中 before 之前已处理的事件，返回删除数"""
+    deleted = 0
+    for alias in sales_databases():
+        count, _ = OrderEvent.objects.using(alias).filter(processed_at__lt=before).delete()
+        deleted += count
+    return deleted
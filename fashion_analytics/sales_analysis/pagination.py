@@ -0,0 +1,7 @@
+from rest_framework.pagination import PageNumberPagination
+
+
+class PageSizePagination(PageNumberPagination):
+    """默认每页10条，客户端可通过 page_size 参数调整，最多1000条"""
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
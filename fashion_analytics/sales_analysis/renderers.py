@@ -0,0 +1,33 @@
+"""MessagePack 渲染器（需安装 msgpack），请求头 Accept: application/msgpack 时启用"""
+import datetime
+import uuid
+from decimal import Decimal
+
+from rest_framework.renderers import BaseRenderer
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f'无法序列化为 MessagePack 的类型: {type(value).__name__}')
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_default, use_bin_type=True)
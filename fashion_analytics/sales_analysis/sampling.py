@@ -0,0 +1,394 @@
+"""
+近似分析：抽样表与 HyperLogLog 草图。
+
+订单与订单条目按主键哈希以固定比例做伯努利抽样，写入 SalesOrderSample / OrderItemSample。
+分析接口带 approx=1 时在样本上聚合并按抽样比例放大（Horvitz-Thompson 估计），同时返回
+95% 置信区间的半宽；各地区、各服装类型的去重客户数由 HyperLogLog 草图估计。
+
+样本与草图在订单写入时增量维护，订单或商品修改时同步样本中的冗余字段；
+抽样比例变化、导入历史数据或用 ORM 以外的方式删改订单后，用 rebuild_sales_samples 重建。
+"""
+import math
+from collections import defaultdict
+from itertools import chain
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Sum, Count, F, FloatField
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import (
+    Region, ClothingType, PriceRange, Clothing, SalesOrder, OrderItem, AnalyticsSnapshot,
+    SalesOrderSample, OrderItemSample, CustomerSketch,
+)
+from .filters import window_filter
+from .dimensions import dimension_names, dimension_rows
+from .signals import order_created, order_items_created
+from .sharding import sales_databases
+
+SAMPLE_SNAPSHOT = 'sales_sample'
+
+# 95% 置信区间
+Z_95 = 1.96
+
+# HyperLogLog：2^12 个寄存器，相对标准误差 1.04 / sqrt(m) ≈ 1.6%
+HLL_PRECISION = 12
+HLL_REGISTERS = 1 << HLL_PRECISION
+HLL_ERROR = 1.04 / math.sqrt(HLL_REGISTERS)
+
+CENT = Decimal('0.01')
+
+
+# ---------- 哈希与抽样 ----------
+
+def hash64(values):
+    """splitmix64：对整数序列做确定性的 64 位哈希"""
+    z = np.asarray(values, dtype=np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def sample_rate():
+    """当前样本的抽样比例；样本按重建时的比例维护，修改设置后需重建"""
+    snapshot = AnalyticsSnapshot.objects.filter(name=SAMPLE_SNAPSHOT).first()
+    if snapshot is None:
+        return settings.ANALYTICS_SAMPLE_RATE
+    return snapshot.payload['rate']
+
+
+def sampled(ids, rate):
+    """按主键哈希决定是否入样，同一主键每次结果相同，重建样本可复现"""
+    if not len(ids):
+        return np.zeros(0, dtype=bool)
+    threshold = min(int(rate * 2 ** 64), 2 ** 64 - 1)
+    return hash64(ids) < np.uint64(threshold)
+
+
+# ---------- HyperLogLog ----------
+
+def _bit_length(values):
+    length = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        upper = values >> np.uint64(shift)
+        higher = upper != 0
+        length[higher] += shift
+        values = np.where(higher, upper, values)
+    return length + (values != 0)
+
+
+def registers_of(user_ids):
+    """由用户ID计算 HyperLogLog 寄存器"""
+    registers = np.zeros(HLL_REGISTERS, dtype=np.uint8)
+    if not len(user_ids):
+        return registers
+    hashes = hash64(user_ids)
+    width = 64 - HLL_PRECISION
+    index = (hashes >> np.uint64(width)).astype(np.int64)
+    rank = width - _bit_length(hashes & np.uint64((1 << width) - 1)) + 1
+    np.maximum.at(registers, index, rank.astype(np.uint8))
+    return registers
+
+
+def estimate_distinct(registers):
+    """HyperLogLog 基数估计，基数较小时使用线性计数"""
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.power(2.0, -registers.astype(np.float64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * math.log(m / zeros)
+    return estimate
+
+
+def merge_sketches(updates):
+    """把 {(维度, ID): 寄存器} 合并到草图（逐元素取最大值），只锁定确实需要更新的行"""
+    updates = {key: registers for key, registers in updates.items() if registers.any()}
+    if not updates:
+        return
+    
+    def pending(rows):
+        changed = {}
+        for row in rows:
+            current = np.frombuffer(row.registers, dtype=np.uint8)
+            merged = np.maximum(current, updates[(row.dimension, row.key)])
+            if not np.array_equal(merged, current):
+                changed[(row.dimension, row.key)] = (row, merged)
+        return changed
+    
+    lookup = {
+        'dimension__in': {dimension for dimension, _ in updates},
+        'key__in': {key for _, key in updates},
+    }
+    # 寄存器只增不减：未加锁读到的旧值已覆盖新寄存器时，最新值也一定覆盖，无需加锁写入
+    rows = [row for row in CustomerSketch.objects.filter(**lookup) if (row.dimension, row.key) in updates]
+    existing = {(row.dimension, row.key) for row in rows}
+    if existing == set(updates) and not pending(rows):
+        return
+    
+    with transaction.atomic():
+        CustomerSketch.objects.bulk_create([
+            CustomerSketch(dimension=dimension, key=key, registers=bytes(HLL_REGISTERS))
+            for dimension, key in updates if (dimension, key) not in existing
+        ], ignore_conflicts=True)
+        rows = [
+            row for row in CustomerSketch.objects.select_for_update().filter(**lookup)
+            if (row.dimension, row.key) in updates
+        ]
+        now = timezone.now()
+        changed = []
+        for row, merged in pending(rows).values():
+            row.registers = merged.tobytes()
+            row.updated_at = now
+            changed.append(row)
+        CustomerSketch.objects.bulk_update(changed, ['registers', 'updated_at'])
+
+
+def _sketch_updates(dimension, pairs):
+    """由 (维度ID, 用户ID) 列表计算各维度的寄存器"""
+    users = defaultdict(list)
+    for key, user_id in pairs:
+        if key is not None and user_id is not None:
+            users[key].append(user_id)
+    return {(dimension, key): registers_of(user_ids) for key, user_ids in users.items()}
+
+
+# ---------- 增量维护 ----------
+
+def _order_sample(order):
+    return SalesOrderSample(
+        id=order.id, region_id=order.region_id, total_amount=order.total_amount, order_date=order.order_date
+    )
+
+
+def _item_sample(item):
+    return OrderItemSample(
+        id=item.id, order_id=item.order_id, clothing_id=item.clothing_id, region_id=item.region_id,
+        clothing_type_id=item.clothing_type_id, price_range_id=item.price_range_id,
+        line_total=item.line_total, order_date=item.order_date
+    )
+
+
+@receiver(order_created, dispatch_uid='sample_orders')
+def sample_orders(sender, orders, **kwargs):
+    """订单创建后按抽样比例写入样本，并把客户计入地区草图"""
+    # MySQL 上批量创建拿不到主键，这些订单在重建样本时补入
+    orders = [order for order in orders if order.pk is not None]
+    if not orders:
+        return
+    keep = sampled([order.pk for order in orders], sample_rate())
+    SalesOrderSample.objects.bulk_create(
+        [_order_sample(order) for order, kept in zip(orders, keep) if kept], ignore_conflicts=True
+    )
+    merge_sketches(_sketch_updates(
+        CustomerSketch.REGION, [(order.region_id, order.user_id) for order in orders]
+    ))
+
+
+@receiver(order_items_created, dispatch_uid='sample_order_items')
+def sample_items(sender, items, **kwargs):
+    """订单条目创建后按抽样比例写入样本，并把客户计入服装类型草图"""
+    items = [item for item in items if item.pk is not None]
+    if not items:
+        return
+    keep = sampled([item.pk for item in items], sample_rate())
+    OrderItemSample.objects.bulk_create(
+        [_item_sample(item) for item, kept in zip(items, keep) if kept], ignore_conflicts=True
+    )
+    
+    users = {item.order_id: item.order.user_id for item in items if OrderItem.order.is_cached(item)}
+    missing = {item.order_id for item in items} - users.keys()
+    for alias in (sales_databases() if missing else ()):
+        users.update(SalesOrder.objects.using(alias).filter(pk__in=missing).values_list('id', 'user_id'))
+    merge_sketches(_sketch_updates(
+        CustomerSketch.CLOTHING_TYPE, [(item.clothing_type_id, users.get(item.order_id)) for item in items]
+    ))
+
+
+@receiver(post_save, sender=SalesOrder, dispatch_uid='sync_order_sample')
+def sync_order_sample(sender, instance, created, using, **kwargs):
+    """订单修改后同步样本中的金额、地区与日期（新订单由 order_created 处理）"""
+    if created:
+        return
+    pk, region_id, total_amount, order_date = instance.pk, instance.region_id, instance.total_amount, instance.order_date
+    
+    def sync():
+        SalesOrderSample.objects.filter(id=pk).update(
+            region_id=region_id, total_amount=total_amount, order_date=order_date
+        )
+        OrderItemSample.objects.filter(order_id=pk).update(region_id=region_id, order_date=order_date)
+    
+    if using == DEFAULT_DB_ALIAS:
+        sync()
+    else:
+        # 样本在默认库，分片上的订单修改提交后再同步，回滚时不留下修改
+        transaction.on_commit(sync, using=using)
+
+
+@receiver(post_save, sender=Clothing, dispatch_uid='sync_item_sample')
+def sync_item_sample(sender, instance, created, **kwargs):
+    """商品修改后同步样本中的服装类型与价格区间"""
+    if created:
+        return
+    OrderItemSample.objects.filter(clothing_id=instance.pk).update(
+        clothing_type_id=instance.clothing_type_id, price_range_id=instance.price_range_id
+    )
+
+
+def discard_samples(start, end):
+    """订单移出在线表（归档）时删除对应区间的样本；草图无法删除，保留到下次重建"""
+    for model in (OrderItemSample, SalesOrderSample):
+        model.objects.filter(order_date__gte=start, order_date__lt=end).delete()
+
+
+def rebuild_samples(rate=None, batch_size=50000):
+    """按抽样比例全量重建样本表与客户草图，返回 (订单样本数, 条目样本数)"""
+    rate = settings.ANALYTICS_SAMPLE_RATE if rate is None else rate
+    order_fields = ('id', 'region_id', 'total_amount', 'order_date')
+    item_fields = (
+        'id', 'order_id', 'clothing_id', 'region_id', 'clothing_type_id', 'price_range_id',
+        'line_total', 'order_date'
+    )
+    counts = []
+    with transaction.atomic():
+        for model, sample_model, fields in (
+            (SalesOrder, SalesOrderSample, order_fields),
+            (OrderItem, OrderItemSample, item_fields),
+        ):
+            sample_model.objects.all().delete()
+            count = 0
+            for alias in sales_databases():
+                queryset = model.objects.using(alias)
+                last_id = queryset.order_by('-id').values_list('id', flat=True).first() or 0
+                for start in range(0, last_id, batch_size):
+                    rows = list(queryset.filter(
+                        id__gt=start, id__lte=start + batch_size
+                    ).values_list(*fields))
+                    keep = sampled([row[0] for row in rows], rate)
+                    samples = [sample_model(**dict(zip(fields, row))) for row, kept in zip(rows, keep) if kept]
+                    sample_model.objects.bulk_create(samples, batch_size=1000)
+                    count += len(samples)
+            counts.append(count)
+        
+        CustomerSketch.objects.all().delete()
+        # 各库的 (维度, 用户) 对合并后再计算草图，同一用户在多个库出现时由 HLL 去重
+        sketches = {}
+        sketches.update(_sketch_updates(CustomerSketch.REGION, chain.from_iterable(
+            SalesOrder.objects.using(alias).values_list('region_id', 'user_id').distinct().iterator(chunk_size=batch_size)
+            for alias in sales_databases()
+        )))
+        sketches.update(_sketch_updates(CustomerSketch.CLOTHING_TYPE, chain.from_iterable(
+            OrderItem.objects.using(alias).values_list(
+                'clothing_type_id', 'order__user_id'
+            ).distinct().iterator(chunk_size=batch_size)
+            for alias in sales_databases()
+        )))
+        CustomerSketch.objects.bulk_create([
+            CustomerSketch(dimension=dimension, key=key, registers=registers.tobytes())
+            for (dimension, key), registers in sketches.items()
+        ])
+        AnalyticsSnapshot.objects.update_or_create(
+            name=SAMPLE_SNAPSHOT, defaults={'payload': {'rate': rate}, 'watermark': 0}
+        )
+    return tuple(counts)
+
+
+# ---------- 近似查询 ----------
+
+def _estimate(count, total, squares, rate):
+    """
+    伯努利抽样的 Horvitz-Thompson 估计：总额 Σy/p、行数 n/p，
+    方差 (1-p)/p² · Σy² 与 (1-p)/p² · n，返回估计值与 95% 置信区间半宽
+    """
+    spread = Z_95 * math.sqrt(1 - rate) / rate
+    return {
+        'total_sales': (Decimal(total or 0) / Decimal(rate)).quantize(CENT),
+        'total_sales_error': Decimal(spread * math.sqrt(squares or 0)).quantize(CENT),
+        'order_count': round(count / rate),
+        'order_count_error': round(spread * math.sqrt(count)),
+    }
+
+
+def _sample_totals(queryset, group, amount):
+    return {
+        row[group]: row for row in queryset.values(group).annotate(
+            count=Count('id'),
+            total=Sum(amount),
+            squares=Sum(F(amount) * F(amount), output_field=FloatField()),
+        ).order_by()
+    }
+
+
+def distinct_customers(dimension):
+    """各维度ID的去重客户估计值与 95% 置信区间半宽"""
+    result = {}
+    for key, registers in CustomerSketch.objects.filter(dimension=dimension).values_list('key', 'registers'):
+        estimate = estimate_distinct(np.frombuffer(registers, dtype=np.uint8))
+        result[key] = (round(estimate), round(Z_95 * HLL_ERROR * estimate))
+    return result
+
+
+def _with_customers(row, customers, key, all_time):
+    # 草图覆盖全部历史，只在不限时间窗口时返回
+    estimate, error = customers.get(key, (0, 0)) if all_time else (None, None)
+    row['customers'] = estimate
+    row['customers_error'] = error
+    return row
+
+
+def approx_region_sales(start=None, end=None):
+    """在订单样本上估计各地区销售额与订单数"""
+    rate = sample_rate()
+    totals = _sample_totals(
+        SalesOrderSample.objects.filter(**window_filter('order_date', start, end)), 'region_id', 'total_amount'
+    )
+    all_time = start is None and end is None
+    customers = distinct_customers(CustomerSketch.REGION) if all_time else {}
+    result = []
+    for region_id, name in dimension_names(Region).items():
+        if region_id in totals:
+            row = totals[region_id]
+            result.append(_with_customers(
+                {'region_name': name, **_estimate(row['count'], row['total'], row['squares'], rate)},
+                customers, region_id, all_time
+            ))
+    result.sort(key=lambda item: -item['total_sales'])
+    return result
+
+
+def approx_clothing_type_sales(start=None, end=None):
+    """在条目样本上估计各服装类型销售额与条目数"""
+    rate = sample_rate()
+    totals = _sample_totals(
+        OrderItemSample.objects.filter(**window_filter('order_date', start, end)), 'clothing_type_id', 'line_total'
+    )
+    all_time = start is None and end is None
+    customers = distinct_customers(CustomerSketch.CLOTHING_TYPE) if all_time else {}
+    result = []
+    for type_id, name in dimension_names(ClothingType).items():
+        if type_id in totals:
+            row = totals[type_id]
+            result.append(_with_customers(
+                {'clothing_type_name': name, **_estimate(row['count'], row['total'], row['squares'], rate)},
+                customers, type_id, all_time
+            ))
+    result.sort(key=lambda item: -item['total_sales'])
+    return result
+
+
+def approx_price_range_sales(start=None, end=None):
+    """在条目样本上估计各价格区间销售额与条目数，按价格区间从低到高排列"""
+    rate = sample_rate()
+    totals = _sample_totals(
+        OrderItemSample.objects.filter(**window_filter('order_date', start, end)), 'price_range_id', 'line_total'
+    )
+    result = []
+    for price_range in dimension_rows(PriceRange):
+        if price_range['id'] in totals:
+            row = totals[price_range['id']]
+            result.append({'price_range_name': price_range['name'], **_estimate(row['count'], row['total'], row['squares'], rate)})
+    return result
@@ -2,8 +2,11 @@ from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import (
     Region, ClothingType, PriceRange, RatingCategory, 
-    Clothing, SalesOrder, OrderItem, Rating
+    Clothing, SalesOrder, OrderItem, Rating, SalesAnomaly
 )
+from .dimensions import DimensionNameField
+from .sparse_fields import SparseFieldsMixin
+from .thumbnails import ThumbnailField
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -19,59 +22,68 @@ class UserSerializer(serializers.ModelSerializer):
             user.save()
         return user
 
-class RegionSerializer(serializers.ModelSerializer):
+class RegionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Region
         fields = '__all__'
 
-class ClothingTypeSerializer(serializers.ModelSerializer):
+class ClothingTypeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = ClothingType
         fields = '__all__'
 
-class PriceRangeSerializer(serializers.ModelSerializer):
+class PriceRangeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = PriceRange
         fields = '__all__'
 
-class RatingCategorySerializer(serializers.ModelSerializer):
+class RatingCategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = RatingCategory
         fields = '__all__'
 
-class ClothingSerializer(serializers.ModelSerializer):
-    clothing_type_name = serializers.ReadOnlyField(source='clothing_type.name')
-    price_range_name = serializers.ReadOnlyField(source='price_range.name')
+class ClothingSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    clothing_type_name = DimensionNameField(ClothingType, source='clothing_type_id')
+    price_range_name = DimensionNameField(PriceRange, source='price_range_id')
+    thumbnails = ThumbnailField(source='thumbnail_hash')
     
     class Meta:
         model = Clothing
         fields = '__all__'
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     clothing_name = serializers.ReadOnlyField(source='clothing.name')
     
     class Meta:
         model = OrderItem
         fields = '__all__'
 
-class SalesOrderSerializer(serializers.ModelSerializer):
+class SalesOrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     user_name = serializers.ReadOnlyField(source='user.username')
-    region_name = serializers.ReadOnlyField(source='region.name')
+    region_name = DimensionNameField(Region, source='region_id')
     
     class Meta:
         model = SalesOrder
         fields = '__all__'
 
-class RatingSerializer(serializers.ModelSerializer):
+class RatingSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user_name = serializers.ReadOnlyField(source='user.username')
     clothing_name = serializers.ReadOnlyField(source='clothing.name')
-    category_name = serializers.ReadOnlyField(source='category.name')
+    category_name = DimensionNameField(RatingCategory, source='category_id')
     
     class Meta:
         model = Rating
         fields = '__all__'
 
+class SalesAnomalySerializer(serializers.ModelSerializer):
+    region_name = DimensionNameField(Region, source='region_id')
+    clothing_type_name = DimensionNameField(ClothingType, source='clothing_type_id')
+    
+    class Meta:
+        model = SalesAnomaly
+        fields = '__all__'
+
 # 统计分析数据序列化器
 class RegionSalesSerializer(serializers.Serializer):
     region_name = serializers.CharField()
@@ -89,6 +101,22 @@ class PriceRangeSalesSerializer(serializers.Serializer):
     total_sales = serializers.DecimalField(max_digits=12, decimal_places=2)
     order_count = serializers.IntegerField()
 
+class ApproxSalesMixin(serializers.Serializer):
+    """近似分析（approx=1）的误差字段：95% 置信区间半宽"""
+    total_sales_error = serializers.DecimalField(max_digits=12, decimal_places=2)
+    order_count_error = serializers.IntegerField()
+
+class ApproxRegionSalesSerializer(RegionSalesSerializer, ApproxSalesMixin):
+    customers = serializers.IntegerField(allow_null=True)
+    customers_error = serializers.IntegerField(allow_null=True)
+
+class ApproxClothingTypeSalesSerializer(ClothingTypeSalesSerializer, ApproxSalesMixin):
+    customers = serializers.IntegerField(allow_null=True)
+    customers_error = serializers.IntegerField(allow_null=True)
+
+class ApproxPriceRangeSalesSerializer(PriceRangeSalesSerializer, ApproxSalesMixin):
+    pass
+
 class RatingDistributionSerializer(serializers.Serializer):
     rating_category = serializers.CharField()
     rating_count = serializers.IntegerField()
@@ -100,4 +128,55 @@ class SalesForecastSerializer(serializers.Serializer):
     
 class PriceForecastSerializer(serializers.Serializer):
     clothing_type = serializers.CharField()
-    forecasted_price = serializers.FloatField() 
\ No newline at end of file
+    forecasted_price = serializers.FloatField() 
+
+class StockoutForecastSerializer(serializers.Serializer):
+    clothing_id = serializers.IntegerField()
+    clothing_name = serializers.CharField()
+    clothing_type_name = serializers.CharField()
+    stock = serializers.IntegerField()
+    daily_velocity = serializers.FloatField()
+    days_until_stockout = serializers.FloatField(allow_null=True)
+    stockout_date = serializers.DateField(allow_null=True)
+
+class BoughtTogetherSerializer(serializers.Serializer):
+    clothing_id = serializers.IntegerField()
+    clothing_name = serializers.CharField()
+    co_count = serializers.IntegerField()
+    support = serializers.FloatField()
+    confidence = serializers.FloatField()
+    lift = serializers.FloatField()
+
+class RFMSegmentSerializer(serializers.Serializer):
+    segment = serializers.CharField()
+    customer_count = serializers.IntegerField()
+    percentage = serializers.FloatField()
+
+class CustomerRFMSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField()
+    username = serializers.CharField()
+    recency = serializers.IntegerField()
+    frequency = serializers.IntegerField()
+    monetary = serializers.FloatField()
+    r_score = serializers.IntegerField()
+    f_score = serializers.IntegerField()
+    m_score = serializers.IntegerField()
+    segment = serializers.CharField()
+
+class CohortRetentionSerializer(serializers.Serializer):
+    cohort = serializers.CharField()
+    size = serializers.IntegerField()
+    active_customers = serializers.ListField(child=serializers.IntegerField())
+    retention = serializers.ListField(child=serializers.FloatField())
+
+class OutboxLagSerializer(serializers.Serializer):
+    mode = serializers.CharField()
+    pending_events = serializers.IntegerField()
+    oldest_pending_at = serializers.DateTimeField(allow_null=True)
+    lag_seconds = serializers.FloatField()
+    last_processed_at = serializers.DateTimeField(allow_null=True)
+
+class RatingKeywordSerializer(serializers.Serializer):
+    keyword = serializers.CharField()
+    rating_count = serializers.IntegerField()
+    avg_rating = serializers.FloatField()
\ No newline at end of file
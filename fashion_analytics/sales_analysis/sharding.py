@@ -0,0 +1,190 @@
+"""
+订单与订单条目按地区分片。
+
+SALES_SHARDS 把地区代码映射到 DATABASES 中的别名：RegionShardRouter 把新订单写入其地区所在的数据库，
+订单条目跟随订单；未列出的地区与开启分片前的历史订单留在默认库。各数据库的自增主键会重复，开启分片后
+新行的主键由默认库中的 IdSequence 统一分配。用户、地区、服装类型、价格区间与商品等参照表以默认库为准，
+写入提交后复制到每个分片（分片上的订单外键需要引用它们），sync_shards 命令做全量复制。
+
+分析接口用 scatter 在所有数据库上并发执行同一个聚合查询，merge_partials 合并各分片按维度分组的部分和与
+计数，占比、平均值等在合并之后计算。客户分析、商品共现等派生数据的离线重建与冷数据归档逐库处理订单；批量 update / delete、
+列表接口、快照与 Parquet 导出只访问默认库，需要时用 .using(别名) 逐库执行。
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.signals import post_save, post_delete
+
+SHARDED_MODELS = {'sales_analysis.SalesOrder', 'sales_analysis.OrderItem'}
+
+# 复制到每个分片的参照表，按外键依赖顺序排列
+REFERENCE_MODELS = (
+    'auth.User', 'sales_analysis.Region', 'sales_analysis.ClothingType',
+    'sales_analysis.PriceRange', 'sales_analysis.Clothing',
+)
+
+
+def sharding_enabled():
+    return bool(settings.SALES_SHARDS)
+
+
+def sales_databases():
+    """保存订单与订单条目的全部数据库别名，默认库在前；未分片时只有默认库"""
+    return [DEFAULT_DB_ALIAS] + sorted(set(settings.SALES_SHARDS.values()) - {DEFAULT_DB_ALIAS})
+
+
+def shard_databases():
+    """默认库之外的分片"""
+    return sales_databases()[1:]
+
+
+def shard_for_region(region_id):
+    """地区的新订单写入的数据库别名"""
+    if not settings.SALES_SHARDS or region_id is None:
+        return DEFAULT_DB_ALIAS
+    from .dimensions import dimension_rows
+    from .models import Region
+    codes = {row['id']: row['code'] for row in dimension_rows(Region)}
+    return settings.SALES_SHARDS.get(codes.get(region_id), DEFAULT_DB_ALIAS)
+
+
+class RegionShardRouter:
+    """订单与订单条目按地区写入分片，参照表的读写固定在默认库"""
+    
+    def db_for_read(self, model, **hints):
+        if model._meta.label in REFERENCE_MODELS:
+            return DEFAULT_DB_ALIAS
+        # 订单与条目的关联查询由 Django 按实例所在的数据库执行，其余查询使用默认库
+        return None
+    
+    def db_for_write(self, model, **hints):
+        if model._meta.label in REFERENCE_MODELS:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if model._meta.label not in SHARDED_MODELS or not isinstance(instance, model):
+            return None
+        if not instance._state.adding:
+            # 已保存的行留在原数据库，修改地区不迁移分片
+            return instance._state.db
+        if model._meta.label == 'sales_analysis.OrderItem' and model.order.is_cached(instance):
+            if not instance.order._state.adding:
+                return instance.order._state.db
+        return shard_for_region(instance.region_id)
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        # 参照表在每个分片上都有副本，订单与条目同在一个分片
+        if {obj1._meta.label, obj2._meta.label} & SHARDED_MODELS:
+            return True
+        return None
+
+
+def scatter(query, databases=None):
+    """在每个数据库上并发执行 query(别名)，按 databases（默认为 sales_databases()）的顺序返回结果列表"""
+    databases = sales_databases() if databases is None else databases
+    if len(databases) == 1:
+        return [query(databases[0])]
+    
+    def run(alias):
+        try:
+            return query(alias)
+        finally:
+            # 工作线程的数据库连接不会在请求结束时关闭
+            connections.close_all()
+    
+    with ThreadPoolExecutor(max_workers=min(len(databases), settings.SALES_SHARD_WORKERS)) as executor:
+        return list(executor.map(run, databases))
+
+
+def _add(a, b):
+    if a is None:
+        return b
+    return a if b is None else a + b
+
+
+def merge_partials(parts, key, sums):
+    """合并各分片按 key 分组的行：sums 中的字段（部分和、计数）相加，其余字段取首次出现的值"""
+    merged = {}
+    for rows in parts:
+        for row in rows:
+            current = merged.get(row[key])
+            if current is None:
+                merged[row[key]] = dict(row)
+                continue
+            for name in sums:
+                current[name] = _add(current[name], row[name])
+    return list(merged.values())
+
+
+@contextmanager
+def sales_atomic():
+    """在保存订单的每个数据库上开启事务；各库依次提交，不是分布式事务"""
+    with ExitStack() as stack:
+        for alias in sales_databases():
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+
+
+def _batches(queryset, batch_size):
+    last = None
+    while True:
+        rows = queryset if last is None else queryset.filter(pk__gt=last)
+        rows = list(rows.order_by('pk')[:batch_size])
+        if not rows:
+            return
+        yield rows
+        last = rows[-1].pk
+
+
+def copy_reference(model, alias, pks=None, batch_size=1000):
+    """把参照表中的行（pks 为空时整表）从默认库复制到分片，删除默认库中已不存在的行，返回复制的行数"""
+    manager = model._base_manager.using(alias)
+    source = model._base_manager.using(DEFAULT_DB_ALIAS).all()
+    target = manager.all()
+    if pks is not None:
+        source, target = source.filter(pk__in=pks), target.filter(pk__in=pks)
+    fields = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+    
+    seen = set()
+    with transaction.atomic(using=alias):
+        existing = set(target.values_list('pk', flat=True))
+        for rows in _batches(source, batch_size):
+            seen.update(row.pk for row in rows)
+            manager.bulk_create([row for row in rows if row.pk not in existing])
+            manager.bulk_update([row for row in rows if row.pk in existing], fields)
+        # 删除时在分片上级联删除引用它们的订单与条目
+        stale = sorted(existing - seen)
+        for start in range(0, len(stale), batch_size):
+            manager.filter(pk__in=stale[start:start + batch_size]).delete()
+    return len(seen)
+
+
+def sync_reference(alias):
+    """全量复制所有参照表到分片，返回 {模型: 行数}"""
+    return {
+        label: copy_reference(apps.get_model(label), alias)
+        for label in REFERENCE_MODELS
+    }
+
+
+def replicate_reference(sender, instance, using, **kwargs):
+    """参照表在默认库写入后，事务提交时复制到各分片"""
+    if using != DEFAULT_DB_ALIAS or not shard_databases():
+        return
+    pk = instance.pk
+    
+    def replicate():
+        for alias in shard_databases():
+            copy_reference(sender, alias, [pk])
+    
+    transaction.on_commit(replicate)
+
+
+def connect_replication():
+    """只为参照表连接复制信号：不指定 sender 的 post_delete 接收者会让所有模型的删除无法走快速删除"""
+    for label in REFERENCE_MODELS:
+        model = apps.get_model(label)
+        post_save.connect(replicate_reference, sender=model, dispatch_uid=f'replicate_reference_saved:{label}')
+        post_delete.connect(replicate_reference, sender=model, dispatch_uid=f'replicate_reference_deleted:{label}')
@@ -0,0 +1,54 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.dispatch import Signal
+
+# 订单创建信号，参数 orders: 新创建的 SalesOrder 实例列表
+order_created = Signal()
+
+# 订单条目创建信号：单条保存与批量创建都会发送，参数 items: 新创建的 OrderItem 实例列表
+# ORDER_EVENTS_MODE 为 'inline' 时在写入的事务中同步发送（写入分片时在分片事务提交后发送）；
+# 为 'outbox' 时只在同一事务中写入订单所在数据库的发件箱，由 process_outbox 命令批量取出后发送
+order_items_created = Signal()
+
+_state = threading.local()
+
+
+@contextmanager
+def suspend_order_events():
+    """暂停发送订单条目信号（批量导入等场景），结束后由调用方统一重建派生数据"""
+    previous = getattr(_state, 'suspended', False)
+    _state.suspended = True
+    try:
+        yield
+    finally:
+        _state.suspended = previous
+
+
+def order_events_suspended():
+    return getattr(_state, 'suspended', False)
+
+
+def _dispatch(signal, kind, sender, objects, **kwargs):
+    if not objects or order_events_suspended():
+        return
+    # 订单写入的数据库：按地区分片时可能是分片
+    using = objects[0]._state.db or DEFAULT_DB_ALIAS
+    if settings.ORDER_EVENTS_MODE == 'outbox':
+        from .outbox import record_events
+        record_events(kind, objects, using=using)
+    elif using != DEFAULT_DB_ALIAS:
+        # 派生数据保存在默认库，不能与分片上的订单同一事务提交：分片事务提交后再发送，回滚时不留下派生数据
+        transaction.on_commit(lambda: signal.send(sender=sender, **kwargs), using=using)
+    else:
+        signal.send(sender=sender, **kwargs)
+
+
+def send_order_created(sender, orders):
+    _dispatch(order_created, 'order_created', sender, orders, orders=orders)
+
+
+def send_order_items_created(sender, items):
+    _dispatch(order_items_created, 'items_created', sender, items, items=items)
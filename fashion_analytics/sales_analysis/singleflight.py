@@ -0,0 +1,120 @@
+"""
+相同计算的请求合并（single-flight）。
+
+多人同时打开同一看板时，相同视图、相同参数、相同数据水位的聚合或预测会被并发计算多次。
+这里让同一 key 的计算同时只执行一次：进程内的后到线程等待先到线程，不同进程（gunicorn
+worker）之间在 MySQL 上用 GET_LOCK 命名锁、其他数据库上用文件锁排队。等待结束后先读取
+领头者保存的结果，读不到（超时、领头者计算失败或结果不可缓存）时再自行计算。
+"""
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+from django.db import connection
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，只合并同一进程内的请求
+    fcntl = None
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+@contextmanager
+def _mysql_lock(name, timeout):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT GET_LOCK(%s, %s)', [name, timeout])
+        acquired = cursor.fetchone()[0] == 1
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT RELEASE_LOCK(%s)', [name])
+
+
+def _open_locked(path, deadline):
+    """打开 path 并加文件锁，返回锁文件；deadline 前拿不到锁时返回 None"""
+    while True:
+        lock_file = open(path, 'a')
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    lock_file.close()
+                    return None
+                time.sleep(0.05)
+        # 等待期间前一个持锁者可能已删除该文件，锁在已删除的文件上不排斥新打开的文件，需重新打开
+        try:
+            if os.path.samestat(os.fstat(lock_file.fileno()), os.stat(path)):
+                return lock_file
+        except FileNotFoundError:
+            pass
+        lock_file.close()
+
+
+@contextmanager
+def _file_lock(digest, timeout):
+    # 每个 key 一个锁文件，不同 key 互不阻塞；释放前删除，锁文件不会累积
+    directory = os.path.join(settings.ANALYTICS_DATA_DIR, 'locks')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'flight-{digest}.lock')
+    lock_file = _open_locked(path, time.monotonic() + timeout)
+    if lock_file is None:
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        os.unlink(path)
+        lock_file.close()
+
+
+def process_lock(key, timeout):
+    """跨进程锁，返回的上下文管理器产出是否在 timeout 秒内拿到锁"""
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    if connection.vendor == 'mysql':
+        return _mysql_lock(f'flight:{digest}', timeout)
+    if fcntl is not None:
+        return _file_lock(digest, timeout)
+    return nullcontext(True)
+
+
+def single_flight(key, load, compute, timeout=None):
+    """
+    同一 key 的计算同时只执行一次。
+    load() 读取已保存的结果，没有时返回 None；compute() 计算并保存结果，返回值原样返回。
+    """
+    timeout = settings.SINGLE_FLIGHT_TIMEOUT if timeout is None else timeout
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = threading.Event()
+    
+    if not leader:
+        # 同一进程内已有相同计算，等待其完成后读取结果
+        if flight.wait(timeout):
+            result = load()
+            if result is not None:
+                return result
+        return compute()
+    
+    try:
+        with process_lock(key, timeout) as acquired:
+            # 其他进程可能已在我们等待锁期间算好
+            if acquired:
+                result = load()
+                if result is not None:
+                    return result
+            return compute()
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.set()
@@ -0,0 +1,189 @@
+"""
+列式分析快照：所有工作进程共享的内存映射数据。
+
+各 gunicorn 工作进程把销售数据读入 pandas 时各自持有一份私有副本，常驻内存随进程数成倍增长。
+build_snapshot 命令把订单、订单条目与商品的分析列导出为 .npy 列文件，工作进程用
+np.load(mmap_mode='r') 只读映射，所有进程共享操作系统页缓存中的同一份数据。
+每次构建写入新的版本目录，完成后原子替换 CURRENT 指针文件；旧版本默认保留一个，
+正在使用旧映射的进程不受影响。快照之后新增的行（包括主键低于快照水位但较晚提交的行，
+见 columns.py）从数据库补齐，已有的行被修改或删除后快照失效，
+直到下次构建前改用数据库查询。
+
+金额列为整数分（见 money.py），日期列为 UTC 微秒时间戳，为空的外键记为 0。
+"""
+import datetime
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.utils import timezone
+
+from .models import SalesOrder, OrderItem, Clothing
+from .money import Cents
+from .sharding import sharding_enabled
+from .columns import ID_LAG, column_rows, to_micros, unseen_rows
+from .versions import modified_version
+
+# 表名: (模型, [(列名, 查询字段或表达式)])，按主键升序导出
+SNAPSHOT_TABLES = {
+    'orders': (SalesOrder, [
+        ('id', 'id'), ('user_id', 'user_id'), ('region_id', 'region_id'),
+        ('order_date', 'order_date'), ('total_cents', Cents('total_amount')),
+    ]),
+    'items': (OrderItem, [
+        ('id', 'id'), ('order_id', 'order_id'), ('clothing_id', 'clothing_id'),
+        ('region_id', 'region_id'), ('clothing_type_id', 'clothing_type_id'),
+        ('price_range_id', 'price_range_id'), ('order_date', 'order_date'),
+        ('quantity', 'quantity'), ('price_cents', Cents('price')), ('line_cents', Cents('line_total')),
+    ]),
+    'clothing': (Clothing, [
+        ('id', 'id'), ('clothing_type_id', 'clothing_type_id'), ('price_range_id', 'price_range_id'),
+        ('price_cents', Cents('price')), ('stock', 'stock'),
+    ]),
+}
+# snapshot_sales_by_date 从数据库补齐新订单时读取的列
+TAIL_COLUMNS = [('id', 'id'), ('order_date', 'order_date'), ('total_cents', Cents('total_amount'))]
+
+_current = None
+_current_lock = threading.Lock()
+
+
+def _root():
+    return os.path.join(settings.ANALYTICS_DATA_DIR, 'snapshot')
+
+
+def _pointer_path():
+    return os.path.join(_root(), 'CURRENT')
+
+
+def _to_int(value):
+    if value is None:
+        return 0
+    if isinstance(value, datetime.datetime):
+        return to_micros(value)
+    return int(value)
+
+
+def _export_table(model, columns, directory, chunk_size):
+    """流式读取一张表并逐列保存为 .npy，返回 (行数, 最大主键, 最大主键之下 ID_LAG 以内的主键列表)"""
+    names, rows = column_rows(model, columns, chunk_size=chunk_size)
+    
+    # 每 chunk_size 行转换为一段 int64 数组，避免整表的 Python 对象同时驻留内存
+    chunks = [[] for _ in names]
+    buffer = []
+    for row in rows:
+        buffer.append([_to_int(value) for value in row])
+        if len(buffer) >= chunk_size:
+            for column, values in zip(chunks, np.array(buffer, dtype=np.int64).T):
+                column.append(values)
+            buffer = []
+    if buffer or not chunks[0]:
+        for column, values in zip(chunks, np.array(buffer, dtype=np.int64).reshape(-1, len(names)).T):
+            column.append(values)
+    
+    os.makedirs(directory)
+    arrays = [np.concatenate(column) for column in chunks]
+    for name, values in zip(names, arrays):
+        np.save(os.path.join(directory, f'{name}.npy'), values)
+    row_count = len(arrays[0])
+    max_id = int(arrays[0][-1]) if row_count else 0
+    return row_count, max_id, arrays[0][arrays[0] > max_id - ID_LAG].tolist()
+
+
+def build_snapshot(keep=1, chunk_size=20000):
+    """构建新版本快照并原子切换，保留 keep 个旧版本，返回清单"""
+    root = _root()
+    os.makedirs(root, exist_ok=True)
+    version = timezone.now().strftime('%Y%m%d%H%M%S%f')
+    tmp_path = os.path.join(root, f'.{version}.tmp')
+    manifest = {'version': version, 'built_at': timezone.now().isoformat(), 'tables': {}}
+    try:
+        for name, (model, columns) in SNAPSHOT_TABLES.items():
+            # 导出前读取修改版本号：导出期间的修改会让快照被视为过期，而不是被漏掉
+            modified = modified_version(model)
+            row_count, max_id, recent = _export_table(model, columns, os.path.join(tmp_path, name), chunk_size)
+            manifest['tables'][name] = {
+                'rows': row_count, 'max_id': max_id, 'recent': recent, 'modified': modified,
+                'columns': [column for column, _ in columns]
+            }
+        with open(os.path.join(tmp_path, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.rename(tmp_path, os.path.join(root, version))
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    
+    # 原子替换指针文件，读取方要么看到旧版本，要么看到新版本
+    pointer_tmp = _pointer_path() + '.tmp'
+    with open(pointer_tmp, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(pointer_tmp, _pointer_path())
+    
+    versions = sorted(entry for entry in os.listdir(root) if entry.isdigit())
+    for old in versions[:-(keep + 1)]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    return manifest
+
+
+class Snapshot:
+    """一个版本的快照，columns(表名) 返回 {列名: 只读内存映射数组}"""
+    
+    def __init__(self, version):
+        self.version = version
+        self.path = os.path.join(_root(), version)
+        with open(os.path.join(self.path, 'manifest.json'), encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self._tables = {}
+    
+    def columns(self, table):
+        if table not in self._tables:
+            self._tables[table] = {
+                name: np.load(os.path.join(self.path, table, f'{name}.npy'), mmap_mode='r')
+                for name in self.manifest['tables'][table]['columns']
+            }
+        return self._tables[table]
+
+
+def current_snapshot():
+    """当前版本的快照，没有构建过时返回 None；切换版本后各进程在下次调用时重新映射"""
+    global _current
+    try:
+        with open(_pointer_path(), encoding='utf-8') as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    
+    with _current_lock:
+        if _current is None or _current.version != version:
+            _current = Snapshot(version)
+        return _current
+
+
+def snapshot_sales_by_date():
+    """
+    按订单时间汇总的销售额 DataFrame（order_date, daily_cents），与数据库上
+    SalesOrder.values('order_date').annotate(Sum) 的结果一致：快照内的订单在内存映射上汇总，
+    快照之后的新订单（主键水位之后，以及水位之下 ID_LAG 以内不在快照中的订单）从数据库补齐。
+    没有快照、快照构建后有订单被修改、删除或归档（订单表的修改版本号变化，见 versions.py），以及按地区分片（快照只包含默认库）时返回 None，由调用方改用数据库查询。
+    """
+    snapshot = current_snapshot()
+    if snapshot is None or sharding_enabled():
+        return None
+    info = snapshot.manifest['tables']['orders']
+    if info.get('modified') != modified_version(SalesOrder):
+        return None
+    
+    orders = snapshot.columns('orders')
+    _, rows = unseen_rows(SalesOrder, TAIL_COLUMNS, info['max_id'], info['recent'])
+    tail = list(rows)
+    dates = np.concatenate([orders['order_date'], np.array([_to_int(row[1]) for row in tail], dtype=np.int64)])
+    cents = np.concatenate([orders['total_cents'], np.array([row[2] for row in tail], dtype=np.int64)])
+    
+    keys, inverse = np.unique(dates, return_inverse=True)
+    totals = np.zeros(len(keys), dtype=np.int64)
+    np.add.at(totals, inverse, cents)
+    return pd.DataFrame({'order_date': pd.to_datetime(keys, unit='us', utc=True), 'daily_cents': totals})
@@ -0,0 +1,87 @@
+"""
+基础数据接口的稀疏字段集：?fields=id,name,price 只返回列出的字段，?exclude=description,items 去掉列出的字段。
+
+SparseFieldsMixin 按 GET 请求的参数裁剪根序列化器的字段，嵌套的子序列化器（订单的 items）按自身声明输出。
+SparseQuerysetMixin 再按裁剪后的字段裁剪查询：only() 只取需要的列，source='clothing.name' 等关联字段
+用 select_related 一并取回，嵌套的 many=True 字段只在请求了该字段时 prefetch_related。
+FastListMixin 的列表接口由裁剪后的序列化器生成 .values() 列，未请求 items 时不查询订单条目。
+写入请求不裁剪，序列化器校验与保存需要完整的字段与实例。
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+
+
+def _names(value):
+    return [name.strip() for name in value.split(',') if name.strip()] if value else []
+
+
+def requested_fields(request):
+    """解析 fields / exclude 参数，返回 (保留的字段或 None, 去掉的字段)；非 GET 请求不裁剪"""
+    if request is None or request.method != 'GET':
+        return None, []
+    params = request.query_params
+    return _names(params.get('fields')) or None, _names(params.get('exclude'))
+
+
+class SparseFieldsMixin:
+    """ModelSerializer 混入：根序列化器按 fields / exclude 参数裁剪输出字段，字段顺序不变"""
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if parent is not None:
+            return fields
+        
+        keep, exclude = requested_fields(self.context.get('request'))
+        unknown = [name for name in (keep or []) + exclude if name not in fields]
+        if unknown:
+            raise ParseError(f'fields / exclude 参数包含未知字段: {", ".join(unknown)}')
+        for name in list(fields):
+            if (keep is not None and name not in keep) or name in exclude:
+                fields.pop(name)
+        return fields
+
+
+def prune_queryset(queryset, serializer, keep=()):
+    """按序列化器的字段裁剪查询，keep 为额外需要加载的字段；字段来源无法对应到模型字段时不裁剪"""
+    model = queryset.model
+    only, related, prefetch = ['pk', *keep], [], []
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if isinstance(field, serializers.ListSerializer):
+            # 子查询同样裁剪，并保留指向本表的外键以便分组
+            relation = model._meta.get_field(field.source)
+            child = field.child
+            prefetch.append(Prefetch(field.source, queryset=prune_queryset(
+                child.Meta.model._default_manager.all(), child, keep=[relation.field.name]
+            )))
+            continue
+        path = field.source.split('.')
+        try:
+            model._meta.get_field(path[0])
+        except FieldDoesNotExist:
+            return queryset
+        # 关联字段的每一级都需要加载，最后一级之前的关联用 select_related 取回
+        only.extend('__'.join(path[:i]) for i in range(1, len(path) + 1))
+        if len(path) > 1:
+            related.append('__'.join(path[:-1]))
+    if related:
+        queryset = queryset.select_related(*related)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset.only(*dict.fromkeys(only))
+
+
+class SparseQuerysetMixin:
+    """视图集混入：GET 请求按裁剪后的序列化器字段裁剪查询"""
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method != 'GET':
+            return queryset
+        return prune_queryset(queryset, self.get_serializer())
@@ -1,3 +1,1872 @@
-from django.test import TestCase
+import datetime
+import gzip
+import hashlib
+import io
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import Future
+from unittest import mock
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Count, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.request import Request
+
+from .models import (
+    Region, ClothingType, PriceRange, RatingCategory, Clothing, SalesOrder, OrderItem, Rating, IdSequence,
+    CostBudgetUsage, CustomerStats, SalesSeriesStats, OrderEvent, AnalyticsSnapshot, ArchivedSalesOrder,
+    ArchivedOrderItem, SalesVelocity, TableVersion, ImportCheckpoint
+)
+from .serializers import ClothingSerializer, RegionSalesSerializer, SalesOrderSerializer
+from .fast_serializers import ValuesSerializer
+from .money import Cents
+from .middleware import brotli
+from .renderers import msgpack
+from .sharding import sales_databases
+from .versions import table_versions
+from .admission import admission, estimate_cost
+from . import views
+from .caching import data_watermark, response_cache_key
+from .warming import dashboard_requests
+from .thumbnails import generate_thumbnails, image_storage, record_thumbnails, variant_name
+from .snapshot import build_snapshot, current_snapshot, snapshot_sales_by_date
+from .customers import refresh_customer_analytics
+from .catalog import FTS_TABLE, ensure_fulltext
+from .text_index import index_ratings, search_ratings
+from .outbox import process_batch
+from .basket import bought_together, load_state, mine_associations, state_version
+from .signals import order_items_created
+from .anomalies import close_stale_series
+from .management.commands.import_sales import Command as ImportSalesCommand
+from .inventory import VELOCITY_WINDOW_DAYS, decrement_stock, record_sales, stockout_forecast
+from .archive import (
+    archive_month, archived_frame, archived_sales_by, hot_window_start, month_start, rotate_to_archive_tables,
+    used_order_numbers
+)
+from .singleflight import process_lock, single_flight
+from .sampling import HLL_ERROR, approx_region_sales, estimate_distinct, rebuild_samples, registers_of
+from . import duckdb_backend, live
 
 # Create your tests here.
+
+class ValuesSerializerTests(TestCase):
+    """快速序列化器的输出需与原 ModelSerializer 完全一致（包括键的顺序）"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='tester', password='secret')
+        region = Region.objects.create(name='华东', code='HD')
+        clothing_type = ClothingType.objects.create(name='T恤')
+        price_range = PriceRange.objects.create(name='100-200元', min_price=100, max_price=200)
+        cls.clothing = [
+            Clothing.objects.create(
+                name='纯棉T恤', clothing_type=clothing_type, price=Decimal('129.9'),
+                price_range=price_range, description='透气', image='clothing_images/tshirt.jpg', stock=50
+            ),
+            # 无价格区间、无描述、无图片
+            Clothing.objects.create(name='基础款', clothing_type=clothing_type, price=Decimal('0'), stock=0),
+        ]
+        with_items = SalesOrder.objects.create(
+            order_number='SO001', user=cls.user, region=region, total_amount=Decimal('259.80')
+        )
+        OrderItem.objects.create(order=with_items, clothing=cls.clothing[0], quantity=2, price=Decimal('129.90'))
+        OrderItem.objects.create(order=with_items, clothing=cls.clothing[1], quantity=1, price=Decimal('0'))
+        SalesOrder.objects.create(order_number='SO002', user=cls.user, region=region, total_amount=Decimal('0'))
+    
+    def _context(self):
+        request = APIRequestFactory().get('/api/')
+        return {'request': Request(request)}
+    
+    def assertSameOutput(self, serializer_class, queryset):
+        context = self._context()
+        expected = serializer_class(queryset.order_by('pk'), many=True, context=context).data
+        fast = ValuesSerializer(serializer_class, context)
+        actual = fast.to_representation(queryset.order_by('pk').values(*fast.lookups))
+        self.assertEqual(actual, expected)
+        for actual_row, expected_row in zip(actual, expected):
+            self.assertEqual(list(actual_row), list(expected_row))
+    
+    def test_clothing_matches_model_serializer(self):
+        self.assertSameOutput(ClothingSerializer, Clothing.objects.all())
+    
+    def test_sales_order_matches_model_serializer(self):
+        self.assertSameOutput(SalesOrderSerializer, SalesOrder.objects.all())
+    
+    def test_list_endpoints_match(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for url, model, serializer_class in (
+            ('/api/clothing/', Clothing, ClothingSerializer),
+            ('/api/sales-orders/', SalesOrder, SalesOrderSerializer),
+        ):
+            response = client.get(url, {'page_size': 1000})
+            self.assertEqual(response.status_code, 200)
+            request = Request(APIRequestFactory().get(url, {'page_size': 1000}))
+            expected = serializer_class(model.objects.all(), many=True, context={'request': request}).data
+            self.assertEqual(response.json()['results'], [dict(row) for row in expected])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CatalogSearchTests(TestCase):
+    """商品目录检索：长词走全文索引，短词退化为 LIKE；分面计数不使用该维度自身的筛选条件"""
+    
+    URL = '/api/clothing/'
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='tester', password='secret')
+        cls.tshirt, cls.coat = ClothingType.objects.create(name='T恤'), ClothingType.objects.create(name='外套')
+        cls.low = PriceRange.objects.create(name='0-100元', min_price=0, max_price=100)
+        cls.high = PriceRange.objects.create(name='100-500元', min_price=100, max_price=500)
+        cls.clothing = [
+            Clothing.objects.create(
+                name='纯棉圆领T恤', clothing_type=cls.tshirt, price=Decimal('59.90'), price_range=cls.low,
+                description='夏季透气'
+            ),
+            Clothing.objects.create(
+                name='羽绒服', clothing_type=cls.coat, price=Decimal('399.00'), price_range=cls.high,
+                description='加厚保暖，纯棉内衬'
+            ),
+            Clothing.objects.create(
+                name='风衣', clothing_type=cls.coat, price=Decimal('89.00'), price_range=cls.low, description='防风'
+            ),
+        ]
+    
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def _search(self, **params):
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.get(self.URL, params)
+        self.assertEqual(response.status_code, 200)
+        matched = any(FTS_TABLE in query['sql'] for query in queries.captured_queries)
+        return sorted(row['name'] for row in response.json()['results']), matched
+    
+    def test_long_terms_use_fulltext_index(self):
+        self.assertEqual(self._search(q='圆领T恤'), (['纯棉圆领T恤'], True))
+        self.assertEqual(self._search(q='纯棉内衬'), (['羽绒服'], True))
+        # 修改名称后索引由触发器同步
+        Clothing.objects.filter(pk=self.clothing[2].pk).update(name='长款风衣外套')
+        self.assertEqual(self._search(q='风衣外套'), (['长款风衣外套'], True))
+    
+    def test_short_terms_fall_back_to_like(self):
+        self.assertEqual(self._search(q='纯棉'), (['纯棉圆领T恤', '羽绒服'], False))
+        # 长词与短词混合时两种条件同时生效
+        self.assertEqual(self._search(q='纯棉内衬 加厚'), (['羽绒服'], True))
+    
+    def test_facets_ignore_their_own_filter(self):
+        response = self.client.get(self.URL, {
+            'clothing_type': self.coat.pk, 'price_range': self.low.pk, 'facets': '1'
+        })
+        self.assertEqual([row['name'] for row in response.json()['results']], ['风衣'])
+        facets = response.json()['facets']
+        # 服装类型的计数只按价格区间筛选，价格区间的计数只按服装类型筛选
+        self.assertEqual(facets['clothing_type'], [
+            {'id': self.tshirt.pk, 'name': 'T恤', 'count': 1}, {'id': self.coat.pk, 'name': '外套', 'count': 1},
+        ])
+        self.assertEqual(facets['price_range'], [
+            {'id': self.low.pk, 'name': '0-100元', 'count': 1}, {'id': self.high.pk, 'name': '100-500元', 'count': 1},
+        ])
+    
+    def test_migrate_restores_dropped_triggers(self):
+        # SQLite 上重建商品表的迁移会丢掉同步触发器
+        with connections['default'].cursor() as cursor:
+            for suffix in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER {FTS_TABLE}_{suffix}')
+        Clothing.objects.create(name='针织开衫', clothing_type=self.coat, price=Decimal('159.00'))
+        self.assertEqual(self._search(q='针织开衫'), ([], True))
+        self.assertTrue(ensure_fulltext())
+        self.assertFalse(ensure_fulltext())
+        self.assertEqual(self._search(q='针织开衫'), (['针织开衫'], True))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    ANALYSIS_COST_BUDGETS={'user': 10 ** 6, 'global': 10 ** 6},
+)
+class DataVersionTests(TestCase):
+    """修改、删除数据后表版本号增加，分析接口的 ETag 与缓存的结果随之变化"""
+    
+    URL = '/api/analysis/region-sales/'
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='analyst', password='secret')
+        cls.region = Region.objects.create(name='华东', code='HD')
+        cls.order = SalesOrder.objects.create(
+            order_number='VO001', user=cls.user, region=cls.region, total_amount=Decimal('100.00')
+        )
+    
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def _write(self, method, url, data=None):
+        # 版本号在提交后增加
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 300)
+    
+    def _assert_changed(self, etag):
+        response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response.json()
+    
+    def test_update_changes_etag(self):
+        response = self.client.get(self.URL)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        
+        # 只修改金额，主键、行数都不变
+        self._write('patch', f'/api/sales-orders/{self.order.pk}/', {'total_amount': '250.00'})
+        rows = self._assert_changed(etag)
+        self.assertEqual(Decimal(str(rows[0]['total_sales'])), Decimal('250.00'))
+    
+    def test_dimension_rename_changes_etag(self):
+        etag = self.client.get(self.URL)['ETag']
+        self._write('patch', f'/api/regions/{self.region.pk}/', {'name': '华东大区'})
+        self.assertEqual(self._assert_changed(etag)[0]['region_name'], '华东大区')
+    
+    def test_delete_changes_etag(self):
+        etag = self.client.get(self.URL)['ETag']
+        self._write('delete', f'/api/sales-orders/{self.order.pk}/')
+        self.assertEqual(self._assert_changed(etag), [])
+    
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+        'analytics': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'analytics'},
+    })
+    def test_responses_use_analytics_cache(self):
+        self.assertEqual(self.client.get(self.URL).status_code, 200)
+        key = response_cache_key(data_watermark([SalesOrder, Region])[0], APIRequestFactory().get(self.URL))
+        self.assertIsNotNone(caches['analytics'].get(key))
+        self.assertIsNone(caches['default'].get(key))
+    
+    def test_queryset_writes_bump_versions(self):
+        label = SalesOrder._meta.label
+        
+        def version():
+            return table_versions([SalesOrder])[label][0]
+        
+        start = version()
+        with self.captureOnCommitCallbacks(execute=True):
+            SalesOrder.objects.filter(pk=self.order.pk).update(total_amount=Decimal('1.00'))
+            SalesOrder.objects.bulk_create([
+                SalesOrder(order_number='VO002', user=self.user, region=self.region, total_amount=0)
+            ])
+        # 同一事务中的多次写入合并为一次
+        self.assertEqual(version(), start + 1)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    SalesOrder.objects.filter(order_number='VO002').delete()
+                    raise ValueError
+            except ValueError:
+                pass
+            # 不匹配任何行的更新不增加版本号
+            SalesOrder.objects.filter(pk=0).update(total_amount=0)
+        self.assertEqual(version(), start + 1)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.region.delete()
+        # 级联删除的订单一并增加
+        self.assertEqual(version(), start + 2)
+    
+    def test_versions_are_bumped_by_one_update_after_commit(self):
+        def write():
+            with transaction.atomic():
+                Region.objects.create(name='华北', code='HB')
+                with transaction.atomic():
+                    SalesOrder.objects.filter(pk=self.order.pk).update(total_amount=Decimal('2.00'))
+        
+        # 首次写入时建立版本行
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        with self.captureOnCommitCallbacks() as callbacks:
+            with CaptureQueriesContext(connections['default']) as queries:
+                write()
+        # 事务中不读写版本表
+        self.assertFalse([query for query in queries.captured_queries if TableVersion._meta.db_table in query['sql']])
+        with CaptureQueriesContext(connections['default']) as queries:
+            for callback in callbacks:
+                callback()
+        self.assertEqual(len(queries.captured_queries), 1)
+        self.assertTrue(queries.captured_queries[0]['sql'].startswith('UPDATE'))
+    
+    def test_list_page_reads_dimension_versions_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            clothing_type = ClothingType.objects.create(name='T恤')
+            price_range = PriceRange.objects.create(name='100-200元', min_price=100, max_price=200)
+            Clothing.objects.bulk_create([
+                Clothing(name=f'款式{i}', clothing_type=clothing_type, price_range=price_range, price=Decimal('150'))
+                for i in range(6)
+            ])
+        
+        def version_queries(page_size):
+            with CaptureQueriesContext(connections['default']) as queries:
+                response = self.client.get('/api/clothing/', {'page_size': page_size})
+            self.assertEqual(len(response.json()['results']), page_size)
+            self.assertEqual(response.json()['results'][0]['clothing_type_name'], 'T恤')
+            return len(queries.captured_queries), len([
+                query for query in queries.captured_queries if TableVersion._meta.db_table in query['sql']
+            ])
+        
+        # 首次请求加载维度缓存；之后每页的查询数与行数无关，两个维度字段只读取一次版本号
+        version_queries(2)
+        self.assertEqual(version_queries(2), version_queries(6))
+        self.assertEqual(version_queries(6)[1], 1)
+        with CaptureQueriesContext(connections['default']) as queries:
+            ClothingSerializer(Clothing.objects.all(), many=True).data
+        self.assertEqual(len(queries.captured_queries), 2)
+
+
+class InlineExecutor:
+    """在当前线程中依次执行任务的进程池 / 线程池替身：测试事务中的数据与本地内存缓存对其他进程、连接不可见"""
+    
+    def __init__(self, *args, **kwargs):
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+    
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+    
+    def map(self, fn, *iterables):
+        return [fn(*args) for args in zip(*iterables)]
+
+
+@override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+        'analytics': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'analytics'},
+    },
+    ANALYSIS_COST_BUDGETS={'user': 10 ** 6, 'global': 10 ** 6},
+)
+class WarmAnalyticsTests(TestCase):
+    """warm_analytics 把看板请求的结果写入 analytics 缓存，之后的用户请求不再计算"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='analyst', password='secret')
+        region = Region.objects.create(name='华东', code='HD')
+        clothing_type = ClothingType.objects.create(name='T恤')
+        clothing = Clothing.objects.create(name='纯棉T恤', clothing_type=clothing_type, price=Decimal('59.90'), stock=50)
+        for i in range(3):
+            order = SalesOrder.objects.create(
+                order_number=f'WA{i:03d}', user=cls.user, region=region, total_amount=Decimal('59.90')
+            )
+            OrderItem.objects.create(order=order, clothing=clothing, quantity=1, price=Decimal('59.90'))
+    
+    def setUp(self):
+        caches['default'].clear()
+        caches['analytics'].clear()
+    
+    def test_warmed_requests_skip_computation(self):
+        stdout = io.StringIO()
+        # 工作进程改为在当前进程中执行；父进程不关闭连接，以免结束测试事务
+        with mock.patch('sales_analysis.warming.ProcessPoolExecutor', InlineExecutor), \
+                mock.patch('sales_analysis.warming.connections'):
+            call_command('warm_analytics', windows='7', stdout=stdout)
+        # 数据过少时销售预测返回 400，其余请求均成功
+        self.assertIn(f'预热完成：{len(dashboard_requests([7]))} 个请求，1 个未成功', stdout.getvalue())
+        
+        client = APIClient()
+        client.force_authenticate(self.user)
+        start_date = (timezone.localdate() - datetime.timedelta(days=6)).isoformat()
+        url = '/api/analysis/region-sales/'
+        for params in ({}, {'start_date': start_date}):
+            with self.subTest(params=params):
+                key = response_cache_key(data_watermark([SalesOrder, Region])[0], APIRequestFactory().get(url, params))
+                self.assertIsNotNone(caches['analytics'].get(key))
+                # 命中缓存的请求不经过准入控制与计算
+                with mock.patch('sales_analysis.caching.admission') as admitted:
+                    response = client.get(url, params)
+                admitted.assert_not_called()
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), [{'region_name': '华东', 'total_sales': '179.70', 'order_count': 3}])
+        
+        # 未预热的窗口仍需计算
+        with mock.patch('sales_analysis.caching.admission', wraps=admission) as admitted:
+            self.assertEqual(client.get(url, {'start_date': '2000-01-01'}).status_code, 200)
+        admitted.assert_called_once()
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    ANALYSIS_COST_BUDGETS={'user': 10 ** 6, 'global': 10 ** 6},
+)
+class ResponseEncodingTests(TestCase):
+    """图表接口的列式布局、MessagePack 渲染与 br / gzip 压缩经 HTTP 往返后内容不变"""
+    
+    URL = '/api/analysis/region-sales/'
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='analyst', password='secret')
+        for i in range(12):
+            region = Region.objects.create(name=f'地区{i}', code=f'R{i:02d}')
+            SalesOrder.objects.create(
+                order_number=f'EN{i:03d}', user=cls.user, region=region, total_amount=Decimal('10.25') * (i + 1)
+            )
+    
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def test_columnar_layout(self):
+        rows = self.client.get(self.URL).json()
+        response = self.client.get(self.URL, {'layout': 'columnar'})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['columns'], list(RegionSalesSerializer().fields))
+        self.assertEqual(body['data']['region_name'], [row['region_name'] for row in rows])
+        self.assertEqual(body['data']['order_count'], [row['order_count'] for row in rows])
+        # 数值列为数字而不是字符串
+        self.assertEqual(body['data']['total_sales'], [float(row['total_sales']) for row in rows])
+        self.assertIsInstance(body['data']['total_sales'][0], float)
+    
+    @unittest.skipIf(msgpack is None, '未安装 msgpack')
+    def test_msgpack_renderer(self):
+        rows = self.client.get(self.URL).json()
+        response = self.client.get(self.URL, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content, raw=False), rows)
+        columnar = {'layout': 'columnar'}
+        response = self.client.get(self.URL, columnar, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content, raw=False), self.client.get(self.URL, columnar).json())
+    
+    def test_compression_negotiation(self):
+        plain = self.client.get(self.URL)
+        self.assertNotIn('Content-Encoding', plain)
+        etag = plain['ETag']
+        self.assertTrue(etag.startswith('"'))
+        
+        encodings = [('gzip', gzip.decompress)]
+        if brotli is not None:
+            encodings.insert(0, ('br', brotli.decompress))
+        for encoding, decompress in encodings:
+            with self.subTest(encoding=encoding):
+                response = self.client.get(self.URL, HTTP_ACCEPT_ENCODING=f'{encoding}, deflate')
+                self.assertEqual(response['Content-Encoding'], encoding)
+                self.assertIn('Accept-Encoding', response['Vary'])
+                self.assertEqual(decompress(response.content), plain.content)
+                # 压缩后的字节与原文不同，强 ETag 改写为同值的弱 ETag，条件请求仍命中
+                self.assertEqual(response['ETag'], 'W/' + etag)
+                cached = self.client.get(
+                    self.URL, HTTP_ACCEPT_ENCODING=encoding, HTTP_IF_NONE_MATCH=response['ETag']
+                )
+                self.assertEqual(cached.status_code, 304)
+        if brotli is not None:
+            # 同时接受两种编码时优先 br
+            self.assertEqual(self.client.get(self.URL, HTTP_ACCEPT_ENCODING='gzip, br')['Content-Encoding'], 'br')
+        
+        # 过短的响应不压缩
+        empty_window = {'start_date': '2000-01-01', 'end_date': '2000-01-02'}
+        short = self.client.get(self.URL, empty_window, HTTP_ACCEPT_ENCODING='br, gzip')
+        self.assertEqual(short.json(), [])
+        self.assertNotIn('Content-Encoding', short)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    ANALYSIS_COST_BUDGETS={'user': 10 ** 6, 'global': 10 ** 6},
+)
+class ParameterValidationTests(TestCase):
+    """分析接口的查询参数格式错误时返回 400，而不是 500"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='analyst', password='secret')
+    
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def assertBadRequest(self, url, params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 400, params)
+        self.assertIn('error', response.json())
+    
+    def test_anomaly_filters_must_be_integers(self):
+        for params in ({'region': 'abc'}, {'clothing_type': 'abc'}, {'days': 'abc'}):
+            self.assertBadRequest('/api/analysis/anomalies/', params)
+        self.assertEqual(self.client.get('/api/analysis/anomalies/', {'region': '1'}).status_code, 200)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    ANALYSIS_COST_BUDGETS={'user': 10 ** 6, 'global': 10 ** 6},
+)
+class CustomerAnalyticsTests(TestCase):
+    """客户分析接口只读取离线生成的快照，RFM 客户列表分页"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='analyst', password='secret')
+        region = Region.objects.create(name='华东', code='HD')
+        for i in range(3):
+            customer = User.objects.create_user(username=f'customer{i}', password='secret')
+            SalesOrder.objects.create(
+                order_number=f'CA{i:03d}', user=customer, region=region, total_amount=Decimal('100.00') * (i + 1)
+            )
+    
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def test_missing_snapshot_returns_503(self):
+        for url in ('/api/analysis/rfm/', '/api/analysis/cohorts/'):
+            self.assertEqual(self.client.get(url).status_code, 503)
+        # 请求中不做全量计算
+        self.assertFalse(CustomerStats.objects.exists())
+    
+    def test_rfm_customers_are_paginated(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            refresh_customer_analytics()
+        first = self.client.get('/api/analysis/rfm/', {'page_size': 2}).json()
+        self.assertEqual(first['count'], 3)
+        self.assertEqual(len(first['customers']), 2)
+        self.assertEqual(sum(segment['customer_count'] for segment in first['segments']), 3)
+        second = self.client.get('/api/analysis/rfm/', {'page_size': 2, 'page': 2}).json()
+        self.assertIsNone(second['next'])
+        self.assertEqual(len(second['customers']), 1)
+    
+    def test_late_committed_orders_below_watermark_are_counted(self):
+        max_id = SalesOrder.objects.order_by('-id').values_list('id', flat=True).first()
+        customer = User.objects.get(username='customer0')
+        region = Region.objects.first()
+        SalesOrder.objects.create(
+            id=max_id + 3, order_number='CA-AFTER', user=customer, region=region, total_amount=Decimal('10.00')
+        )
+        refresh_customer_analytics()
+        # 刷新之后才提交的、ID 低于水位的订单
+        SalesOrder.objects.create(
+            id=max_id + 1, order_number='CA-LATE', user=customer, region=region, total_amount=Decimal('20.00')
+        )
+        refresh_customer_analytics()
+        refresh_customer_analytics()
+        stats = CustomerStats.objects.get(user=customer)
+        self.assertEqual(stats.frequency, 3)
+        self.assertEqual(stats.monetary, Decimal('130.00'))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    ANALYSIS_COST_BUDGETS={'user': 10 ** 6, 'global': 10 ** 6},
+)
+class RatingIndexTests(TestCase):
+    """评价倒排索引只追加新评价，已有评价被修改或删除后下一次索引全量重建"""
+    
+    URL = '/api/analysis/rating-keywords/'
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='analyst', password='secret')
+        clothing_type = ClothingType.objects.create(name='T恤')
+        cls.clothing = Clothing.objects.create(name='纯棉T恤', clothing_type=clothing_type, price=Decimal('59.90'))
+        cls.ratings = [
+            Rating.objects.create(user=cls.user, clothing=cls.clothing, rating=5, comment='soft cotton'),
+            Rating.objects.create(user=cls.user, clothing=cls.clothing, rating=2, comment='thin cotton'),
+        ]
+    
+    def setUp(self):
+        cache.clear()
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir, ignore_errors=True)
+        data_settings = self.settings(ANALYTICS_DATA_DIR=data_dir)
+        data_settings.enable()
+        self.addCleanup(data_settings.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def _keywords(self, **params):
+        response = self.client.get(self.URL, params)
+        self.assertEqual(response.status_code, 200)
+        return {row['keyword']: row['rating_count'] for row in response.json()['keywords']}
+    
+    def test_edited_and_deleted_ratings_are_reindexed(self):
+        self.assertEqual(index_ratings(), 2)
+        self.assertEqual(self._keywords(), {'soft': 1, 'thin': 1, 'cotton': 2})
+        with self.captureOnCommitCallbacks(execute=True):
+            Rating.objects.filter(pk=self.ratings[0].pk).update(comment='soft linen')
+            self.ratings[1].delete()
+        # 没有新评价，但修改与删除触发全量重建
+        self.assertEqual(index_ratings(), 1)
+        self.assertEqual(self._keywords(), {'soft': 1, 'linen': 1})
+        self.assertEqual(index_ratings(), 0)
+    
+    def test_late_committed_ratings_below_watermark_are_indexed(self):
+        max_id = self.ratings[-1].pk
+        Rating.objects.create(id=max_id + 3, user=self.user, clothing=self.clothing, rating=4, comment='warm cotton')
+        self.assertEqual(index_ratings(), 3)
+        # 索引之后才提交的、ID 低于水位的评价
+        Rating.objects.create(id=max_id + 1, user=self.user, clothing=self.clothing, rating=3, comment='warm wool')
+        self.assertEqual(index_ratings(), 1)
+        self.assertEqual(index_ratings(), 0)
+        self.assertEqual(self._keywords(), {'cotton': 3, 'warm': 2, 'soft': 1, 'thin': 1, 'wool': 1})
+        self.assertEqual(search_ratings('warm wool'), [max_id + 1])
+    
+    def test_negative_limit_is_clamped(self):
+        index_ratings()
+        response = self.client.get(self.URL, {'limit': '-1', 'q': 'cotton'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['keywords'], [])
+        self.assertEqual(response.json()['ratings'], [])
+        self.assertEqual(response.json()['total'], 2)
+
+
+class OrderItemDenormalizationTests(TestCase):
+    """订单条目上冗余的订单日期与地区随所属订单变化"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='secret')
+        east, north = Region.objects.create(name='华东', code='HD'), Region.objects.create(name='华北', code='HB')
+        clothing_type = ClothingType.objects.create(name='T恤')
+        cls.clothing = Clothing.objects.create(name='纯棉T恤', clothing_type=clothing_type, price=Decimal('59.90'))
+        cls.orders = [
+            SalesOrder.objects.create(order_number=number, user=cls.user, region=region, total_amount=Decimal('59.90'))
+            for number, region in (('DN001', east), ('DN002', north))
+        ]
+        SalesOrder.objects.filter(pk=cls.orders[1].pk).update(order_date=timezone.now() - datetime.timedelta(days=40))
+        cls.item = OrderItem.objects.create(order=cls.orders[0], clothing=cls.clothing, price=Decimal('59.90'))
+    
+    def assertFollowsOrder(self, item_id, order_id):
+        item = OrderItem.objects.get(pk=item_id)
+        order = SalesOrder.objects.get(pk=order_id)
+        self.assertEqual((item.order_date, item.region_id), (order.order_date, order.region_id))
+    
+    def test_moving_item_to_another_order_recomputes_fields(self):
+        item = OrderItem.objects.get(pk=self.item.pk)
+        item.order_id = self.orders[1].pk
+        item.save()
+        self.assertFollowsOrder(item.pk, self.orders[1].pk)
+    
+    def test_api_update_of_order_recomputes_fields(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.patch(f'/api/order-items/{self.item.pk}/', {'order': self.orders[1].pk}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFollowsOrder(self.item.pk, self.orders[1].pk)
+        # 只修改数量时保留原有冗余字段
+        client.patch(f'/api/order-items/{self.item.pk}/', {'quantity': 3}, format='json')
+        self.assertFollowsOrder(self.item.pk, self.orders[1].pk)
+
+
+class ImportSalesTests(TestCase):
+    """import_sales 中断后从断点继续，订单条目的冗余字段取自订单与商品"""
+    
+    ORDERS = (
+        'order_number,username,region,total_amount,order_date\n'
+        'IM000,buyer,HD,59.90,2026-01-05 10:00:00\n'
+        'IM001,buyer,华北,120.00,2026-01-06 11:30:00\n'
+        'IM002,buyer,HD,399.00,2026-01-07 09:15:00\n'
+        'IM003,nobody,HD,10.00,2026-01-07 09:20:00\n'
+        'IM001,buyer,HD,120.00,2026-02-01 08:00:00\n'
+    )
+    ITEMS = (
+        'order_number,clothing,quantity,price\n'
+        'IM000,纯棉T恤,1,59.90\n'
+        'IM001,纯棉T恤,2,60.00\n'
+        'IM002,羽绒服,1,399.00\n'
+        'IM009,羽绒服,1,399.00\n'
+    )
+    
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user(username='buyer', password='secret')
+        cls.east = Region.objects.create(name='华东', code='HD')
+        cls.north = Region.objects.create(name='华北', code='HB')
+        cls.tshirt = Clothing.objects.create(
+            name='纯棉T恤', clothing_type=ClothingType.objects.create(name='T恤'), price=Decimal('59.90'),
+            price_range=PriceRange.objects.create(name='0-100元', min_price=0, max_price=100)
+        )
+        cls.coat = Clothing.objects.create(
+            name='羽绒服', clothing_type=ClothingType.objects.create(name='外套'), price=Decimal('399.00'),
+            price_range=PriceRange.objects.create(name='100-500元', min_price=100, max_price=500)
+        )
+    
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.paths = {}
+        for name, content in (('orders', self.ORDERS), ('items', self.ITEMS)):
+            self.paths[name] = os.path.join(directory, f'{name}.csv')
+            with open(self.paths[name], 'w', encoding='utf-8') as f:
+                f.write(content)
+    
+    def _import(self, **files):
+        call_command('import_sales', chunk_size=2, skip_rebuild=True, stdout=io.StringIO(), **files)
+    
+    def test_resume_after_interruption(self):
+        insert = ImportSalesCommand.insert
+        batches = []
+        
+        def interrupted(command, objs):
+            batches.append(len(objs))
+            if len(batches) == 2:
+                raise KeyboardInterrupt
+            insert(command, objs)
+        
+        with mock.patch.object(ImportSalesCommand, 'insert', interrupted), self.assertRaises(KeyboardInterrupt):
+            self._import(orders=self.paths['orders'])
+        # 中断的一批与其断点一起回滚
+        checkpoint = ImportCheckpoint.objects.get(source__startswith='orders:')
+        self.assertEqual(checkpoint.rows_done, 2)
+        self.assertEqual(set(SalesOrder.objects.values_list('order_number', flat=True)), {'IM000', 'IM001'})
+        
+        # 从第 3 行继续；未知用户的行跳过，重复的订单号忽略
+        self._import(orders=self.paths['orders'])
+        checkpoint.refresh_from_db()
+        self.assertEqual(checkpoint.rows_done, 5)
+        orders = {order.order_number: order for order in SalesOrder.objects.all()}
+        self.assertEqual(sorted(orders), ['IM000', 'IM001', 'IM002'])
+        self.assertEqual(orders['IM001'].region_id, self.north.pk)
+        self.assertEqual(
+            orders['IM001'].order_date,
+            timezone.make_aware(datetime.datetime(2026, 1, 6, 11, 30))
+        )
+        
+        self._import(items=self.paths['items'])
+        items = {item.order.order_number: item for item in OrderItem.objects.select_related('order')}
+        self.assertEqual(sorted(items), ['IM000', 'IM001', 'IM002'])
+        for number, clothing in (('IM000', self.tshirt), ('IM001', self.tshirt), ('IM002', self.coat)):
+            with self.subTest(order=number):
+                item, order = items[number], orders[number]
+                self.assertEqual(item.order_date, order.order_date)
+                self.assertEqual(item.region_id, order.region_id)
+                self.assertEqual(item.clothing_type_id, clothing.clothing_type_id)
+                self.assertEqual(item.price_range_id, clothing.price_range_id)
+                self.assertEqual(item.line_total, item.price * item.quantity)
+        self.assertEqual(items['IM001'].line_total, Decimal('120.00'))
+
+
+class InventoryTests(TestCase):
+    """库存在数据库内原子扣减，销售速度按 28 天环形缓冲区滚动，缺货预测按窗口内日均销量计算"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        clothing_type = ClothingType.objects.create(name='T恤')
+        cls.tshirt, cls.coat, cls.socks = [
+            Clothing.objects.create(name=name, clothing_type=clothing_type, price=Decimal('10'), stock=stock)
+            for name, stock in (('纯棉T恤', 56), ('外套', 10), ('袜子', 5))
+        ]
+        cls.today = datetime.date(2026, 3, 31)
+    
+    def _window(self, clothing):
+        velocity = SalesVelocity.objects.get(clothing=clothing)
+        buckets = np.frombuffer(bytes(velocity.buckets), dtype=np.int32)
+        return velocity.last_day, {
+            day: int(buckets[day.toordinal() % VELOCITY_WINDOW_DAYS])
+            for day in (velocity.last_day - datetime.timedelta(days=i) for i in range(VELOCITY_WINDOW_DAYS))
+            if buckets[day.toordinal() % VELOCITY_WINDOW_DAYS]
+        }
+    
+    def test_decrement_stock(self):
+        items = [
+            OrderItem(clothing_id=self.tshirt.pk, quantity=2), OrderItem(clothing_id=self.tshirt.pk, quantity=1),
+            OrderItem(clothing_id=self.coat.pk, quantity=3), OrderItem(clothing_id=self.socks.pk, quantity=1),
+        ]
+        # 读出库存之后的并发修改不会被覆盖：扣减在数据库内进行
+        Clothing.objects.filter(pk=self.coat.pk).update(stock=20)
+        with CaptureQueriesContext(connections['default']) as queries:
+            decrement_stock(items)
+        # T恤与外套都扣减 3 件，合并为一条 UPDATE
+        self.assertEqual(len(queries.captured_queries), 2)
+        stock = dict(Clothing.objects.values_list('name', 'stock'))
+        self.assertEqual(stock, {'纯棉T恤': 53, '外套': 17, '袜子': 4})
+    
+    def test_record_sales_rolls_the_window(self):
+        day = self.today
+        record_sales({(self.tshirt.pk, day): 5, (self.tshirt.pk, day - datetime.timedelta(days=1)): 2})
+        self.assertEqual(self._window(self.tshirt), (day, {day: 5, day - datetime.timedelta(days=1): 2}))
+        
+        # 窗口内的迟到销量累加到原来的桶，滑出窗口的丢弃
+        record_sales({
+            (self.tshirt.pk, day - datetime.timedelta(days=1)): 1,
+            (self.tshirt.pk, day - datetime.timedelta(days=VELOCITY_WINDOW_DAYS)): 9,
+        })
+        self.assertEqual(self._window(self.tshirt), (day, {day: 5, day - datetime.timedelta(days=1): 3}))
+        
+        # 向前推进时清空被跨过的桶：27 天后前一天的桶已过期，当天的桶仍在窗口最早一天
+        later = day + datetime.timedelta(days=VELOCITY_WINDOW_DAYS - 1)
+        record_sales({(self.tshirt.pk, later): 4})
+        self.assertEqual(self._window(self.tshirt), (later, {day: 5, later: 4}))
+        
+        # 跨过整个窗口时全部清空
+        latest = later + datetime.timedelta(days=VELOCITY_WINDOW_DAYS)
+        record_sales({(self.tshirt.pk, latest): 1})
+        self.assertEqual(self._window(self.tshirt), (latest, {latest: 1}))
+    
+    def test_stockout_forecast(self):
+        # T恤窗口内共售出 28 件，日均 1 件；外套最近一次销售已滑出窗口；袜子没有销量
+        record_sales({(self.tshirt.pk, self.today - datetime.timedelta(days=i)): 4 for i in range(0, 14, 2)})
+        record_sales({(self.coat.pk, self.today - datetime.timedelta(days=VELOCITY_WINDOW_DAYS)): 50})
+        Clothing.objects.filter(pk=self.socks.pk).update(stock=-3)
+        record_sales({(self.socks.pk, self.today): 7})
+        
+        ranking = stockout_forecast(self.today)
+        self.assertEqual([row['clothing_name'] for row in ranking], ['袜子', '纯棉T恤', '外套'])
+        forecast = {row['clothing_name']: row for row in ranking}
+        self.assertEqual(forecast['纯棉T恤']['daily_velocity'], 1.0)
+        self.assertEqual(forecast['纯棉T恤']['days_until_stockout'], 56.0)
+        self.assertEqual(forecast['纯棉T恤']['stockout_date'], self.today + datetime.timedelta(days=56))
+        self.assertEqual(forecast['纯棉T恤']['clothing_type_name'], 'T恤')
+        # 库存为负按 0 计算
+        self.assertEqual(forecast['袜子']['daily_velocity'], 0.25)
+        self.assertEqual(forecast['袜子']['days_until_stockout'], 0.0)
+        self.assertEqual(forecast['外套']['daily_velocity'], 0.0)
+        self.assertIsNone(forecast['外套']['days_until_stockout'])
+        self.assertIsNone(forecast['外套']['stockout_date'])
+        
+        # 查询日期之后的桶不计入；超过 MAX_FORECAST_DAYS 的预测不给出日期
+        Clothing.objects.filter(pk=self.tshirt.pk).update(stock=10 ** 6)
+        forecast = stockout_forecast(self.today - datetime.timedelta(days=1))
+        tshirt = next(row for row in forecast if row['clothing_id'] == self.tshirt.pk)
+        self.assertAlmostEqual(tshirt['daily_velocity'], round(24 / VELOCITY_WINDOW_DAYS, 4))
+        self.assertIsNone(tshirt['stockout_date'])
+
+
+class SalesSeriesTests(TestCase):
+    """没有新订单的序列按天结束，更新时间随之刷新"""
+    
+    def test_close_stale_series_updates_timestamp(self):
+        today = timezone.localdate()
+        stats = SalesSeriesStats.objects.create(
+            region=Region.objects.create(name='华东', code='HD'), clothing_type=ClothingType.objects.create(name='T恤'),
+            current_day=today - datetime.timedelta(days=3), current_total=Decimal('100.00')
+        )
+        SalesSeriesStats.objects.filter(pk=stats.pk).update(updated_at=timezone.now() - datetime.timedelta(days=3))
+        
+        close_stale_series(today)
+        stats.refresh_from_db()
+        self.assertEqual(stats.current_day, today)
+        self.assertEqual(stats.n, 3)
+        self.assertGreater(stats.updated_at, timezone.now() - datetime.timedelta(minutes=1))
+
+
+class SamplingTests(TestCase):
+    """近似分析：抽样比例为1时估计值与精确值一致，HyperLogLog 的误差在理论误差范围内"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        regions = [Region.objects.create(name='华东', code='HD'), Region.objects.create(name='华北', code='HB')]
+        users = [User.objects.create_user(username=f'customer{i}', password='secret') for i in range(6)]
+        for i in range(30):
+            SalesOrder.objects.create(
+                order_number=f'AP{i:03d}', user=users[i % 6], region=regions[i % 2],
+                total_amount=Decimal('10.01') * (i + 1)
+            )
+    
+    def test_full_rate_is_exact(self):
+        rebuild_samples(rate=1.0)
+        # 重建之后的新订单同样入样
+        SalesOrder.objects.create(
+            order_number='AP-NEW', user=User.objects.get(username='customer1'), region=Region.objects.get(code='HB'),
+            total_amount=Decimal('0.99')
+        )
+        exact = {
+            row['region__name']: row for row in SalesOrder.objects.values('region__name').annotate(
+                total=Sum('total_amount'), count=Count('id')
+            )
+        }
+        approx = approx_region_sales()
+        self.assertEqual(len(approx), 2)
+        for row in approx:
+            expected = exact[row['region_name']]
+            self.assertEqual(row['total_sales'], expected['total'])
+            self.assertEqual(row['order_count'], expected['count'])
+            self.assertEqual((row['total_sales_error'], row['order_count_error']), (0, 0))
+            # 每个地区各有3个客户，小基数时线性计数是精确的
+            self.assertEqual(row['customers'], 3)
+    
+    def test_hyperloglog_error_bound(self):
+        for cardinality in (1000, 50000, 200000):
+            with self.subTest(cardinality=cardinality):
+                estimate = estimate_distinct(registers_of(np.arange(1, cardinality + 1)))
+                # 3倍相对标准误差
+                self.assertLess(abs(estimate - cardinality) / cardinality, 3 * HLL_ERROR)
+        # 寄存器逐元素取最大值即为并集的草图，重复的用户不重复计数
+        merged = np.maximum(registers_of(np.arange(1, 30001)), registers_of(np.arange(20001, 50001)))
+        np.testing.assert_array_equal(merged, registers_of(np.arange(1, 50001)))
+
+
+class BasketTests(TestCase):
+    """购物篮挖掘：补上较晚提交、ID 低于水位的条目；状态文件与关联商品行一起切换"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='secret')
+        region = Region.objects.create(name='华东', code='HD')
+        clothing_type = ClothingType.objects.create(name='T恤')
+        cls.a, cls.b, cls.c = [
+            Clothing.objects.create(name=name, clothing_type=clothing_type, price=Decimal('10.00'))
+            for name in ('A', 'B', 'C')
+        ]
+        cls.orders = [
+            SalesOrder.objects.create(order_number=f'BK{i:03d}', user=cls.user, region=region, total_amount=Decimal('20.00'))
+            for i in range(2)
+        ]
+        for order in cls.orders:
+            OrderItem.objects.create(order=order, clothing=cls.a, price=Decimal('10.00'))
+            OrderItem.objects.create(order=order, clothing=cls.b, price=Decimal('10.00'))
+    
+    def setUp(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir, ignore_errors=True)
+        data_settings = self.settings(ANALYTICS_DATA_DIR=data_dir)
+        data_settings.enable()
+        self.addCleanup(data_settings.disable)
+        self.data_dir = data_dir
+    
+    def _mine(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return mine_associations()
+    
+    def _related(self, clothing):
+        return {row['clothing_name']: row['co_count'] for row in bought_together(clothing.pk)}
+    
+    def test_late_items_below_watermark_are_counted(self):
+        # C 的第一个条目先分配ID、较晚提交：挖掘时尚不可见，之后才出现在水位之下
+        late = OrderItem.objects.create(order=self.orders[0], clothing=self.c, price=Decimal('10.00'))
+        OrderItem.objects.create(order=self.orders[1], clothing=self.c, price=Decimal('10.00'))
+        late_id = late.pk
+        late.delete()
+        self.assertEqual(self._mine(), 5)
+        self.assertEqual(self._related(self.a), {'B': 2})
+        
+        OrderItem.objects.bulk_create([
+            OrderItem(pk=late_id, order=self.orders[0], clothing=self.c, price=Decimal('10.00'))
+        ])
+        self.assertEqual(self._mine(), 1)
+        self.assertEqual(self._related(self.a), {'B': 2, 'C': 2})
+        _, n_orders, _, _ = load_state()
+        self.assertEqual(n_orders, 2)
+        self.assertEqual(self._mine(), 0)
+    
+    def test_failed_publish_keeps_previous_state_and_rows(self):
+        self._mine()
+        version = state_version()
+        files = sorted(os.listdir(os.path.join(self.data_dir, 'basket')))
+        for order in self.orders:
+            OrderItem.objects.create(order=order, clothing=self.c, price=Decimal('10.00'))
+        
+        with mock.patch.object(AnalyticsSnapshot.objects, 'update_or_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self._mine()
+        # 关联商品行回滚，状态指针与文件保持不变
+        self.assertEqual(state_version(), version)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.data_dir, 'basket'))), files)
+        self.assertEqual(self._related(self.a), {'B': 2})
+        
+        self.assertEqual(self._mine(), 2)
+        self.assertNotEqual(state_version(), version)
+        self.assertEqual(self._related(self.a), {'B': 2, 'C': 2})
+
+
+class OrderEventTests(TestCase):
+    """订单派生数据：inline 模式在写入时更新，outbox 模式由 process_batch 批量处理，失败的批次整批重试"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='secret')
+        cls.region = Region.objects.create(name='华东', code='HD')
+        clothing_type = ClothingType.objects.create(name='T恤')
+        cls.clothing = Clothing.objects.create(
+            name='纯棉T恤', clothing_type=clothing_type, price=Decimal('59.90'), stock=100
+        )
+    
+    def _order(self, number='OE001'):
+        order = SalesOrder.objects.create(
+            order_number=number, user=self.user, region=self.region, total_amount=Decimal('119.80')
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, clothing=self.clothing, quantity=2, price=Decimal('59.90'))
+        ])
+        return order
+    
+    def _stock(self):
+        return Clothing.objects.get(pk=self.clothing.pk).stock
+    
+    @override_settings(ORDER_EVENTS_MODE='inline')
+    def test_inline_mode_updates_derived_data_in_the_write(self):
+        self._order()
+        self.assertEqual(self._stock(), 98)
+        self.assertFalse(OrderEvent.objects.exists())
+    
+    @override_settings(ORDER_EVENTS_MODE='outbox')
+    def test_outbox_mode_defers_to_process_batch(self):
+        self._order()
+        self.assertEqual(self._stock(), 100)
+        self.assertEqual(OrderEvent.objects.filter(processed_at__isnull=True).count(), 2)
+        self.assertEqual(process_batch(), 2)
+        self.assertEqual(self._stock(), 98)
+        # 已处理的事件不再生效
+        self.assertEqual(process_batch(), 0)
+        self.assertEqual(self._stock(), 98)
+    
+    @override_settings(ORDER_EVENTS_MODE='outbox')
+    def test_live_feed_publishes_late_committed_events(self):
+        cursors = live._latest_event_ids()
+        self._order()
+        # 订单事件的ID较小但较晚提交：发布时尚不可见，之后以原ID出现
+        event = OrderEvent.objects.order_by('id').first()
+        OrderEvent.objects.filter(pk=event.pk).delete()
+        with mock.patch.object(live.feed, 'publish') as publish:
+            cursors = live._publish_new_events(cursors)
+        self.assertEqual([call.args[0] for call in publish.call_args_list], [
+            {'clothing_type': {'T恤': [119.8, 1]}, 'price_range': {}},
+        ])
+        OrderEvent.objects.create(id=event.id, kind=event.kind, payload=event.payload)
+        with mock.patch.object(live.feed, 'publish') as publish:
+            cursors = live._publish_new_events(cursors)
+        self.assertEqual([call.args[0] for call in publish.call_args_list], [{'region': {'华东': [119.8, 1]}}])
+        with mock.patch.object(live.feed, 'publish') as publish:
+            live._publish_new_events(cursors)
+        publish.assert_not_called()
+    
+    @override_settings(ORDER_EVENTS_MODE='outbox')
+    def test_failed_batch_is_reprocessed(self):
+        self._order()
+        self._order('OE002')
+        
+        def fail(sender, **kwargs):
+            raise RuntimeError('receiver failed')
+        
+        order_items_created.connect(fail, dispatch_uid='test_fail')
+        try:
+            with self.assertRaises(RuntimeError):
+                process_batch()
+        finally:
+            order_items_created.disconnect(dispatch_uid='test_fail')
+        # 整批回滚：库存未扣减，事件仍未处理
+        self.assertEqual(self._stock(), 100)
+        self.assertEqual(OrderEvent.objects.filter(processed_at__isnull=True).count(), 4)
+        
+        # 重试时按批大小分批处理，每个事件只生效一次
+        self.assertEqual(process_batch(batch_size=3), 3)
+        self.assertEqual(process_batch(batch_size=3), 1)
+        self.assertEqual(self._stock(), 96)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    ANALYSIS_COST_BUDGETS={'user': 30, 'global': 40},
+    ANALYSIS_COST_PERIOD=3600,
+)
+class AdmissionTests(TestCase):
+    """重型分析请求按成本从数据库中的用户与全局预算扣减，超出时返回 429"""
+    
+    URL = '/api/analysis/region-sales/'
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(username=f'analyst{i}', password='secret') for i in range(2)]
+        Region.objects.create(name='华东', code='HD')
+    
+    def _get(self, user, params=None):
+        # 清空响应缓存，每个请求都需要实际计算
+        cache.clear()
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get(self.URL, params)
+    
+    def _used(self, scope):
+        return sum(CostBudgetUsage.objects.filter(scope=scope).values_list('used', flat=True))
+    
+    def test_estimate_cost(self):
+        view = views.RegionSalesAnalysisView()
+        
+        def cost(params):
+            return estimate_cost(view, Request(APIRequestFactory().get(self.URL, params)))
+        
+        today = timezone.localdate()
+        self.assertEqual(cost({}), 12)
+        self.assertEqual(cost({'start_date': (today - datetime.timedelta(days=45)).isoformat()}), 2)
+        self.assertEqual(cost({'include_archive': '1'}), 24)
+        self.assertEqual(cost({'approx': '1'}), 1)
+    
+    def test_user_budget(self):
+        user = self.users[0]
+        for _ in range(2):
+            self.assertEqual(self._get(user).status_code, 200)
+        response = self._get(user)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        # 被拒绝的请求不占用预算，用量不受缓存清空影响
+        self.assertEqual(self._used(f'user:{user.pk}'), 24)
+        self.assertEqual(self._used('global'), 24)
+        # 成本较低的请求仍可执行
+        self.assertEqual(self._get(user, {'start_date': timezone.localdate().isoformat()}).status_code, 200)
+    
+    def test_global_budget_refunds_user(self):
+        for user in (self.users[0], self.users[0], self.users[1]):
+            self.assertEqual(self._get(user).status_code, 200)
+        # 全局已用 36，再计算一次会超出全局预算 40，已扣减的用户预算退回
+        response = self._get(self.users[1])
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(self._used(f'user:{self.users[1].pk}'), 12)
+        self.assertEqual(self._used('global'), 36)
+    
+    def test_refund_goes_to_the_charged_window(self):
+        now = [1000 * 60 + 59]
+        
+        def busy(timeout):
+            # 等待计算槽位期间进入下一个预算周期
+            now[0] += 60
+            return False
+        
+        slots = mock.Mock(acquire=busy)
+        with self.settings(ANALYSIS_COST_PERIOD=60), mock.patch('sales_analysis.admission.time', mock.Mock(time=lambda: now[0])):
+            with mock.patch('sales_analysis.admission._worker_slots', return_value=slots):
+                self.assertEqual(self._get(self.users[0]).status_code, 429)
+        self.assertEqual(self._used(f'user:{self.users[0].pk}'), 0)
+        self.assertEqual(self._used('global'), 0)
+
+
+class SingleFlightTests(TestCase):
+    """相同 key 的计算同时只执行一次：进程内等待 Event，进程间按 key 加文件锁"""
+    
+    def setUp(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir, ignore_errors=True)
+        data_settings = self.settings(ANALYTICS_DATA_DIR=data_dir)
+        data_settings.enable()
+        self.addCleanup(data_settings.disable)
+        self.locks = os.path.join(data_dir, 'locks')
+    
+    def test_concurrent_calls_compute_once(self):
+        saved, calls, results = {}, [], []
+        computing, release = threading.Event(), threading.Event()
+        
+        def compute():
+            calls.append(threading.get_ident())
+            computing.set()
+            release.wait(5)
+            saved['result'] = 'value'
+            return 'value'
+        
+        def run():
+            results.append(single_flight('dashboard', lambda: saved.get('result'), compute))
+        
+        threads = [threading.Thread(target=run) for _ in range(3)]
+        threads[0].start()
+        self.assertTrue(computing.wait(5))
+        for thread in threads[1:]:
+            thread.start()
+        # 后到的线程在领头线程的 Event 上等待
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['value'] * 3)
+        self.assertEqual(os.listdir(self.locks), [])
+    
+    def test_file_lock_per_key(self):
+        waited = []
+        
+        def wait():
+            with process_lock('a', 5) as acquired:
+                waited.append(acquired)
+        
+        with process_lock('a', 1) as acquired:
+            self.assertTrue(acquired)
+            # flock 按打开的文件互斥，同一进程内重新打开与其他进程等价
+            with process_lock('a', 0.1) as acquired:
+                self.assertFalse(acquired)
+            # 不同 key 使用不同的锁文件，互不阻塞
+            with process_lock('b', 0.1) as acquired:
+                self.assertTrue(acquired)
+            waiter = threading.Thread(target=wait)
+            waiter.start()
+            time.sleep(0.1)
+        # 等待者在已删除的旧锁文件上拿到锁后重新打开，仍只有一个持锁者
+        waiter.join(5)
+        self.assertEqual(waited, [True])
+        self.assertEqual(os.listdir(self.locks), [])
+
+
+class SnapshotTests(TestCase):
+    """列式快照只追加快照之后的新订单，已有订单被修改或删除后改用数据库查询"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='analyst', password='secret')
+        cls.region = Region.objects.create(name='华东', code='HD')
+        now = timezone.now()
+        for i in range(5):
+            order = SalesOrder.objects.create(
+                order_number=f'SN{i:03d}', user=cls.user, region=cls.region, total_amount=Decimal('10.00') * (i + 1)
+            )
+            SalesOrder.objects.filter(pk=order.pk).update(order_date=now - datetime.timedelta(days=i))
+    
+    def setUp(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir, ignore_errors=True)
+        data_settings = self.settings(ANALYTICS_DATA_DIR=data_dir)
+        data_settings.enable()
+        self.addCleanup(data_settings.disable)
+        build_snapshot()
+    
+    def _expected(self):
+        rows = SalesOrder.objects.values('order_date').annotate(
+            daily_cents=Sum(Cents('total_amount'))
+        ).order_by('order_date')
+        return [row['daily_cents'] for row in rows]
+    
+    def test_new_orders_are_appended(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            SalesOrder.objects.create(order_number='SN-NEW', user=self.user, region=self.region, total_amount=Decimal('7.00'))
+        df = snapshot_sales_by_date()
+        self.assertIsNotNone(df)
+        self.assertEqual(df['daily_cents'].tolist(), self._expected())
+    
+    def test_late_committed_orders_below_watermark_are_appended(self):
+        max_id = SalesOrder.objects.order_by('-id').values_list('id', flat=True).first()
+        SalesOrder.objects.create(
+            id=max_id + 3, order_number='SN-AFTER', user=self.user, region=self.region, total_amount=Decimal('3.00')
+        )
+        build_snapshot()
+        self.assertEqual(current_snapshot().manifest['tables']['orders']['max_id'], max_id + 3)
+        # 快照构建之后才提交的、ID 低于快照水位的订单
+        SalesOrder.objects.create(
+            id=max_id + 1, order_number='SN-LATE', user=self.user, region=self.region, total_amount=Decimal('70.00')
+        )
+        df = snapshot_sales_by_date()
+        self.assertIsNotNone(df)
+        self.assertEqual(df['daily_cents'].tolist(), self._expected())
+    
+    def test_modified_orders_invalidate_snapshot(self):
+        self.assertEqual(snapshot_sales_by_date()['daily_cents'].tolist(), self._expected())
+        order = SalesOrder.objects.get(order_number='SN000')
+        order.total_amount = Decimal('99.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+        self.assertIsNone(snapshot_sales_by_date())
+        # 重建后重新使用快照
+        build_snapshot()
+        self.assertEqual(snapshot_sales_by_date()['daily_cents'].tolist(), self._expected())
+
+
+@unittest.skipIf(duckdb_backend.duckdb is None, '未安装 duckdb')
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    ANALYSIS_COST_BUDGETS={'user': 10 ** 6, 'global': 10 ** 6},
+)
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    ANALYSIS_COST_BUDGETS={'user': 10 ** 6, 'global': 10 ** 6},
+)
+class ArchiveTests(TestCase):
+    """热数据窗口之外的订单移入归档表、按月导出为 Parquet，include_archive=1 时合并进分析结果"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='analyst', password='secret')
+        cls.regions = [Region.objects.create(name='华东', code='HD'), Region.objects.create(name='华北', code='HB')]
+        clothing = Clothing.objects.create(
+            name='纯棉T恤', clothing_type=ClothingType.objects.create(name='T恤'), price=Decimal('59.90'), stock=100
+        )
+        cls.before = hot_window_start(1)
+        # 两个冷月份与当月
+        dates = [cls.before - datetime.timedelta(days=45)] * 2 + [cls.before - datetime.timedelta(days=10)]
+        dates += [timezone.now()] * 2
+        for i, order_date in enumerate(dates):
+            order = SalesOrder.objects.create(
+                order_number=f'AR{i:03d}', user=cls.user, region=cls.regions[i % 2], total_amount=Decimal('10.00') * (i + 1)
+            )
+            order.order_date = order_date
+            order.save()
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, clothing=clothing, quantity=j + 1, price=clothing.price) for j in range(i % 2 + 1)
+            ])
+        cls.cold_month = month_start(dates[0])
+    
+    def setUp(self):
+        cache.clear()
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir, ignore_errors=True)
+        data_settings = self.settings(ANALYTICS_DATA_DIR=data_dir)
+        data_settings.enable()
+        self.addCleanup(data_settings.disable)
+    
+    def _region_sales(self, params=None):
+        cache.clear()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/analysis/region-sales/', params)
+        self.assertEqual(response.status_code, 200)
+        return {
+            row['region_name']: (Decimal(str(row['total_sales'])).quantize(Decimal('0.01')), row['order_count'])
+            for row in response.json()
+        }
+    
+    def test_rotate_to_archive_tables(self):
+        cold_items = OrderItem.objects.filter(order_date__lt=self.before).count()
+        self.assertEqual(rotate_to_archive_tables(self.before), 2)
+        self.assertEqual(ArchivedSalesOrder.objects.count(), 3)
+        self.assertEqual(ArchivedOrderItem.objects.count(), cold_items)
+        self.assertFalse(SalesOrder.objects.filter(order_date__lt=self.before).exists())
+        self.assertFalse(OrderItem.objects.filter(order_date__lt=self.before).exists())
+        self.assertEqual(SalesOrder.objects.count(), 2)
+        self.assertEqual(rotate_to_archive_tables(self.before), 0)
+    
+    def test_archived_order_numbers_stay_unique(self):
+        rotate_to_archive_tables(self.before)
+        self.assertEqual(used_order_numbers(['AR000', 'AR004', 'NEW']), {'AR000', 'AR004'})
+        # 归档的订单已不在订单表的唯一索引内，由登记表拒绝重复的订单号
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            SalesOrder.objects.create(order_number='AR000', user=self.user, region=self.regions[0], total_amount=0)
+        order = SalesOrder.objects.create(order_number='NEW', user=self.user, region=self.regions[0], total_amount=0)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            SalesOrder.objects.filter(pk=order.pk).update(order_number='AR001')
+        # 修改订单号释放旧编号
+        SalesOrder.objects.filter(pk=order.pk).update(order_number='NEW2')
+        self.assertEqual(used_order_numbers(['NEW', 'NEW2']), {'NEW2'})
+    
+    def test_archive_month(self):
+        expected = set(SalesOrder.objects.filter(
+            order_date__lt=self.before - datetime.timedelta(days=20)
+        ).values_list('id', 'order_number'))
+        items = OrderItem.objects.filter(order_id__in=[order_id for order_id, _ in expected]).count()
+        
+        # 在线表中的订单直接导出并删除
+        self.assertEqual(archive_month(self.cold_month), (2, items))
+        self.assertFalse(SalesOrder.objects.filter(pk__in=[order_id for order_id, _ in expected]).exists())
+        self.assertFalse(OrderItem.objects.filter(order_id__in=[order_id for order_id, _ in expected]).exists())
+        frame = archived_frame('orders')
+        self.assertEqual(set(zip(frame['id'], frame['order_number'])), expected)
+        self.assertEqual(len(archived_frame('items')), items)
+        self.assertEqual(archive_month(self.cold_month), (0, 0))
+        
+        # 归档表中的订单同样导出，导出后从归档表删除
+        rotate_to_archive_tables(self.before)
+        next_cold = month_start(self.before - datetime.timedelta(days=10))
+        self.assertEqual(archive_month(next_cold)[0], 1)
+        self.assertFalse(ArchivedSalesOrder.objects.exists())
+        self.assertEqual(len(archived_frame('orders')), 3)
+        self.assertEqual(len(archived_frame('orders', start=next_cold)), 1)
+    
+    def test_include_archive_merges_archived_sales(self):
+        everything = self._region_sales()
+        rotate_to_archive_tables(self.before)
+        archive_month(self.cold_month)
+        hot = self._region_sales()
+        self.assertLess(sum(count for _, count in hot.values()), sum(count for _, count in everything.values()))
+        # 归档表与 Parquet 文件中的订单按地区名称合并回在线结果
+        self.assertEqual(self._region_sales({'include_archive': '1'}), everything)
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
+class ThumbnailTests(TestCase):
+    """图片提交后生成各尺寸与格式的缩略图，内容相同的图片只生成一次，生成期间被替换的图片不写入哈希"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.clothing_type = ClothingType.objects.create(name='T恤')
+    
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_settings = self.settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.storage = image_storage()
+    
+    def _png(self, color='red', mode='RGB', size=(800, 400)):
+        buffer = io.BytesIO()
+        Image.new(mode, size, color).save(buffer, 'PNG')
+        return buffer.getvalue()
+    
+    def _clothing(self, name, data):
+        return Clothing.objects.create(
+            name=name, clothing_type=self.clothing_type, price=Decimal('59.90'),
+            image=SimpleUploadedFile(f'{name}.png', data, content_type='image/png')
+        )
+    
+    def test_upload_generates_variants(self):
+        data = self._png(color=(255, 0, 0, 128), mode='RGBA')
+        with self.captureOnCommitCallbacks(execute=True):
+            clothing = self._clothing('shirt', data)
+        clothing.refresh_from_db()
+        digest = hashlib.sha256(data).hexdigest()
+        self.assertEqual(clothing.thumbnail_hash, digest)
+        
+        for size, width in settings.THUMBNAIL_SIZES.items():
+            for fmt in settings.THUMBNAIL_FORMATS:
+                with self.subTest(size=size, fmt=fmt), self.storage.open(variant_name(digest, width, fmt)) as f:
+                    image = Image.open(f)
+                    # 按最长边等比缩小
+                    self.assertEqual(image.size, (width, width // 2))
+                    self.assertEqual(image.format, 'WEBP' if fmt == 'webp' else 'JPEG')
+                    if fmt == 'jpeg':
+                        self.assertEqual(image.mode, 'RGB')
+        
+        thumbnails = ClothingSerializer(clothing).data['thumbnails']
+        self.assertEqual(set(thumbnails), set(settings.THUMBNAIL_SIZES))
+        self.assertEqual(thumbnails['small']['webp'], self.storage.url(variant_name(digest, 240, 'webp')))
+    
+    def test_same_content_is_generated_once(self):
+        data = self._png()
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self._clothing('first', data)
+        with mock.patch('sales_analysis.thumbnails._encode') as encode:
+            with self.captureOnCommitCallbacks(execute=True):
+                second = self._clothing('second', data)
+        encode.assert_not_called()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertNotEqual(first.image.name, second.image.name)
+        self.assertEqual(first.thumbnail_hash, second.thumbnail_hash)
+        
+        # force 时同一内容在一次运行中也只重新生成一次
+        regenerated = set()
+        with mock.patch('sales_analysis.thumbnails._encode', return_value=b'x') as encode:
+            generate_thumbnails(first.image.name, force=True, regenerated=regenerated)
+            generate_thumbnails(second.image.name, force=True, regenerated=regenerated)
+        self.assertEqual(encode.call_count, len(settings.THUMBNAIL_SIZES) * len(settings.THUMBNAIL_FORMATS))
+    
+    def test_regenerate_skips_replaced_images(self):
+        # 不执行提交回调，模拟尚未生成缩略图的已有商品
+        kept = self._clothing('kept', self._png('blue'))
+        replaced = self._clothing('replaced', self._png('green'))
+        broken = self._clothing('broken', b'not an image')
+        replacement = self.storage.save('clothing_images/new.png', ContentFile(self._png('white')))
+        
+        def generate(name, force=False, regenerated=None):
+            digest = generate_thumbnails(name, force, regenerated)
+            if name == replaced.image.name:
+                # 生成期间图片被替换
+                Clothing.objects.filter(pk=replaced.pk).update(image=replacement)
+            return digest
+        
+        stdout = io.StringIO()
+        with mock.patch('sales_analysis.thumbnails.ThreadPoolExecutor', InlineExecutor), \
+                mock.patch('sales_analysis.thumbnails.generate_thumbnails', side_effect=generate):
+            call_command('regenerate_thumbnails', workers=1, batch_size=2, stdout=stdout)
+        self.assertIn('2 个商品成功，1 个失败', stdout.getvalue())
+        hashes = dict(Clothing.objects.values_list('name', 'thumbnail_hash'))
+        self.assertEqual(hashes['kept'], hashlib.sha256(self._png('blue')).hexdigest())
+        self.assertEqual(hashes['replaced'], '')
+        self.assertEqual(hashes['broken'], '')
+        self.assertIn(f'商品 {broken.pk} 的图片', stdout.getvalue())
+        # 旧图片的哈希不会写到新图片上
+        self.assertEqual(record_thumbnails(replaced.pk, replaced.image.name, 'stale'), 0)
+
+
+class DuckDBBackendParityTests(TestCase):
+    """DuckDB 分析后端的结果需与 ORM 查询完全一致"""
+    
+    ENDPOINTS = ('region-sales', 'clothing-type-sales', 'price-range-sales', 'rating-distribution')
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='analyst', password='secret')
+        regions = [Region.objects.create(name=name, code=code) for name, code in (('华东', 'HD'), ('华北', 'HB'))]
+        types = [ClothingType.objects.create(name=name) for name in ('T恤', '外套')]
+        ranges = [
+            PriceRange.objects.create(name='0-100元', min_price=0, max_price=100),
+            PriceRange.objects.create(name='100-500元', min_price=100, max_price=500),
+        ]
+        categories = [RatingCategory.objects.create(name=name) for name in ('好评', '差评')]
+        clothing = [
+            Clothing.objects.create(name='纯棉T恤', clothing_type=types[0], price=Decimal('59.90'), price_range=ranges[0]),
+            Clothing.objects.create(name='羽绒服', clothing_type=types[1], price=Decimal('399.00'), price_range=ranges[1]),
+            # 无价格区间
+            Clothing.objects.create(name='定制款', clothing_type=types[1], price=Decimal('1280.50')),
+        ]
+        today = timezone.now()
+        for i in range(40):
+            order = SalesOrder.objects.create(
+                order_number=f'DK{i:03d}', user=cls.user, region=regions[i % 3 % 2], total_amount=0
+            )
+            order.order_date = today - datetime.timedelta(days=i, hours=i % 5)
+            items = [
+                OrderItem(order=order, clothing=clothing[(i + j) % 3], quantity=j + 1, price=clothing[(i + j) % 3].price)
+                for j in range(i % 3 + 1)
+            ]
+            order.total_amount = sum(item.price * item.quantity for item in items) + Decimal('0.01') * i
+            order.save()
+            OrderItem.objects.bulk_create(items)
+            rating = Rating.objects.create(
+                user=cls.user, clothing=clothing[i % 3], rating=i % 5 + 1,
+                category=categories[i % 4 % 2] if i % 7 else None
+            )
+            Rating.objects.filter(pk=rating.pk).update(created_at=order.order_date)
+    
+    def setUp(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir, ignore_errors=True)
+        data_settings = self.settings(ANALYTICS_DATA_DIR=data_dir)
+        data_settings.enable()
+        self.addCleanup(data_settings.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # 分析接口不自行导出，查询前先同步
+        duckdb_backend.sync_all()
+    
+    def _get(self, endpoint, backend, params):
+        cache.clear()
+        with self.settings(ANALYTICS_BACKENDS={endpoint: backend}):
+            response = self.client.get(f'/api/analysis/{endpoint}/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+    
+    def test_chart_endpoints_match_orm(self):
+        # 分片已同步，DuckDB 后端实际参与计算而不是退回 ORM
+        for query in (
+            duckdb_backend.region_sales, duckdb_backend.clothing_type_sales,
+            duckdb_backend.price_range_sales, duckdb_backend.rating_distribution,
+        ):
+            self.assertIsNotNone(query())
+        today = timezone.localdate()
+        windows = (
+            {},
+            {'start_date': (today - datetime.timedelta(days=14)).isoformat()},
+            {
+                'start_date': (today - datetime.timedelta(days=30)).isoformat(),
+                'end_date': (today - datetime.timedelta(days=10)).isoformat(),
+            },
+        )
+        for endpoint in self.ENDPOINTS:
+            for params in windows:
+                with self.subTest(endpoint=endpoint, params=params):
+                    expected = self._get(endpoint, 'orm', params)
+                    self.assertTrue(expected)
+                    self.assertEqual(self._get(endpoint, 'duckdb', params), expected)
+    
+    def test_sales_by_date_matches_orm(self):
+        expected = pd.DataFrame(list(SalesOrder.objects.values('order_date').annotate(
+            daily_cents=Sum(Cents('total_amount'))
+        ).order_by('order_date')))
+        expected['order_date'] = pd.to_datetime(expected['order_date'])
+        actual = duckdb_backend.sales_by_date()
+        self.assertEqual(actual['order_date'].tolist(), expected['order_date'].tolist())
+        self.assertEqual(actual['daily_cents'].tolist(), expected['daily_cents'].tolist())
+    
+    def test_incremental_sync_follows_watermark(self):
+        self.assertEqual(len(duckdb_backend.sync_table('orders')['parts']), 1)
+        region = Region.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            SalesOrder.objects.create(
+                order_number='DK-NEW', user=self.user, region=region, total_amount=Decimal('1000.00')
+            )
+        # 查询时从数据库补齐新订单，不写分片
+        self.assertEqual(self._get('region-sales', 'duckdb', {}), self._get('region-sales', 'orm', {}))
+        self.assertEqual(len(duckdb_backend._read_manifest('orders')['parts']), 1)
+        # 同步时只追加新订单的分片
+        manifest = duckdb_backend.sync_table('orders')
+        self.assertEqual(len(manifest['parts']), 2)
+        self.assertEqual(manifest['rows'], SalesOrder.objects.count())
+        self.assertEqual(self._get('region-sales', 'duckdb', {}), self._get('region-sales', 'orm', {}))
+    
+    def test_late_committed_rows_below_watermark_are_exported(self):
+        max_id = duckdb_backend._read_manifest('orders')['max_id']
+        region = Region.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            SalesOrder.objects.create(
+                id=max_id + 5, order_number='DK-LATE2', user=self.user, region=region, total_amount=Decimal('20.00')
+            )
+        duckdb_backend.sync_table('orders')
+        # ID 较小的订单在同步之后才提交，低于水位但仍在 ID_LAG 以内
+        with self.captureOnCommitCallbacks(execute=True):
+            SalesOrder.objects.create(
+                id=max_id + 2, order_number='DK-LATE1', user=self.user, region=region, total_amount=Decimal('300.00')
+            )
+        self.assertEqual(self._get('region-sales', 'duckdb', {}), self._get('region-sales', 'orm', {}))
+        manifest = duckdb_backend.sync_table('orders')
+        self.assertEqual(manifest['max_id'], max_id + 5)
+        self.assertEqual(manifest['rows'], SalesOrder.objects.count())
+        self.assertEqual(self._get('region-sales', 'duckdb', {}), self._get('region-sales', 'orm', {}))
+        # 再次同步不会重复导出水位之下已导出的订单
+        with self.captureOnCommitCallbacks(execute=True):
+            SalesOrder.objects.create(order_number='DK-NEXT', user=self.user, region=region, total_amount=0)
+        self.assertEqual(duckdb_backend.sync_table('orders')['rows'], SalesOrder.objects.count())
+    
+    def test_modified_rows_fall_back_to_orm(self):
+        order = SalesOrder.objects.get(order_number='DK001')
+        order.total_amount = Decimal('5000.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+        # 已导出的订单被修改后不再使用分片，直到下次同步全量重写
+        self.assertIsNone(duckdb_backend.region_sales())
+        self.assertEqual(self._get('region-sales', 'duckdb', {}), self._get('region-sales', 'orm', {}))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            SalesOrder.objects.filter(order_number='DK000').delete()
+        manifest = duckdb_backend.sync_table('orders')
+        self.assertEqual(len(manifest['parts']), 1)
+        self.assertEqual(manifest['rows'], SalesOrder.objects.count())
+        self.assertIsNotNone(duckdb_backend.region_sales())
+        self.assertEqual(self._get('region-sales', 'duckdb', {}), self._get('region-sales', 'orm', {}))
+
+
+SHARD_ALIASES = ('shard_hd', 'shard_hb')
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    ANALYSIS_COST_BUDGETS={'user': 10 ** 6, 'global': 10 ** 6},
+)
+class RegionShardingTests(TransactionTestCase):
+    """
+    按地区分片：订单写入各地区的 SQLite 数据库，分析接口合并各分片的结果需与单库完全一致。
+    分片查询在工作线程中执行，需要已提交的数据，因此使用 TransactionTestCase；
+    分片数据库在测试类内临时注册，每个测试结束后清空。
+    """
+    
+    SHARDS = {'HD': 'shard_hd', 'HB': 'shard_hb'}
+    URLS = (
+        '/api/analysis/region-sales/', '/api/analysis/clothing-type-sales/',
+        '/api/analysis/price-range-sales/', '/api/forecast/price/', '/api/forecast/sales/',
+    )
+    
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # 临时注册分片数据库并建表
+        cls.shard_dir = tempfile.mkdtemp()
+        databases = dict(connections.settings)
+        for alias in SHARD_ALIASES:
+            databases[alias] = {
+                'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(cls.shard_dir, f'{alias}.sqlite3')
+            }
+        connections.settings = connections.configure_settings(databases)
+        for alias in SHARD_ALIASES:
+            call_command('migrate', database=alias, verbosity=0)
+    
+    @classmethod
+    def tearDownClass(cls):
+        for alias in SHARD_ALIASES:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        shutil.rmtree(cls.shard_dir, ignore_errors=True)
+        super().tearDownClass()
+    
+    def setUp(self):
+        # 每个测试结束后清空数据库，表版本号从头计数，缓存的结果不能跨测试复用
+        cache.clear()
+        self.addCleanup(self._flush_shards)
+    
+    def _flush_shards(self):
+        for alias in SHARD_ALIASES:
+            call_command('flush', database=alias, interactive=False, verbosity=0)
+    
+    def _create_data(self):
+        user = User.objects.create_user(username='analyst', password='secret')
+        regions = [
+            Region.objects.create(name=name, code=code) for name, code in (('华东', 'HD'), ('华北', 'HB'), ('西南', 'XN'))
+        ]
+        types = [ClothingType.objects.create(name=name) for name in ('T恤', '外套')]
+        ranges = [
+            PriceRange.objects.create(name='0-100元', min_price=0, max_price=100),
+            PriceRange.objects.create(name='100-500元', min_price=100, max_price=500),
+        ]
+        clothing = [
+            Clothing.objects.create(name='纯棉T恤', clothing_type=types[0], price=Decimal('59.90'), price_range=ranges[0]),
+            Clothing.objects.create(name='羽绒服', clothing_type=types[1], price=Decimal('399.00'), price_range=ranges[1]),
+            Clothing.objects.create(name='定制款', clothing_type=types[1], price=Decimal('1280.50')),
+        ]
+        today = timezone.now()
+        orders = []
+        for i in range(80):
+            order = SalesOrder.objects.create(
+                order_number=f'SH{i:03d}', user=user, region=regions[i % 3], total_amount=0
+            )
+            # 每两个订单同一时间且在不同分片，日销售额需要跨分片合并
+            order.order_date = today - datetime.timedelta(days=i // 2)
+            items = [
+                OrderItem(order=order, clothing=clothing[(i + j) % 3], quantity=j + 1, price=clothing[(i + j) % 3].price)
+                for j in range(i % 3 + 1)
+            ]
+            order.total_amount = sum(item.price * item.quantity for item in items) + Decimal('0.01') * i
+            order.save()
+            OrderItem.objects.bulk_create(items)
+            orders.append(order)
+        # 单条保存的条目跟随订单所在的分片
+        OrderItem.objects.create(order=orders[1], clothing=clothing[0], quantity=1, price=Decimal('10.00'))
+        return user
+    
+    def _responses(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        responses = {}
+        for url in self.URLS:
+            cache.clear()
+            random.seed(0)
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            responses[url] = response.json()
+        return responses
+    
+    def test_writes_are_routed_by_region(self):
+        with self.settings(SALES_SHARDS=self.SHARDS):
+            self._create_data()
+            placement = {
+                alias: set(SalesOrder.objects.using(alias).values_list('region__code', flat=True))
+                for alias in sales_databases()
+            }
+            self.assertEqual(placement, {'default': {'XN'}, 'shard_hd': {'HD'}, 'shard_hb': {'HB'}})
+            for alias in sales_databases():
+                # 条目与订单在同一个分片，参照表已复制到每个分片
+                items = OrderItem.objects.using(alias)
+                self.assertEqual(items.exclude(order__region__code__in=placement[alias]).count(), 0)
+                self.assertEqual(Clothing.objects.using(alias).count(), 3)
+            # 主键在各分片间不重复
+            ids = [pk for alias in sales_databases() for pk in SalesOrder.objects.using(alias).values_list('pk', flat=True)]
+            self.assertEqual(sorted(ids), list(range(1, 81)))
+            self.assertEqual(IdSequence.objects.get(name='sales_analysis.SalesOrder').next_id, 81)
+    
+    def test_scatter_gather_matches_single_database(self):
+        with self.settings(SALES_SHARDS=self.SHARDS):
+            sharded = self._responses(self._create_data())
+        call_command('flush', interactive=False, verbosity=0)
+        self._flush_shards()
+        single = self._responses(self._create_data())
+        for url in self.URLS:
+            with self.subTest(url=url):
+                self.assertTrue(single[url])
+                self.assertEqual(sharded[url], single[url])
+    
+    def test_new_shard_orders_change_watermark(self):
+        with self.settings(SALES_SHARDS=self.SHARDS):
+            user = self._create_data()
+            client = APIClient()
+            client.force_authenticate(user)
+            before = {row['region_name']: row for row in client.get('/api/analysis/region-sales/').json()}
+            SalesOrder.objects.create(
+                order_number='SH-NEW', user=user, region=Region.objects.get(code='HB'), total_amount=Decimal('1000.00')
+            )
+            after = {row['region_name']: row for row in client.get('/api/analysis/region-sales/').json()}
+        self.assertEqual(after['华北']['order_count'], before['华北']['order_count'] + 1)
+        self.assertEqual(Decimal(after['华北']['total_sales']), Decimal(before['华北']['total_sales']) + 1000)
+    
+    def _shard_order(self, user, clothing, fail=False):
+        """在华北分片上写入一个订单与条目，fail 时在分片事务中回滚"""
+        try:
+            with transaction.atomic(using='shard_hb'):
+                order = SalesOrder.objects.create(
+                    order_number='SH-TX', user=user, region=Region.objects.get(code='HB'), total_amount=Decimal('59.90')
+                )
+                OrderItem.objects.create(order=order, clothing=clothing, quantity=2, price=clothing.price)
+                if fail:
+                    raise RuntimeError('rollback')
+        except RuntimeError:
+            pass
+    
+    def test_outbox_events_follow_shard_transaction(self):
+        with self.settings(SALES_SHARDS=self.SHARDS, ORDER_EVENTS_MODE='outbox'):
+            user = self._create_data()
+            call_command('process_outbox', verbosity=0, stdout=io.StringIO())
+            clothing = Clothing.objects.get(name='纯棉T恤')
+            
+            # 回滚的分片订单不在任何数据库留下事件
+            self._shard_order(user, clothing, fail=True)
+            self.assertEqual(sum(OrderEvent.objects.using(alias).filter(processed_at__isnull=True).count()
+                                 for alias in sales_databases()), 0)
+            
+            # 提交的分片订单事件写入分片，由 process_outbox 逐库处理后扣减默认库中的库存
+            self._shard_order(user, clothing)
+            self.assertEqual(OrderEvent.objects.using('shard_hb').filter(processed_at__isnull=True).count(), 2)
+            call_command('process_outbox', verbosity=0, stdout=io.StringIO())
+            self.assertEqual(OrderEvent.objects.using('shard_hb').filter(processed_at__isnull=True).count(), 0)
+            self.assertEqual(Clothing.objects.get(pk=clothing.pk).stock, clothing.stock - 2)
+    
+    def test_live_feed_tails_every_shard_outbox(self):
+        with self.settings(SALES_SHARDS=self.SHARDS, ORDER_EVENTS_MODE='outbox'):
+            user = self._create_data()
+            cursors = live._latest_event_ids()
+            self.assertEqual(set(cursors), set(sales_databases()))
+            self._shard_order(user, Clothing.objects.get(name='纯棉T恤'))
+            with mock.patch.object(live.feed, 'publish') as publish:
+                cursors = live._publish_new_events(cursors)
+            deltas = [call.args[0] for call in publish.call_args_list]
+            self.assertEqual(deltas, [{'region': {'华北': [59.9, 1]}}, {
+                'clothing_type': {'T恤': [119.8, 1]}, 'price_range': {'0-100元': [119.8, 1]},
+            }])
+            # 已发布的事件不再重复发布
+            with mock.patch.object(live.feed, 'publish') as publish:
+                live._publish_new_events(cursors)
+            publish.assert_not_called()
+    
+    def test_inline_receivers_wait_for_shard_commit(self):
+        with self.settings(SALES_SHARDS=self.SHARDS):
+            user = self._create_data()
+            clothing = Clothing.objects.get(name='纯棉T恤')
+            self._shard_order(user, clothing, fail=True)
+            self.assertEqual(Clothing.objects.get(pk=clothing.pk).stock, clothing.stock)
+            self._shard_order(user, clothing)
+            self.assertEqual(Clothing.objects.get(pk=clothing.pk).stock, clothing.stock - 2)
+    
+    def test_cold_orders_are_archived_on_every_shard(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir, ignore_errors=True)
+        with self.settings(SALES_SHARDS=self.SHARDS, ANALYTICS_DATA_DIR=data_dir):
+            self._create_data()
+            before = hot_window_start(1)
+            expected = {
+                alias: SalesOrder.objects.using(alias).filter(order_date__lt=before).count()
+                for alias in sales_databases()
+            }
+            totals = archived_sales_by('region')
+            call_command('manage_partitions', hot_months=1, stdout=io.StringIO())
+            for alias in sales_databases():
+                with self.subTest(alias=alias):
+                    self.assertEqual(ArchivedSalesOrder.objects.using(alias).count(), expected[alias])
+                    self.assertFalse(SalesOrder.objects.using(alias).filter(order_date__lt=before).exists())
+                    self.assertFalse(OrderItem.objects.using(alias).filter(order_date__lt=before).exists())
+            # 归档汇总读取每个库的归档表
+            self.assertEqual(sum(count for _, count in archived_sales_by('region').values()), sum(expected.values()))
+            self.assertFalse(totals)
+    
+    def test_shard_commit_bumps_versions_after_default_commit(self):
+        with self.settings(SALES_SHARDS=self.SHARDS):
+            user = self._create_data()
+            label = OrderItem._meta.label
+            before = table_versions([OrderItem])[label][0]
+            with transaction.atomic():
+                self._shard_order(user, Clothing.objects.get(name='纯棉T恤'))
+                # 分片已提交，默认库的事务仍未结束
+                self.assertEqual(table_versions([OrderItem])[label][0], before)
+            self.assertEqual(table_versions([OrderItem])[label][0], before + 1)
+    
+    def test_customer_analytics_reads_every_shard(self):
+        with self.settings(SALES_SHARDS=self.SHARDS):
+            user = self._create_data()
+            refresh_customer_analytics(full=True)
+        self.assertEqual(CustomerStats.objects.get(user=user).frequency, 80)
@@ -0,0 +1,263 @@
+"""
+评价文本分析：对 Rating.comment 分词并在磁盘上维护倒排索引。
+
+索引目录位于 ANALYTICS_DATA_DIR/rating_index，由若干只追加的段组成，
+每段是按词ID排序的 term_ids / rating_ids / clothing_ids / stars 四个 .npy 列文件，
+查询时以内存映射方式打开并二分查找，不需要对评价表做 LIKE '%...%' 扫描。
+lexicon.json 保存词表、文档频次、评分累计、段列表和已索引的 Rating 水位，
+每次增量索引只处理尚未索引的新评价并追加一个新段，段数过多时合并。自增ID按分配顺序而不是
+提交顺序可见，词表另外记录水位之下 ID_LAG 以内已索引的评价ID，每次补上这一范围内较晚提交的评价。
+段只追加、不撤销已写入的记录：已索引的评价被修改或删除后（Rating 的 modified 版本号变化），
+下一次 index_ratings 全量重建索引。
+"""
+import json
+import os
+import re
+import shutil
+import uuid
+
+import numpy as np
+from django.conf import settings
+
+from .models import Rating
+from .columns import ID_LAG, advance_watermark
+from .versions import modified_version
+
+try:
+    import jieba
+except ImportError:  # 未安装 jieba 时退化为中文二元切分
+    jieba = None
+
+# 段数超过该值时合并为一个段
+MAX_SEGMENTS = 8
+# 每批索引的评价数
+BATCH_SIZE = 20000
+
+STOPWORDS = {
+    '的', '了', '是', '我', '也', '很', '都', '就', '还', '和', '有', '在', '这', '个',
+    '非常', '比较', '一般', '用户', '评价', '对',
+}
+
+_CJK_RUN = re.compile(r'[\u4e00-\u9fff]+|[a-zA-Z0-9]+')
+
+_lexicon_cache = {}
+
+
+def tokenize(text):
+    """把评价文本切分为去重后的关键词列表"""
+    if not text:
+        return []
+    text = text.lower()
+    if jieba is not None:
+        tokens = (token.strip() for token in jieba.lcut(text))
+        tokens = [token for token in tokens if len(token) > 1 and _CJK_RUN.fullmatch(token)]
+    else:
+        tokens = []
+        for run in _CJK_RUN.findall(text):
+            if run.isascii() or len(run) < 2:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return list(dict.fromkeys(token for token in tokens if token not in STOPWORDS))
+
+
+def _index_dir():
+    return os.path.join(settings.ANALYTICS_DATA_DIR, 'rating_index')
+
+
+def _lexicon_path():
+    return os.path.join(_index_dir(), 'lexicon.json')
+
+
+def _empty_lexicon():
+    return {'watermark': 0, 'recent': [], 'segments': [], 'terms': [], 'doc_freq': [], 'star_sum': []}
+
+
+def index_version():
+    """词表文件的修改时间，每次 index_ratings 后变化"""
+    path = _lexicon_path()
+    return os.path.getmtime(path) if os.path.exists(path) else 0
+
+
+def load_lexicon():
+    """读取词表与段列表，按文件修改时间在进程内缓存"""
+    path = _lexicon_path()
+    if not os.path.exists(path):
+        return _empty_lexicon()
+    mtime = os.path.getmtime(path)
+    cached = _lexicon_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, encoding='utf-8') as f:
+        lexicon = json.load(f)
+    lexicon['term_ids'] = {term: i for i, term in enumerate(lexicon['terms'])}
+    _lexicon_cache[path] = (mtime, lexicon)
+    return lexicon
+
+
+def _save_lexicon(lexicon):
+    path = _lexicon_path()
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    data = {key: value for key, value in lexicon.items() if key != 'term_ids'}
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _open_segment(name):
+    directory = os.path.join(_index_dir(), name)
+    return {
+        column: np.load(os.path.join(directory, f'{column}.npy'), mmap_mode='r')
+        for column in ('term_ids', 'rating_ids', 'clothing_ids', 'stars')
+    }
+
+
+def _write_segment(columns):
+    """按词ID排序后写出一个新段，返回段名"""
+    order = np.lexsort((columns['rating_ids'], columns['term_ids']))
+    name = f'seg_{uuid.uuid4().hex[:12]}'
+    directory = os.path.join(_index_dir(), name)
+    os.makedirs(directory)
+    for column, values in columns.items():
+        np.save(os.path.join(directory, f'{column}.npy'), values[order])
+    return name
+
+
+def index_ratings(full=False):
+    """增量索引尚未索引的新评价，返回本次索引的评价数；已有评价被修改或删除过时全量重建"""
+    modified = modified_version(Rating)
+    lexicon = load_lexicon()
+    # 没有记录水位之下已索引ID的旧词表无法判断哪些评价已索引，同样全量重建
+    if lexicon.get('modified', 0) != modified or 'recent' not in lexicon:
+        full = True
+    if full:
+        shutil.rmtree(_index_dir(), ignore_errors=True)
+    os.makedirs(_index_dir(), exist_ok=True)
+    lexicon = _empty_lexicon() if full else load_lexicon()
+    terms = list(lexicon['terms'])
+    term_ids = {term: i for i, term in enumerate(terms)}
+    doc_freq = list(lexicon['doc_freq'])
+    star_sum = list(lexicon['star_sum'])
+    segments = list(lexicon['segments'])
+    watermark, recent = lexicon['watermark'], lexicon['recent']
+    
+    indexed = 0
+    while True:
+        # 水位之后的新评价，以及水位之下 ID_LAG 以内较晚提交的评价
+        seen = frozenset(recent)
+        ratings = [
+            row for row in Rating.objects.filter(id__gt=watermark - ID_LAG).order_by('id').values_list(
+                'id', 'clothing_id', 'rating', 'comment'
+            )[:BATCH_SIZE + len(seen)]
+            if row[0] not in seen
+        ]
+        if not ratings:
+            break
+        
+        postings = []
+        for rating_id, clothing_id, stars, comment in ratings:
+            for token in tokenize(comment):
+                term_id = term_ids.get(token)
+                if term_id is None:
+                    term_id = term_ids[token] = len(terms)
+                    terms.append(token)
+                    doc_freq.append(0)
+                    star_sum.append(0)
+                doc_freq[term_id] += 1
+                star_sum[term_id] += stars
+                postings.append((term_id, rating_id, clothing_id, stars))
+        
+        if postings:
+            array = np.array(postings, dtype=np.int64)
+            segments.append(_write_segment({
+                'term_ids': array[:, 0].astype(np.int32),
+                'rating_ids': array[:, 1],
+                'clothing_ids': array[:, 2],
+                'stars': array[:, 3].astype(np.int8),
+            }))
+        watermark, recent = advance_watermark(watermark, recent, [row[0] for row in ratings])
+        indexed += len(ratings)
+    
+    stale = []
+    if len(segments) > MAX_SEGMENTS:
+        stale, segments = segments, [_merge_segments(segments)]
+    
+    _save_lexicon({
+        'watermark': watermark, 'recent': recent, 'modified': modified, 'segments': segments, 'terms': terms,
+        'doc_freq': doc_freq, 'star_sum': star_sum,
+    })
+    for name in stale:
+        shutil.rmtree(os.path.join(_index_dir(), name), ignore_errors=True)
+    return indexed
+
+
+def _merge_segments(names):
+    opened = [_open_segment(name) for name in names]
+    return _write_segment({
+        column: np.concatenate([segment[column] for segment in opened])
+        for column in ('term_ids', 'rating_ids', 'clothing_ids', 'stars')
+    })
+
+
+def _postings(lexicon, term_id):
+    """在各段中二分查找某个词的倒排列表，返回 (rating_ids, clothing_ids)"""
+    rating_ids, clothing_ids = [], []
+    for name in lexicon['segments']:
+        segment = _open_segment(name)
+        start, end = np.searchsorted(segment['term_ids'], [term_id, term_id + 1])
+        rating_ids.append(segment['rating_ids'][start:end])
+        clothing_ids.append(segment['clothing_ids'][start:end])
+    if not rating_ids:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(rating_ids), np.concatenate(clothing_ids)
+
+
+def _keyword_row(term, count, stars):
+    return {
+        'keyword': term,
+        'rating_count': int(count),
+        'avg_rating': round(float(stars) / count, 2) if count else 0,
+    }
+
+
+def keyword_frequency(clothing_id=None, limit=20):
+    """返回出现评价数最多的关键词及其平均评分；指定商品时只统计该商品的评价"""
+    lexicon = load_lexicon()
+    n_terms = len(lexicon['terms'])
+    if clothing_id is None:
+        counts = np.array(lexicon['doc_freq'], dtype=np.int64)
+        stars = np.array(lexicon['star_sum'], dtype=np.int64)
+    else:
+        counts = np.zeros(n_terms, dtype=np.int64)
+        stars = np.zeros(n_terms, dtype=np.int64)
+        for name in lexicon['segments']:
+            segment = _open_segment(name)
+            mask = segment['clothing_ids'] == clothing_id
+            term_ids = segment['term_ids'][mask]
+            counts += np.bincount(term_ids, minlength=n_terms)
+            stars += np.bincount(term_ids, weights=segment['stars'][mask], minlength=n_terms).astype(np.int64)
+    
+    if not n_terms:
+        return []
+    top = np.lexsort((np.arange(n_terms), -counts))[:limit]
+    return [
+        _keyword_row(lexicon['terms'][i], counts[i], stars[i])
+        for i in top if counts[i] > 0
+    ]
+
+
+def search_ratings(query, clothing_id=None):
+    """返回同时包含查询中全部关键词的评价ID（降序），可限定商品"""
+    lexicon = load_lexicon()
+    matched = None
+    for token in tokenize(query):
+        term_id = lexicon['term_ids'].get(token)
+        if term_id is None:
+            return []
+        rating_ids, clothing_ids = _postings(lexicon, term_id)
+        if clothing_id is not None:
+            rating_ids = rating_ids[clothing_ids == clothing_id]
+        matched = rating_ids if matched is None else np.intersect1d(matched, rating_ids)
+    if matched is None:
+        return []
+    return np.unique(matched)[::-1].tolist()
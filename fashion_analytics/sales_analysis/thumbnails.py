@@ -0,0 +1,203 @@
+"""
+商品图片缩略图。
+
+Clothing.image 上传并提交后，图片交给后台线程池处理：按 THUMBNAIL_SIZES 的最长边等比缩小，每个尺寸
+输出 THUMBNAIL_FORMATS 中的各种格式，保存到 thumbnails/<哈希前两位>/<图片内容的 SHA-256>/<像素>.<扩展名>。
+路径由图片内容决定，内容相同的图片只生成一次，文件写入后不再变化，可由 Web 服务器按长期缓存返回。
+生成完成后把哈希写入 Clothing.thumbnail_hash，ThumbnailField 据此给出各变体的 URL，尚未生成时为 null。
+已有商品由 regenerate_thumbnails 命令并行批量生成。
+"""
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+from .models import Clothing
+
+logger = logging.getLogger(__name__)
+
+# 输出格式：(Pillow 格式名, 扩展名)
+FORMATS = {'webp': ('WEBP', 'webp'), 'jpeg': ('JPEG', 'jpg')}
+
+_executor = None
+_executor_lock = threading.Lock()
+# 同一内容的缩略图同时只由一个线程写入，按哈希分段加锁
+_write_locks = [threading.Lock() for _ in range(64)]
+
+
+def image_storage():
+    return Clothing._meta.get_field('image').storage
+
+
+def variant_name(digest, width, fmt):
+    """缩略图在存储中的路径"""
+    return f'thumbnails/{digest[:2]}/{digest}/{width}.{FORMATS[fmt][1]}'
+
+
+def _load(data):
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    transparent = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    return image.convert('RGBA' if transparent else 'RGB')
+
+
+def _encode(image, width, fmt):
+    variant = image.copy()
+    # 只缩小不放大
+    variant.thumbnail((width, width), Image.LANCZOS)
+    if fmt == 'jpeg' and variant.mode == 'RGBA':
+        # JPEG 不支持透明通道，铺在白色背景上
+        background = Image.new('RGB', variant.size, 'white')
+        background.paste(variant, mask=variant.getchannel('A'))
+        variant = background
+    buffer = io.BytesIO()
+    variant.save(buffer, FORMATS[fmt][0], quality=settings.THUMBNAIL_QUALITY)
+    return buffer.getvalue()
+
+
+def generate_thumbnails(name, force=False, regenerated=None):
+    """
+    为存储中的一张图片生成全部缩略图，已存在的变体跳过，返回图片内容的哈希。
+    force 时重新生成已存在的变体，regenerated 为本次已重新生成的哈希集合，同一内容只重新生成一次
+    """
+    storage = image_storage()
+    with storage.open(name, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    with _write_locks[int(digest[:8], 16) % len(_write_locks)]:
+        if force and regenerated is not None:
+            if digest in regenerated:
+                force = False
+            regenerated.add(digest)
+        pending = [
+            (width, fmt)
+            for width in settings.THUMBNAIL_SIZES.values()
+            for fmt in settings.THUMBNAIL_FORMATS
+            if force or not storage.exists(variant_name(digest, width, fmt))
+        ]
+        if not pending:
+            return digest
+        
+        image = _load(data)
+        for width, fmt in pending:
+            path = variant_name(digest, width, fmt)
+            if storage.exists(path):
+                storage.delete(path)
+            storage.save(path, ContentFile(_encode(image, width, fmt)))
+    return digest
+
+
+def record_thumbnails(pk, name, digest):
+    """写入缩略图哈希；生成期间图片又被替换时不写入，由新图片的任务负责"""
+    return Clothing.objects.filter(pk=pk, image=name).update(thumbnail_hash=digest)
+
+
+def _process(pk, name):
+    try:
+        record_thumbnails(pk, name, generate_thumbnails(name))
+    except Exception:
+        logger.exception('生成商品 %s 的缩略图失败: %s', pk, name)
+
+
+def _run_in_background(pk, name):
+    try:
+        _process(pk, name)
+    finally:
+        # 线程池中的数据库连接不会在请求结束时关闭
+        connections.close_all()
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS, thread_name_prefix='thumbnails'
+            )
+        return _executor
+
+
+def schedule_thumbnails(clothing):
+    """事务提交后为商品图片生成缩略图：THUMBNAIL_WORKERS 大于0时交给后台线程池，否则同步生成"""
+    pk, name = clothing.pk, clothing.image.name
+    
+    def submit():
+        if settings.THUMBNAIL_WORKERS:
+            _pool().submit(_run_in_background, pk, name)
+        else:
+            _process(pk, name)
+    
+    transaction.on_commit(submit)
+
+
+def _try_generate(name, force, regenerated):
+    try:
+        return generate_thumbnails(name, force, regenerated), None
+    except Exception as exc:
+        return None, exc
+
+
+def regenerate_thumbnails(workers=None, everything=False, force=False, batch_size=500):
+    """
+    按主键分批为已有商品并行生成缩略图，默认只处理尚未生成的商品，everything 时处理全部有图片的商品
+    （补齐新增尺寸或格式），force 时重新生成已存在的变体。每批完成后产出 (本批商品数, [(商品ID, 图片, 异常)])
+    """
+    queryset = Clothing.objects.exclude(image='').exclude(image__isnull=True)
+    if not (everything or force):
+        queryset = queryset.filter(thumbnail_hash='')
+    last, regenerated = 0, set()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnails') as pool:
+        while True:
+            rows = list(queryset.filter(pk__gt=last).order_by('pk').values_list('pk', 'image')[:batch_size])
+            if not rows:
+                return
+            last = rows[-1][0]
+            # 图片解码、缩放与编码时 Pillow 会释放 GIL，线程可以并行；多个商品共用的图片只处理一次
+            names = list(dict.fromkeys(name for _, name in rows))
+            results = dict(zip(names, pool.map(lambda name: _try_generate(name, force, regenerated), names)))
+            failed = []
+            with transaction.atomic():
+                for pk, name in rows:
+                    digest, error = results[name]
+                    if error is None:
+                        record_thumbnails(pk, name, digest)
+                    else:
+                        failed.append((pk, name, error))
+            yield len(rows), failed
+
+
+@receiver(post_save, sender=Clothing, dispatch_uid='clothing_thumbnails')
+def clothing_saved(sender, instance, using, raw=False, **kwargs):
+    # 分片上的参照表副本不生成缩略图
+    if raw or using != DEFAULT_DB_ALIAS:
+        return
+    if instance.image and not instance.thumbnail_hash:
+        schedule_thumbnails(instance)
+
+
+class ThumbnailField(serializers.ReadOnlyField):
+    """
+    按缩略图哈希给出各变体 URL 的只读字段，用法：ThumbnailField(source='thumbnail_hash')。
+    输出 {"small": {"webp": URL, "jpeg": URL}, ...}，缩略图尚未生成时为 null。
+    """
+    
+    def to_representation(self, digest):
+        if not digest:
+            return None
+        storage = image_storage()
+        request = self.context.get('request')
+        result = {}
+        for size, width in settings.THUMBNAIL_SIZES.items():
+            urls = result[size] = {}
+            for fmt in settings.THUMBNAIL_FORMATS:
+                url = storage.url(variant_name(digest, width, fmt))
+                urls[fmt] = request.build_absolute_uri(url) if request is not None else url
+        return result
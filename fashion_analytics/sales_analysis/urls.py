@@ -26,8 +26,16 @@ urlpatterns = [
     path('analysis/clothing-type-sales/', views.ClothingTypeSalesAnalysisView.as_view(), name='clothing-type-sales'),
     path('analysis/price-range-sales/', views.PriceRangeSalesAnalysisView.as_view(), name='price-range-sales'),
     path('analysis/rating-distribution/', views.RatingDistributionView.as_view(), name='rating-distribution'),
+    path('analysis/bought-together/<int:clothing_id>/', views.BoughtTogetherView.as_view(), name='bought-together'),
+    path('analysis/rfm/', views.RFMAnalysisView.as_view(), name='rfm'),
+    path('analysis/cohorts/', views.CohortRetentionView.as_view(), name='cohorts'),
+    path('analysis/rating-keywords/', views.RatingKeywordView.as_view(), name='rating-keywords'),
+    path('analysis/anomalies/', views.SalesAnomalyView.as_view(), name='anomalies'),
+    path('analysis/live/', views.live_sales_feed, name='live-sales'),
+    path('analysis/outbox-lag/', views.OutboxLagView.as_view(), name='outbox-lag'),
     
     # 预测分析路由
     path('forecast/sales/', views.SalesForecastView.as_view(), name='sales-forecast'),
     path('forecast/price/', views.PriceForecastView.as_view(), name='price-forecast'),
+    path('forecast/stockouts/', views.StockoutForecastView.as_view(), name='stockout-forecast'),
 ] 
\ No newline at end of file
@@ -0,0 +1,123 @@
+"""
+数据表版本号。
+
+每张分析依赖的表在默认库的 TableVersion 中有一个版本号，表中数据的任何写入（单条保存、删除、
+QuerySet.update / delete、bulk_create / bulk_update）都会在事务提交后把版本号加1，
+分析接口的 ETag 与响应缓存键由版本号计算，数据被修改或删除后不再返回旧结果。
+绕过 ORM 的写入（原生 SQL、LOAD DATA、DROP PARTITION）需自行调用 bump_versions。
+
+修改或删除已有行（不含新增）时另外增加 "<app_label.Model>:modified" 的版本号，只追加新行的增量处理
+（列式快照、DuckDB 的 Parquet 导出）据此判断已导出的数据是否仍然有效。
+
+版本号在提交后才增加：提交与增加之间读到的旧版本号只会对应较新的数据，不会把旧数据缓存到新版本号下。
+同一事务中的多次写入合并为一次增加，通常是事务之外的一条 UPDATE；分片的事务先于默认库中仍未结束的事务提交时
+（如 sales_atomic），增加推迟到默认库的事务提交之后，版本行的行锁不会被写入方的事务持有。
+"""
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+MODIFIED_SUFFIX = ':modified'
+
+
+def _labels(models):
+    return {model if isinstance(model, str) else model._meta.label for model in models}
+
+
+def modified_label(model):
+    """记录表中已有行被修改或删除的版本号标签"""
+    return (model if isinstance(model, str) else model._meta.label) + MODIFIED_SUFFIX
+
+
+def _increment(labels):
+    from .models import TableVersion
+    
+    labels = sorted(labels)
+    now = timezone.now()
+    versions = TableVersion.objects.using(DEFAULT_DB_ALIAS)
+    # 各表的版本行通常都已存在，一条 UPDATE 完成
+    if versions.filter(label__in=labels).update(version=F('version') + 1, updated_at=now) < len(labels):
+        # 首次写入的表建行，版本号直接为 1；并发建行时忽略冲突，对方建行同样使版本号离开 0
+        existing = set(versions.filter(label__in=labels).values_list('label', flat=True))
+        versions.bulk_create([
+            TableVersion(label=label, version=1, updated_at=now) for label in labels if label not in existing
+        ], ignore_conflicts=True)
+
+
+class _Bump:
+    """
+    提交后增加版本号的回调，同一保存点内的多次写入合并到一个回调。内层保存点的回调挂在外层仍未执行的回调下，
+    提交后由外层回调连同内层的标签一次增加（内层保存点回滚时其中的标签仍会增加，只多一次无害的缓存失效）
+    """
+    
+    def __init__(self, labels, using, parent=None):
+        self.labels = set(labels)
+        self.using = using
+        self.parent = parent
+        self.children = []
+        self.done = False
+        if parent is not None:
+            parent.children.append(self)
+    
+    def _all_labels(self):
+        return self.labels.union(*(child._all_labels() for child in self.children))
+    
+    def __call__(self):
+        self.done = True
+        if self.parent is not None and self.parent.done:
+            # 已由外层保存点的回调一并增加
+            return
+        labels = self._all_labels()
+        if self.using != DEFAULT_DB_ALIAS and connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # 分片先于默认库的事务提交：版本行的更新不加入默认库仍未结束的事务，与其中的写入一起在提交后执行
+            bump_versions(*labels)
+            return
+        _increment(labels)
+
+
+def bump_versions(*models, using=DEFAULT_DB_ALIAS, modified=False):
+    """
+    在数据库 using 的当前事务提交后增加这些表（模型或 app_label.Model）的版本号，不在事务中时立即增加。
+    modified 表示写入修改或删除了已有行
+    """
+    labels = _labels(models)
+    if modified:
+        labels |= {modified_label(label) for label in labels}
+    if not labels:
+        return
+    connection = connections[using]
+    if not connection.in_atomic_block:
+        _Bump(labels, using)()
+        return
+    
+    # 当前保存点或外层保存点中最近注册、尚未执行的回调；它被丢弃时本次写入也一定被回滚
+    current = set(connection.savepoint_ids)
+    savepoints, parent = next((
+        (savepoints, callback) for savepoints, callback, *_ in reversed(connection.run_on_commit)
+        if isinstance(callback, _Bump) and not callback.done and savepoints <= current
+    ), (None, None))
+    if savepoints == current:
+        parent.labels.update(labels)
+        return
+    transaction.on_commit(_Bump(labels, using, parent), using=using)
+
+
+def table_versions(models):
+    """返回 {app_label.Model: (版本号, 最近写入时间)}，尚未写入过的表为 (0, None)"""
+    from .models import TableVersion
+    
+    labels = _labels(models)
+    versions = {
+        label: (version, updated_at)
+        for label, version, updated_at in TableVersion.objects.using(DEFAULT_DB_ALIAS).filter(
+            label__in=labels
+        ).values_list('label', 'version', 'updated_at')
+    }
+    return {label: versions.get(label, (0, None)) for label in labels}
+
+
+def modified_version(model):
+    """表中已有行被修改或删除的版本号"""
+    label = modified_label(model)
+    return table_versions([label])[label][0]
@@ -1,6 +1,9 @@
-from django.shortcuts import render
-from django.db.models import Sum, Count, Avg, F
+from django.shortcuts import render, get_object_or_404
+from django.http import JsonResponse, StreamingHttpResponse
+from django.db.models import Sum, Count, Avg
 from django.contrib.auth import authenticate, login, logout
+from django.utils import timezone
+from django.conf import settings
 from rest_framework import viewsets, permissions, status, generics
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -16,7 +19,9 @@ import random
 
 from .models import (
     Region, ClothingType, PriceRange, RatingCategory, 
-    Clothing, SalesOrder, OrderItem, Rating
+    Clothing, SalesOrder, OrderItem, Rating, SalesAnomaly, SalesVelocity,
+    ItemAssociation, AnalyticsSnapshot, ArchivedSalesOrder, ArchivedOrderItem,
+    SalesOrderSample, OrderItemSample, CustomerSketch
 )
 from .serializers import (
     UserSerializer, RegionSerializer, ClothingTypeSerializer,
@@ -24,8 +29,33 @@ from .serializers import (
     SalesOrderSerializer, OrderItemSerializer, RatingSerializer,
     RegionSalesSerializer, ClothingTypeSalesSerializer,
     PriceRangeSalesSerializer, RatingDistributionSerializer,
-    SalesForecastSerializer, PriceForecastSerializer
+    SalesForecastSerializer, PriceForecastSerializer, StockoutForecastSerializer,
+    BoughtTogetherSerializer, RFMSegmentSerializer, CustomerRFMSerializer,
+    CohortRetentionSerializer, RatingKeywordSerializer, SalesAnomalySerializer,
+    OutboxLagSerializer, ApproxRegionSalesSerializer, ApproxClothingTypeSalesSerializer,
+    ApproxPriceRangeSalesSerializer
 )
+from .inventory import stockout_forecast
+from .basket import bought_together, state_version
+from .customers import customer_snapshot, RFM_SNAPSHOT, COHORT_SNAPSHOT
+from .text_index import keyword_frequency, search_ratings, index_version
+from .filters import date_window, window_filter, is_true
+from .archive import archived_sales_by, merge_archived_rows, archive_version
+from .caching import conditional, data_watermark
+from .encoding import chart_response
+from .fast_serializers import FastListMixin
+from .sparse_fields import SparseQuerysetMixin
+from .catalog import CatalogSearchMixin
+from .pagination import PageSizePagination
+from .live import authenticate_token, sales_event_stream
+from .sampling import sample_rate, approx_region_sales, approx_clothing_type_sales, approx_price_range_sales
+from .outbox import outbox_lag
+from .dimensions import dimension_names, dimension_rows
+from .money import Cents
+from .snapshot import snapshot_sales_by_date
+from . import duckdb_backend
+from .duckdb_backend import analytics_backend
+from .sharding import scatter, merge_partials
 
 # Create your views here.
 
@@ -72,185 +102,468 @@ class LogoutView(APIView):
         return Response({'message': '成功登出'}, status=status.HTTP_200_OK)
 
 # 基础数据视图集
-class RegionViewSet(viewsets.ModelViewSet):
+# 商品与订单的列表接口数据量大，使用 FastListMixin 由 .values() 行直接构建输出；
+# 各视图集支持 fields / exclude 参数只返回需要的字段，并按字段裁剪查询（见 sparse_fields.py）
+# 商品列表另支持按类型、价格区间、价格、库存筛选，全文搜索与分面计数（见 catalog.py）
+class RegionViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     queryset = Region.objects.all()
     serializer_class = RegionSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class ClothingTypeViewSet(viewsets.ModelViewSet):
+class ClothingTypeViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     queryset = ClothingType.objects.all()
     serializer_class = ClothingTypeSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class PriceRangeViewSet(viewsets.ModelViewSet):
+class PriceRangeViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     queryset = PriceRange.objects.all()
     serializer_class = PriceRangeSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class RatingCategoryViewSet(viewsets.ModelViewSet):
+class RatingCategoryViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     queryset = RatingCategory.objects.all()
     serializer_class = RatingCategorySerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class ClothingViewSet(viewsets.ModelViewSet):
-    queryset = Clothing.objects.all()
+class ClothingViewSet(CatalogSearchMixin, SparseQuerysetMixin, FastListMixin, viewsets.ModelViewSet):
+    queryset = Clothing.objects.order_by('id')
     serializer_class = ClothingSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class SalesOrderViewSet(viewsets.ModelViewSet):
-    queryset = SalesOrder.objects.all()
+class SalesOrderViewSet(SparseQuerysetMixin, FastListMixin, viewsets.ModelViewSet):
+    queryset = SalesOrder.objects.order_by('id')
     serializer_class = SalesOrderSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class OrderItemViewSet(viewsets.ModelViewSet):
-    queryset = OrderItem.objects.all()
+class OrderItemViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
+    queryset = OrderItem.objects.order_by('id')
     serializer_class = OrderItemSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class RatingViewSet(viewsets.ModelViewSet):
-    queryset = Rating.objects.all()
+class RatingViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
+    queryset = Rating.objects.order_by('id')
     serializer_class = RatingSerializer
     permission_classes = [permissions.IsAuthenticated]
 
 # 数据分析视图
+# 分析接口均支持 start_date / end_date（YYYY-MM-DD）限定时间范围，
+# 销售类接口带 include_archive=1 时合并已归档为 Parquet 的历史数据。
+# 分析与预测接口按相关表的数据水位返回 ETag / Last-Modified，数据未变化时返回 304；
+# 图表接口带 layout=columnar 时返回列式数据
+
+def _archive_version(request):
+    """带 include_archive 时归档表与归档文件的变化也会影响结果"""
+    if not is_true(request.query_params.get('include_archive')):
+        return ()
+    return [archive_version(), data_watermark((ArchivedSalesOrder, ArchivedOrderItem))[0]]
+
+def _sales_version(request):
+    """销售分析的额外水位：归档数据，以及 approx=1 时的抽样比例"""
+    version = list(_archive_version(request))
+    if is_true(request.query_params.get('approx')):
+        version.append(sample_rate())
+    return version
+
+def _approx_requested(request):
+    """approx=1 时改用抽样表与草图估计；样本不含归档数据"""
+    approx = is_true(request.query_params.get('approx'))
+    if approx and is_true(request.query_params.get('include_archive')):
+        raise ValueError('approx不能与include_archive同时使用')
+    return approx
+
+def _add_percentages(result):
+    """按销售额计算各项占比"""
+    total_sales_amount = sum(float(item['total_sales'] or 0) for item in result)
+    for item in result:
+        percentage = 0
+        if total_sales_amount > 0:
+            percentage = float(item['total_sales']) / total_sales_amount * 100
+        item['percentage'] = round(percentage, 2)
+    return result
+
+def _scatter_sales(model, group_by, amount, start, end):
+    """在保存订单的各数据库上并发按 group_by 汇总销售额与数量，合并各分片的部分和（未分片时只查询默认库）"""
+    def query(alias):
+        return list(model.objects.using(alias).filter(
+            **window_filter('order_date', start, end)
+        ).values(
+            group_by
+        ).annotate(
+            total_sales=Sum(amount),
+            order_count=Count('id')
+        ).order_by())
+    return merge_partials(scatter(query), group_by, ('total_sales', 'order_count'))
+
+def _by_sales_desc(rows):
+    """按销售额降序，销售额为空的排在最后"""
+    return sorted(rows, key=lambda item: (item['total_sales'] is None, -(item['total_sales'] or 0)))
+
+def _today(request):
+    """结果与当天日期有关的接口，跨天后重新计算"""
+    return [timezone.localdate().isoformat()]
+
 class RegionSalesAnalysisView(APIView):
     """各地区销售数据柱状图"""
     permission_classes = [IsAuthenticated]
+    cost_by_window = True
     
+    @conditional(
+        SalesOrder, Region, extra=_sales_version,
+        approx_models=(SalesOrderSample, CustomerSketch, Region)
+    )
     def get(self, request):
-        # 聚合各地区的销售数据
-        region_sales = SalesOrder.objects.values(
-            'region__name'
-        ).annotate(
-            total_sales=Sum('total_amount'),
-            order_count=Count('id')
-        ).order_by('-total_sales')
+        try:
+            start, end = date_window(request.query_params)
+            approx = _approx_requested(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        # 序列化结果
+        if approx:
+            return chart_response(request, approx_region_sales(start, end), ApproxRegionSalesSerializer)
+        
+        # 聚合各地区的销售数据（限定时间范围时 MySQL 只扫描相应分区），按地区ID分组不关联地区表，
+        # 按地区分片时各分片并发聚合后合并
+        region_sales = None
+        if analytics_backend('region-sales') == 'duckdb':
+            region_sales = duckdb_backend.region_sales(start, end)
+        if region_sales is None:
+            region_sales = _by_sales_desc(_scatter_sales(SalesOrder, 'region_id', 'total_amount', start, end))
+        
+        # 序列化结果，地区名称从维度缓存解析
+        region_names = dimension_names(Region)
         result = []
         for item in region_sales:
             result.append({
-                'region_name': item['region__name'],
+                'region_name': region_names.get(item['region_id']),
                 'total_sales': item['total_sales'],
                 'order_count': item['order_count']
             })
         
-        serializer = RegionSalesSerializer(result, many=True)
-        return Response(serializer.data)
+        if is_true(request.query_params.get('include_archive')):
+            result = merge_archived_rows(result, 'region_name', archived_sales_by('region', start, end))
+            result.sort(key=lambda item: -float(item['total_sales']))
+        
+        return chart_response(request, result, RegionSalesSerializer)
 
 class ClothingTypeSalesAnalysisView(APIView):
     """服装销售类型占比饼图"""
     permission_classes = [IsAuthenticated]
+    cost_by_window = True
     
+    @conditional(
+        OrderItem, Clothing, ClothingType, extra=_sales_version,
+        approx_models=(OrderItemSample, CustomerSketch, ClothingType)
+    )
     def get(self, request):
-        # 通过订单条目获取各类型服装的销售数据
-        type_sales = OrderItem.objects.values(
-            'clothing__clothing_type__name'
-        ).annotate(
-            total_sales=Sum(F('price') * F('quantity')),
-            order_count=Count('id')
-        ).order_by('-total_sales')
+        try:
+            start, end = date_window(request.query_params)
+            approx = _approx_requested(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        # 计算总销售额用于计算占比
-        total_sales_amount = OrderItem.objects.aggregate(
-            total=Sum(F('price') * F('quantity'))
-        )['total'] or 0
+        if approx:
+            result = _add_percentages(approx_clothing_type_sales(start, end))
+            return chart_response(request, result, ApproxClothingTypeSalesSerializer)
+        
+        # 通过订单条目获取各类型服装的销售数据：条目上冗余了订单日期、服装类型与条目金额，
+        # 聚合只扫描 orderitem_type_cover 覆盖索引，不关联订单、商品表
+        type_sales = None
+        if analytics_backend('clothing-type-sales') == 'duckdb':
+            type_sales = duckdb_backend.clothing_type_sales(start, end)
+        if type_sales is None:
+            type_sales = _by_sales_desc(_scatter_sales(OrderItem, 'clothing_type_id', 'line_total', start, end))
+        type_names = dimension_names(ClothingType)
         
-        # 序列化结果
         result = []
         for item in type_sales:
-            percentage = 0
-            if total_sales_amount > 0:
-                percentage = float(item['total_sales']) / float(total_sales_amount) * 100
-                
             result.append({
-                'clothing_type_name': item['clothing__clothing_type__name'],
+                'clothing_type_name': type_names.get(item['clothing_type_id']),
                 'total_sales': item['total_sales'],
-                'order_count': item['order_count'],
-                'percentage': round(percentage, 2)
+                'order_count': item['order_count']
             })
         
-        serializer = ClothingTypeSalesSerializer(result, many=True)
-        return Response(serializer.data)
+        if is_true(request.query_params.get('include_archive')):
+            result = merge_archived_rows(
+                result, 'clothing_type_name', archived_sales_by('clothing_type', start, end)
+            )
+            result.sort(key=lambda item: -float(item['total_sales']))
+        
+        # 按总销售额计算各类型占比
+        return chart_response(request, _add_percentages(result), ClothingTypeSalesSerializer)
 
 class PriceRangeSalesAnalysisView(APIView):
     """服装价格区间销量折线图"""
     permission_classes = [IsAuthenticated]
+    cost_by_window = True
     
+    @conditional(
+        OrderItem, Clothing, PriceRange, extra=_sales_version,
+        approx_models=(OrderItemSample, PriceRange)
+    )
     def get(self, request):
-        # 通过订单条目获取各价格区间的销售数据
-        price_range_sales = OrderItem.objects.values(
-            'clothing__price_range__name'
-        ).annotate(
-            total_sales=Sum(F('price') * F('quantity')),
-            order_count=Count('id')
-        ).order_by('clothing__price_range__min_price')
+        try:
+            start, end = date_window(request.query_params)
+            approx = _approx_requested(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        # 序列化结果
+        if approx:
+            return chart_response(request, approx_price_range_sales(start, end), ApproxPriceRangeSalesSerializer)
+        
+        # 通过订单条目获取各价格区间的销售数据（只扫描 orderitem_range_cover 覆盖索引）
+        range_rows = None
+        if analytics_backend('price-range-sales') == 'duckdb':
+            range_rows = duckdb_backend.price_range_sales(start, end)
+        if range_rows is None:
+            range_rows = _scatter_sales(OrderItem, 'price_range_id', 'line_total', start, end)
+        price_range_sales = {item['price_range_id']: item for item in range_rows}
+        
+        # 按价格区间从低到高输出，跳过没有价格区间的商品
         result = []
-        for item in price_range_sales:
-            if item['clothing__price_range__name']:  # 确保价格区间不为空
+        for price_range in dimension_rows(PriceRange):
+            item = price_range_sales.get(price_range['id'])
+            if item:
                 result.append({
-                    'price_range_name': item['clothing__price_range__name'],
+                    'price_range_name': price_range['name'],
                     'total_sales': item['total_sales'],
                     'order_count': item['order_count']
                 })
         
-        serializer = PriceRangeSalesSerializer(result, many=True)
-        return Response(serializer.data)
+        if is_true(request.query_params.get('include_archive')):
+            result = merge_archived_rows(
+                result, 'price_range_name', archived_sales_by('price_range', start, end)
+            )
+            positions = {
+                price_range['name']: i for i, price_range in enumerate(dimension_rows(PriceRange))
+            }
+            result.sort(key=lambda item: positions.get(item['price_range_name'], len(positions)))
+        
+        return chart_response(request, result, PriceRangeSalesSerializer)
 
 class RatingDistributionView(APIView):
     """服装评价饼图"""
     permission_classes = [IsAuthenticated]
+    cost_by_window = True
     
+    @conditional(Rating, RatingCategory)
     def get(self, request):
-        # 获取各评价类别的分布
-        rating_distribution = Rating.objects.values(
-            'category__name'
-        ).annotate(
-            rating_count=Count('id')
-        ).order_by('-rating_count')
+        try:
+            start, end = date_window(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        # 计算评价总数用于计算占比
-        total_ratings = Rating.objects.count()
+        # 获取各评价类别的分布，按类别ID分组，名称从维度缓存解析
+        rating_distribution = None
+        if analytics_backend('rating-distribution') == 'duckdb':
+            rating_distribution = duckdb_backend.rating_distribution(start, end)
+        if rating_distribution is not None:
+            total_ratings = sum(item['rating_count'] for item in rating_distribution)
+        else:
+            ratings = Rating.objects.filter(**window_filter('created_at', start, end))
+            rating_distribution = ratings.values(
+                'category_id'
+            ).annotate(
+                rating_count=Count('id')
+            ).order_by('-rating_count')
+            # 计算评价总数用于计算占比
+            total_ratings = ratings.count()
+        category_names = dimension_names(RatingCategory)
         
         # 序列化结果
         result = []
         for item in rating_distribution:
-            if item['category__name']:  # 确保评价类别不为空
+            category_name = category_names.get(item['category_id'])
+            if category_name:  # 确保评价类别不为空
                 percentage = 0
                 if total_ratings > 0:
                     percentage = float(item['rating_count']) / float(total_ratings) * 100
                     
                 result.append({
-                    'rating_category': item['category__name'],
+                    'rating_category': category_name,
                     'rating_count': item['rating_count'],
                     'percentage': round(percentage, 2)
                 })
         
-        serializer = RatingDistributionSerializer(result, many=True)
+        return chart_response(request, result, RatingDistributionSerializer)
+
+class BoughtTogetherView(APIView):
+    """经常一起购买的商品"""
+    permission_classes = [IsAuthenticated]
+    
+    @conditional(ItemAssociation, Clothing, extra=lambda request: [state_version()])
+    def get(self, request, clothing_id):
+        clothing = get_object_or_404(Clothing, pk=clothing_id)
+        
+        # 关联商品由 mine_baskets 命令离线挖掘
+        result = bought_together(clothing.id)
+        
+        serializer = BoughtTogetherSerializer(result, many=True)
+        return Response(serializer.data)
+
+def _snapshot_missing():
+    return Response(
+        {'error': '客户分析尚未生成，请先执行 refresh_customer_analytics'}, status=status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+
+class RFMAnalysisView(APIView):
+    """客户RFM分层"""
+    permission_classes = [IsAuthenticated]
+    
+    @conditional(AnalyticsSnapshot)
+    def get(self, request):
+        # 读取 refresh_customer_analytics 生成的快照
+        snapshot = customer_snapshot(RFM_SNAPSHOT)
+        if snapshot is None:
+            return _snapshot_missing()
+        customers = snapshot['customers']
+        
+        segment = request.query_params.get('segment')
+        if segment:
+            customers = [item for item in customers if item['segment'] == segment]
+        
+        # 客户列表按 page / page_size 分页，分层汇总不分页
+        paginator = PageSizePagination()
+        page = paginator.paginate_queryset(customers, request, view=self)
+        return Response({
+            'as_of': snapshot['as_of'],
+            'segments': RFMSegmentSerializer(snapshot['segments'], many=True).data,
+            'count': paginator.page.paginator.count,
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+            'customers': CustomerRFMSerializer(page, many=True).data
+        })
+
+class CohortRetentionView(APIView):
+    """按月获客同期群留存"""
+    permission_classes = [IsAuthenticated]
+    
+    @conditional(AnalyticsSnapshot)
+    def get(self, request):
+        snapshot = customer_snapshot(COHORT_SNAPSHOT)
+        if snapshot is None:
+            return _snapshot_missing()
+        
+        return Response({
+            'as_of': snapshot['as_of'],
+            'cohorts': CohortRetentionSerializer(snapshot['cohorts'], many=True).data
+        })
+
+class RatingKeywordView(APIView):
+    """评价关键词统计与检索"""
+    permission_classes = [IsAuthenticated]
+    
+    @conditional(Rating, extra=lambda request: [index_version()])
+    def get(self, request):
+        try:
+            clothing_id = request.query_params.get('clothing_id')
+            clothing_id = int(clothing_id) if clothing_id else None
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            return Response({'error': 'clothing_id和limit参数必须为整数'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(limit, 0)
+        
+        # 关键词频次直接来自 index_ratings 命令维护的倒排索引
+        keywords = keyword_frequency(clothing_id, limit)
+        
+        # 按关键词检索评价：倒排索引给出评价ID，再按主键取出
+        query = request.query_params.get('q', '').strip()
+        rating_ids = search_ratings(query, clothing_id) if query else []
+        ratings = Rating.objects.filter(pk__in=rating_ids[:limit]).select_related(
+            'user', 'clothing'
+        ).order_by('-id')
+        
+        return Response({
+            'keywords': RatingKeywordSerializer(keywords, many=True).data,
+            'total': len(rating_ids),
+            'ratings': RatingSerializer(ratings, many=True).data
+        })
+
+class SalesAnomalyView(APIView):
+    """地区×服装类型日销售异常"""
+    permission_classes = [IsAuthenticated]
+    
+    @conditional(SalesAnomaly, Region, ClothingType, extra=_today)
+    def get(self, request):
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            return Response({'error': 'days参数必须为整数'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # 异常在订单写入和每日 detect_sales_anomalies 时流式检测，这里只做查询
+        since = timezone.localdate() - timedelta(days=days)
+        anomalies = SalesAnomaly.objects.filter(day__gte=since)
+        
+        for name in ('region', 'clothing_type'):
+            value = request.query_params.get(name)
+            if not value:
+                continue
+            try:
+                anomalies = anomalies.filter(**{f'{name}_id': int(value)})
+            except ValueError:
+                return Response({'error': f'{name}参数必须为整数'}, status=status.HTTP_400_BAD_REQUEST)
+        direction = request.query_params.get('direction')
+        if direction:
+            anomalies = anomalies.filter(direction=direction)
+        
+        serializer = SalesAnomalySerializer(anomalies, many=True)
+        return Response(serializer.data)
+
+async def live_sales_feed(request):
+    """实时销售增量（Server-Sent Events），EventSource 无法设置请求头，access token 通过 token 参数传递"""
+    user = await authenticate_token(request.GET.get('token'))
+    if user is None:
+        return JsonResponse({'error': '身份认证失败'}, status=401)
+    
+    response = StreamingHttpResponse(sales_event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # 禁止 Nginx 等反向代理缓冲事件流
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+class OutboxLagView(APIView):
+    """订单事件发件箱的积压情况"""
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        result = outbox_lag()
+        result['mode'] = settings.ORDER_EVENTS_MODE
+        serializer = OutboxLagSerializer(result)
         return Response(serializer.data)
 
 # 预测分析视图
 class SalesForecastView(APIView):
     """销量预测"""
     permission_classes = [IsAuthenticated]
+    # 准入控制的成本：全表聚合并拟合回归模型
+    cost = 20
     
+    @conditional(SalesOrder)
     def get(self, request):
-        # 获取历史销售数据
-        sales_data = SalesOrder.objects.values('order_date').annotate(
-            daily_sales=Sum('total_amount')
-        ).order_by('order_date')
+        # 获取历史销售数据：ANALYTICS_BACKENDS 选择 DuckDB 时在 Parquet 分片上汇总，有列式快照时
+        # 在各进程共享的内存映射上汇总，否则由数据库按整数分汇总（避免逐行构造 Decimal）
+        df = None
+        if analytics_backend('sales-forecast') == 'duckdb':
+            df = duckdb_backend.sales_by_date()
+        if df is None:
+            df = snapshot_sales_by_date()
+        if df is None:
+            # 按地区分片时同一时间的订单可能分布在多个分片，合并后再排序
+            rows = merge_partials(scatter(lambda alias: list(
+                SalesOrder.objects.using(alias).values('order_date').annotate(
+                    daily_cents=Sum(Cents('total_amount'))
+                ).order_by()
+            )), 'order_date', ('daily_cents',))
+            df = pd.DataFrame(sorted(rows, key=lambda item: item['order_date']))
         
         # 如果数据不足，返回错误
-        if len(sales_data) < 30:
+        if len(df) < 30:
             return Response(
                 {'error': '历史数据不足，无法进行准确预测'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
         # 转换为DataFrame用于预测
-        df = pd.DataFrame(sales_data)
+        df['daily_sales'] = df.pop('daily_cents').to_numpy(dtype=np.int64) / 100
         
         # 特征工程
         df['order_date'] = pd.to_datetime(df['order_date'])
@@ -324,29 +637,39 @@ class SalesForecastView(APIView):
                 'forecasted_sales': round(float(prediction), 2)
             })
         
-        serializer = SalesForecastSerializer(result, many=True)
-        return Response(serializer.data)
+        return chart_response(request, result, SalesForecastSerializer)
 
 class PriceForecastView(APIView):
     """价格预测"""
     permission_classes = [IsAuthenticated]
+    # 准入控制的成本：商品与订单条目的全表聚合
+    cost = 10
     
+    @conditional(Clothing, ClothingType, OrderItem)
     def get(self, request):
-        # 获取历史价格数据
-        price_data = Clothing.objects.values('clothing_type__name').annotate(
-            avg_price=Avg('price')
-        ).order_by('clothing_type__name')
+        # 获取历史价格数据（按服装类型ID分组，名称从维度缓存解析，按名称排列）
+        type_names = dimension_names(ClothingType)
+        price_data = sorted(
+            Clothing.objects.values('clothing_type_id').annotate(avg_price=Avg('price')).order_by(),
+            key=lambda item: type_names.get(item['clothing_type_id']) or ''
+        )
         
-        # 结合销量数据
-        sales_data = OrderItem.objects.values('clothing__clothing_type__name').annotate(
-            total_quantity=Sum('quantity'),
-            avg_sold_price=Avg('price')
-        ).order_by('clothing__clothing_type__name')
+        # 结合销量数据（按条目上冗余的服装类型聚合，只扫描覆盖索引）；各分片返回售价之和与条目数，
+        # 合并后再计算平均售价
+        sales_data = merge_partials(scatter(lambda alias: list(
+            OrderItem.objects.using(alias).values('clothing_type_id').annotate(
+                total_quantity=Sum('quantity'),
+                price_sum=Sum('price'),
+                item_count=Count('id')
+            ).order_by()
+        )), 'clothing_type_id', ('total_quantity', 'price_sum', 'item_count'))
+        for item in sales_data:
+            item['avg_sold_price'] = item['price_sum'] / item['item_count']
         
         # 合并数据
         combined_data = {}
         for item in price_data:
-            type_name = item['clothing_type__name']
+            type_name = type_names.get(item['clothing_type_id'])
             combined_data[type_name] = {
                 'avg_price': item['avg_price'],
                 'total_quantity': 0,
@@ -354,7 +677,7 @@ class PriceForecastView(APIView):
             }
             
         for item in sales_data:
-            type_name = item['clothing__clothing_type__name']
+            type_name = type_names.get(item['clothing_type_id'])
             if type_name in combined_data:
                 combined_data[type_name]['total_quantity'] = item['total_quantity']
                 combined_data[type_name]['avg_sold_price'] = item['avg_sold_price']
@@ -377,5 +700,23 @@ class PriceForecastView(APIView):
                 'forecasted_price': round(float(forecasted_price), 2)
             })
         
-        serializer = PriceForecastSerializer(result, many=True)
-        return Response(serializer.data)
+        return chart_response(request, result, PriceForecastSerializer)
+
+
+class StockoutForecastView(APIView):
+    """商品缺货预测"""
+    permission_classes = [IsAuthenticated]
+    # 准入控制的成本：按商品逐个估算缺货天数
+    cost = 5
+    
+    @conditional(Clothing, OrderItem, SalesVelocity, extra=_today)
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 50))
+        except ValueError:
+            return Response({'error': 'limit参数必须为整数'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # 按预计缺货天数排序，最紧急的商品排在最前
+        result = stockout_forecast()[:max(limit, 0)]
+        
+        return chart_response(request, result, StockoutForecastSerializer)
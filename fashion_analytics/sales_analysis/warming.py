@@ -0,0 +1,85 @@
+"""
+看板接口预热。
+
+部署或夜间导入后，第一批用户打开看板时要等待冷的聚合查询和预测模型拟合。
+这里枚举看板的常用请求（各图表的全部数据与标准时间窗口、各地区与服装类型的销售异常、
+各预测接口），在进程池中并行执行，把结果写入分析接口的响应缓存（见 caching.conditional）。
+接口按需生成的客户分析快照先在主进程中刷新，避免多个工作进程同时刷新同一快照。
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+
+import django
+from django.contrib.auth.models import User
+from django.db import connections
+from django.urls import reverse, resolve
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .models import Region, ClothingType
+from .customers import refresh_customer_analytics
+
+# 标准时间窗口：最近 N 天
+STANDARD_WINDOWS = (7, 30, 90)
+
+# 支持 start_date / end_date 时间窗口的图表接口
+WINDOWED_VIEWS = ('region-sales', 'clothing-type-sales', 'price-range-sales', 'rating-distribution')
+# 只有默认参数的分析与预测接口
+PLAIN_VIEWS = (
+    'rfm', 'cohorts', 'rating-keywords', 'anomalies',
+    'sales-forecast', 'price-forecast', 'stockout-forecast',
+)
+
+
+def dashboard_requests(windows=STANDARD_WINDOWS, today=None):
+    """枚举看板常用请求，返回 (路径, 查询参数) 列表"""
+    today = today or timezone.localdate()
+    window_params = [{}] + [
+        {'start_date': (today - timedelta(days=days - 1)).isoformat()} for days in windows
+    ]
+    requests = []
+    for name in WINDOWED_VIEWS:
+        requests.extend((reverse(name), params) for params in window_params)
+    for name in PLAIN_VIEWS:
+        requests.append((reverse(name), {}))
+    
+    # 销售异常按地区、服装类型筛选
+    anomalies = reverse('anomalies')
+    for region_id in Region.objects.order_by('id').values_list('id', flat=True):
+        requests.append((anomalies, {'region': str(region_id)}))
+    for type_id in ClothingType.objects.order_by('id').values_list('id', flat=True):
+        requests.append((anomalies, {'clothing_type': str(type_id)}))
+    return requests
+
+
+def warm_models():
+    """刷新 RFM / 同期群接口依赖的客户分析快照，返回耗时秒数"""
+    started = time.perf_counter()
+    refresh_customer_analytics()
+    return time.perf_counter() - started
+
+
+def warm_request(path, params):
+    """在工作进程中执行一个看板请求，返回 (状态码, 耗时秒数)"""
+    request = APIRequestFactory().get(path, params)
+    # 分析接口的结果与用户无关，使用未保存的用户通过权限检查
+    force_authenticate(request, user=User(username='warm_analytics'))
+    # 预热请求的并发由进程池控制，不占用用户与全局的计算预算
+    request.analytics_warmup = True
+    match = resolve(path)
+    started = time.perf_counter()
+    response = match.func(request, *match.args, **match.kwargs)
+    return response.status_code, time.perf_counter() - started
+
+
+def warm_dashboards(requests, workers=None):
+    """并行执行请求，按完成顺序逐个产出 (路径, 查询参数, 状态码, 耗时秒数)"""
+    # 工作进程需要各自的数据库连接，不能继承父进程已打开的连接
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+        futures = {pool.submit(warm_request, path, params): (path, params) for path, params in requests}
+        for future in as_completed(futures):
+            path, params = futures[future]
+            status_code, seconds = future.result()
+            yield path, params, status_code, seconds